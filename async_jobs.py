@@ -0,0 +1,123 @@
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """Levantada dentro de um job quando o usuário pede o cancelamento."""
+
+
+class Job:
+    """Tarefa em segundo plano. A função do job recebe este objeto como primeiro
+    argumento para informar o progresso e verificar se foi cancelada.
+    """
+
+    def __init__(self, runner, description):
+        self.description = description
+        self.future = None
+        self._runner = runner
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Pede o cancelamento: o job para no próximo check() ou nem chega a começar."""
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check(self):
+        """Chamado pela função do job entre etapas; interrompe o job se foi cancelado."""
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def progress(self, fraction, message=None):
+        """Informa o progresso (0 a 1); entregue à interface pela thread do Tk."""
+        self._runner._post(self._runner._report_progress, self, fraction, message)
+
+
+class JobRunner:
+    """Executa operações pesadas num pool de threads sem bloquear o mainloop do Tk.
+
+    OpenCV e Pillow liberam o GIL nas operações de pixel, então threads bastam para
+    rodar jobs em paralelo. Os resultados, erros e o progresso voltam para a thread
+    do Tk por uma fila consultada com `root.after`; os callbacks sempre rodam nela.
+    """
+
+    def __init__(self, root, max_workers=4, poll_ms=30, on_progress=None, on_idle=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_progress = on_progress  # on_progress(job, fração, mensagem)
+        self.on_idle = on_idle  # Chamado quando não há mais jobs em andamento
+        self.active = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._events = queue.Queue()
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, description, fn, *args, on_done=None, on_error=None, on_cancel=None):
+        """Agenda `fn(job, *args)` e retorna o Job. `on_done(resultado)`, `on_error(exceção)`
+        e `on_cancel()` são chamados na thread do Tk.
+        """
+        job = Job(self, description)
+        self.active.append(job)
+
+        def run():
+            job.check()
+            return fn(job, *args)
+
+        def finished(future):
+            if future.cancelled():
+                self._post(self._finish, job, on_cancel)
+                return
+            error = future.exception()
+            if isinstance(error, JobCancelled):
+                self._post(self._finish, job, on_cancel)
+            elif error is not None:
+                self._post(self._finish, job, on_error, error)
+            else:
+                self._post(self._finish, job, on_done, future.result())
+
+        job.future = self._executor.submit(run)
+        job.future.add_done_callback(finished)
+        return job
+
+    def cancel_all(self):
+        for job in list(self.active):
+            job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _post(self, callback, *args):
+        """Enfileira um callback para a thread do Tk (seguro em qualquer thread)."""
+        self._events.put((callback, args))
+
+    def _finish(self, job, callback, *args):
+        if job in self.active:
+            self.active.remove(job)
+        if callback is not None:
+            callback(*args)
+        if not self.active and self.on_idle:
+            self.on_idle()
+
+    def _report_progress(self, job, fraction, message):
+        if self.on_progress and job in self.active:
+            self.on_progress(job, fraction, message)
+
+    def _poll(self):
+        """Executa na thread do Tk os callbacks enfileirados pelas threads do pool."""
+        while True:
+            try:
+                callback, args = self._events.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception:
+                # Mesmo tratamento dos erros em callbacks comuns do Tk
+                self.root.report_callback_exception(*sys.exc_info())
+        self.root.after(self.poll_ms, self._poll)
@@ -0,0 +1,152 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import as_completed
+
+from compositor import StreamingCompositor
+from corner_detection import DEFAULT_PROFILE
+from metrics import METRICS
+
+# Páginas detectadas com confiança abaixo deste valor são marcadas para revisão humana
+REVIEW_CONFIDENCE = 0.5
+
+
+class BatchJob:
+    """Um documento a ser gerado: a lista ordenada de páginas, o arquivo de saída
+    e o layout das páginas (ver compositor.LAYOUTS).
+    """
+
+    def __init__(self, pages, output, layout="horizontal", columns=None):
+        self.pages = list(pages)
+        self.output = output
+        self.layout = layout
+        self.columns = columns
+
+    def __repr__(self):
+        return f"BatchJob(pages={self.pages!r}, output={self.output!r}, layout={self.layout!r})"
+
+
+def load_manifest(path, output_dir, layout="horizontal", columns=None, extension=".jpg"):
+    """Lê um manifesto de documentos e retorna a lista de BatchJob.
+
+    Formatos aceitos:
+    - JSON: lista de objetos {"pages": [...], "output": "nome.jpg", "layout": ..., "columns": ...}
+      ou lista de listas de caminhos;
+    - texto/CSV: uma linha por documento, com os caminhos das páginas separados por vírgula.
+    Caminhos relativos são resolvidos a partir da pasta do manifesto. `layout` e `columns`
+    valem para os documentos que não os definem; `extension` é a das saídas sem nome.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            entries = [
+                [cell.strip() for cell in row if cell.strip()]
+                for row in csv.reader(f)
+                if row and not row[0].lstrip().startswith("#")
+            ]
+
+    jobs = []
+    for entry in entries:
+        options = {"layout": layout, "columns": columns}
+        if isinstance(entry, dict):
+            pages, output = entry["pages"], entry.get("output")
+            options.update((k, entry[k]) for k in options if k in entry)
+        else:
+            pages, output = entry, None
+        if not pages:
+            continue
+        pages = [os.path.join(base_dir, p) for p in pages]
+        jobs.append(BatchJob(pages, default_output_path(pages[0], output_dir, output, extension), **options))
+    return jobs
+
+
+def default_output_path(first_page, output_dir, name=None, extension=".jpg"):
+    """Monta o caminho de saída como a GUI faz: <saída>/<pasta da primeira página>/<nome>."""
+    source_dir_name = os.path.basename(os.path.dirname(os.path.abspath(first_page)))
+    if name is None:
+        name = os.path.splitext(os.path.basename(first_page))[0] + "_juntas" + extension
+    return os.path.join(output_dir, source_dir_name, name)
+
+
+def process_document(job, cache=None, encoder=None, profile=None, resampler="batch"):
+    """Detecta os cantos, corrige a perspectiva e junta as páginas de um documento.
+    Executado nos processos do pool; não depende de tkinter. As páginas são corrigidas
+    uma de cada vez pelo StreamingCompositor; `cache` é um ProcessingCache opcional,
+    `encoder`, as EncoderSettings da saída, `profile`, o DetectorProfile da detecção e
+    `resampler`, o Resampler ou nível de qualidade da correção (ver resampling.py).
+    """
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(job.output)), exist_ok=True)
+    compositor = StreamingCompositor(job.layout, job.columns, cache=cache, encoder=encoder,
+                                     profile=profile or DEFAULT_PROFILE, resampler=resampler)
+    _, confidences = compositor.compose(job.pages, job.output)
+    METRICS.count("documents")
+    METRICS.count("pages", len(job.pages))
+    return {
+        "output": job.output,
+        "pages": len(job.pages),
+        "seconds": time.perf_counter() - start,
+        "confidences": confidences,
+        "review": [page for page, c in zip(job.pages, confidences) if c is not None and c < REVIEW_CONFIDENCE],
+    }
+
+
+def _process_in_worker(job, cache, encoder, profile, resampler):
+    """process_document num processo do pool: devolve também as métricas coletadas
+    no processo, que são somadas às do processo principal.
+    """
+    result = process_document(job, cache, encoder, profile, resampler)
+    return result, METRICS.drain() if METRICS.enabled else None
+
+
+def _merge_worker_metrics(future_result):
+    result, metrics = future_result()
+    if metrics is not None:
+        METRICS.merge(metrics)
+    return result
+
+
+class BatchMerger:
+    """Executa vários documentos em paralelo num ProcessPoolExecutor, sem interface gráfica."""
+
+    def __init__(self, workers=None, cache=None, encoder=None, profile=None, resampler="batch"):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
+        self.encoder = encoder
+        self.profile = profile
+        self.resampler = resampler
+
+    def run(self, jobs, on_result=None):
+        """Processa todos os jobs e retorna (resultados, erros).
+        `on_result` é chamado a cada documento concluído, na ordem de término.
+        """
+        results, errors = [], []
+
+        def handle(job, future_result):
+            try:
+                result = future_result()
+            except Exception as e:
+                errors.append({"output": job.output, "error": str(e)})
+                return
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+        if self.workers == 1 or len(jobs) <= 1:
+            # Evita o custo de criar processos para lotes triviais
+            for job in jobs:
+                handle(job, lambda job=job: process_document(job, self.cache, self.encoder, self.profile, self.resampler))
+            return results, errors
+
+        # Importado aqui: o módulo dos processos só é carregado quando o lote é paralelo
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(_process_in_worker, job, self.cache, self.encoder, self.profile, self.resampler): job for job in jobs}
+            for future in as_completed(futures):
+                handle(futures[future], lambda future=future: _merge_worker_metrics(future.result))
+        return results, errors
@@ -0,0 +1,130 @@
+"""Compara a detecção clássica (interface) e a multiescala (lote e serviço) de cantos.
+
+Para cada resolução, gera uma foto sintética em JPEG e mede, cada modo num
+processo próprio, o tempo por página e o pico de memória (RSS máximo). O modo
+"original" é a find_document_corners de antes da redução direta para luminância
+(cópias RGB, BGR e LAB em resolução total), mantida aqui como referência do antes
+e depois de "classic".
+
+    python benchmarks/bench_detection.py --megapixels 12 48 --repeat 5
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("original", "classic", "multiscale")
+
+
+def make_photo(path, megapixels):
+    """Grava uma foto sintética 4:3 de um documento (ver synthetic.py)."""
+    import synthetic
+
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image, _ = synthetic.make_document(width, height)
+    image.save(path, quality=90)
+
+
+def original_find_document_corners(image):
+    """find_document_corners antes da redução direta para luminância: converte a foto
+    inteira para RGB, NumPy e BGR e só então reduz para 800 px, passando por LAB.
+    """
+    import cv2
+    import numpy as np
+    from corner_detection import DEFAULT_PROFILE, CornerDetector
+
+    img_cv = cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+    ratio = image.width / 800.0
+    resized = cv2.resize(img_cv, (800, int(image.height / ratio)))
+    l, a, b = cv2.split(cv2.cvtColor(resized, cv2.COLOR_BGR2LAB))
+    cl = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(l)
+    contrast_enhanced = cv2.cvtColor(cv2.merge((cl, a, b)), cv2.COLOR_LAB2BGR)
+    gray = cv2.cvtColor(contrast_enhanced, cv2.COLOR_BGR2GRAY)
+    edged = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 75, 200)
+    return CornerDetector._corners_from_edges(edged, ratio, image.size, DEFAULT_PROFILE)
+
+
+def run_child(mode, path, repeat):
+    """Executa a detecção `repeat` vezes neste processo e imprime as medições em JSON."""
+    from PIL import Image
+    from corner_detection import CornerDetector
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if mode == "original":
+            with Image.open(path) as img:
+                original_find_document_corners(img)
+        elif mode == "classic":
+            CornerDetector.find_document_corners(path)
+        else:
+            CornerDetector.detect_with_confidence(path)
+        times.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        "median_ms": statistics.median(times) * 1000,
+        "first_ms": times[0] * 1000,
+        "peak_rss_mib": peak_rss_kib() / 1024,
+    }))
+
+
+def peak_rss_kib():
+    """Pico de RSS deste processo em KiB. No Linux usa VmHWM, que, ao contrário de
+    ru_maxrss, não herda o pico do processo pai de antes do exec.
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss é informado em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[12, 24, 48])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Grava os resultados em JSON neste arquivo.")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.repeat)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in args.megapixels:
+            path = os.path.join(tmp, f"foto_{mp:g}mp.jpg")
+            make_photo(path, mp)
+            for mode in MODES:
+                out = subprocess.run(
+                    [sys.executable, __file__, "--repeat", str(args.repeat), "--child", mode, path],
+                    check=True, capture_output=True, text=True)
+                entry = {"megapixels": mp, "mode": mode, **json.loads(out.stdout)}
+                results.append(entry)
+                print(f"{mp:>5g} MP  {mode:<10} {entry['median_ms']:8.1f} ms  "
+                      f"{entry['peak_rss_mib']:8.1f} MiB", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Tempo de inicialização (cold start) dos pontos de entrada, com saída em JSON.
+
+Cada medição roda num processo Python novo. Além do tempo, registra quais módulos
+pesados (OpenCV, NumPy, Pillow, tkinter...) cada ponto de entrada importou: a linha
+de comando e os módulos de processamento só devem carregá-los no primeiro uso.
+
+    python benchmarks/bench_import.py --repeat 10 --output atual.json
+    python benchmarks/bench_import.py --baseline atual.json   # falha se houver regressão
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos cujo import custa dezenas ou centenas de ms
+HEAVY_MODULES = ("cv2", "numpy", "PIL.Image", "tkinter", "concurrent.futures.process")
+
+# Pontos de entrada medidos: nome -> código executado com `python -c`
+ENTRY_POINTS = {
+    "cli --help": "import sys; sys.argv = ['cli.py', '--help']\nimport cli\ntry:\n    cli.main()\nexcept SystemExit:\n    pass",
+    "import cli": "import cli",
+    "import batch": "import batch",
+    "import watch_service": "import watch_service",
+    "import compositor": "import compositor",
+    "import corner_detection": "import corner_detection",
+    "import image_processing": "import image_processing",
+    "import page_matching": "import page_matching",
+}
+
+# Referências, para comparar com o custo das dependências
+REFERENCES = {
+    "python": "pass",
+    "numpy": "import numpy",
+    "cv2": "import cv2",
+}
+
+# Pontos de entrada que não podem importar nenhum dos HEAVY_MODULES
+LIGHT_ENTRY_POINTS = tuple(ENTRY_POINTS)
+
+_REPORT_MODULES = (
+    "\nimport sys as _sys, json as _json\n"
+    "_sys.__stdout__.write('\\n' + _json.dumps([m for m in %r if m in _sys.modules]) + '\\n')"
+)
+
+
+def measure(code, repeat):
+    """Mediana e mínimo do tempo de parede (ms) de `python -c code`, e os módulos
+    pesados importados.
+    """
+    times, modules = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code + _REPORT_MODULES % (HEAVY_MODULES,)],
+                                cwd=ROOT, capture_output=True, text=True, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+        modules = json.loads(result.stdout.strip().splitlines()[-1])
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "heavy_modules": modules}
+
+
+def compare(report, baseline, max_slowdown, min_ms):
+    """Lista as regressões: módulos pesados importados cedo demais e pontos de entrada
+    mais lentos que no relatório de referência (ignorando diferenças abaixo de `min_ms`).
+    """
+    problems = []
+    for name, data in report["entry_points"].items():
+        if name in LIGHT_ENTRY_POINTS and data["heavy_modules"]:
+            problems.append(f"{name}: importa {', '.join(data['heavy_modules'])}")
+        old = baseline["entry_points"].get(name)
+        if old and data["median_ms"] > max(old["median_ms"] * (1 + max_slowdown), old["median_ms"] + min_ms):
+            problems.append(f"{name}: {old['median_ms']:.1f} -> {data['median_ms']:.1f} ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7, help="Processos por medição (padrão: 7).")
+    parser.add_argument("--output", help="Grava o relatório JSON neste arquivo (padrão: saída padrão).")
+    parser.add_argument("--baseline", help="Relatório de referência; sai com erro se houver regressão.")
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="Piora tolerada na mediana (padrão: 25%%).")
+    parser.add_argument("--min-ms", type=float, default=10.0,
+                        help="Diferença mínima, em ms, para contar como regressão (padrão: 10).")
+    args = parser.parse_args()
+
+    report = {
+        "environment": {"python": platform.python_version(), "cpus": os.cpu_count(), "machine": platform.machine()},
+        "references": {},
+        "entry_points": {},
+    }
+    for group, cases in (("references", REFERENCES), ("entry_points", ENTRY_POINTS)):
+        for name, code in cases.items():
+            data = report[group][name] = measure(code, args.repeat)
+            heavy = ", ".join(data["heavy_modules"]) or "-"
+            print(f"{name:<26} {data['median_ms']:8.1f} ms  (mín. {data['min_ms']:.1f})  pesados: {heavy}",
+                  file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    problems = compare(report, {"entry_points": {}}, args.max_slowdown, args.min_ms)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.max_slowdown, args.min_ms)
+    for problem in problems:
+        print(f"REGRESSÃO: {problem}", file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
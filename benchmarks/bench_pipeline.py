@@ -0,0 +1,244 @@
+"""Benchmark e regressão do pipeline: latência por etapa, vazão, pico de memória e
+precisão da detecção de cantos em várias resoluções, com saída em JSON.
+
+    python benchmarks/bench_pipeline.py --megapixels 2 12 --samples 3 --output atual.json
+    python benchmarks/bench_pipeline.py --baseline atual.json   # falha se houver regressão
+
+A memória de cada etapa é o quanto o RSS do processo (memória residente, que inclui
+os buffers nativos do Pillow e do OpenCV) subiu acima do valor do início da etapa,
+amostrado a cada milissegundo numa passada separada para não distorcer os tempos.
+Memória liberada por etapas anteriores e reaproveitada não aparece como aumento.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import synthetic
+from compositor import StreamingCompositor, compose_pages
+from corner_detection import CornerDetector
+from image_processing import ImageProcessor
+from metrics import current_rss
+
+DETECTORS = {
+    "classic": lambda path, img: CornerDetector.find_document_corners(img),
+    "multiscale": lambda path, img: CornerDetector.detect_with_confidence(path)[0],
+}
+
+
+def build_stages(path, truth):
+    """Etapas medidas, em ordem; cada uma recebe o estado da anterior."""
+    def decode(state):
+        with Image.open(path) as img:
+            state["image"] = img.convert("RGB")
+
+    def make_detect(name):
+        def detect(state):
+            state[f"corners_{name}"] = DETECTORS[name](path, state["image"])
+        return detect
+
+    def warp(state):
+        state["page"] = ImageProcessor.four_point_transform(state["image"], truth)
+
+    def enhance(state):
+        state["enhanced"] = ImageProcessor.enhance_image_readability(state["page"])
+
+    def resize(state):
+        page = state["page"]
+        state["resized"] = page.resize((page.width // 2, page.height // 2), Image.Resampling.LANCZOS)
+
+    def merge(state):
+        # Junção em memória do modo auto (compose_pages), como na produção
+        pages = [np.asarray(state["page"]), np.asarray(state["resized"])]
+        state["merged"] = compose_pages(pages, "horizontal").to_image()
+
+    def encode(state):
+        buf = io.BytesIO()
+        state["merged"].save(buf, format="JPEG")
+        state["encoded_bytes"] = buf.tell()
+
+    def stream(state):
+        # Junção do lote (StreamingCompositor): duas páginas corrigidas a partir do
+        # arquivo, com os cantos conhecidos, e gravadas em faixas num PNG
+        output = os.path.join(os.path.dirname(path), "stream.png")
+        StreamingCompositor("horizontal").compose([path, path], output, corners=[truth, truth])
+        os.unlink(output)
+
+    stages = [("decode", decode)]
+    stages += [(f"detect_{name}", make_detect(name)) for name in DETECTORS]
+    stages += [("warp", warp), ("enhance", enhance), ("resize", resize), ("merge", merge), ("encode", encode),
+               ("merge_streaming", stream)]
+    return stages
+
+
+class RssPeak:
+    """Pico do RSS durante o bloco `with`, amostrado numa thread a cada `interval` s.
+    As operações de pixel do Pillow e do OpenCV liberam o GIL, então a amostragem
+    continua durante elas.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.base = self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.base = self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    @property
+    def growth(self):
+        return self.peak - self.base
+
+
+def run_sample(path, truth):
+    """Executa todas as etapas duas vezes: uma medindo tempo, outra medindo memória."""
+    timings, peaks = {}, {}
+    state = {}
+    for name, stage in build_stages(path, truth):
+        start = time.perf_counter()
+        stage(state)
+        timings[name] = time.perf_counter() - start
+
+    state = {}
+    for name, stage in build_stages(path, truth):
+        with RssPeak() as rss:
+            stage(state)
+        peaks[name] = rss.growth
+
+    accuracy = {}
+    for name in DETECTORS:
+        corners = state[f"corners_{name}"]
+        mean_err, max_err = synthetic.corner_error(corners, truth)
+        accuracy[name] = {"iou": synthetic.quad_iou(corners, truth), "corner_error_mean_px": mean_err,
+                          "corner_error_max_px": max_err}
+    return timings, peaks, accuracy
+
+
+def benchmark_resolution(megapixels, samples, tmp):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    timings, peaks, accuracy = {}, {}, {name: [] for name in DETECTORS}
+    for seed in range(samples):
+        image, truth = synthetic.make_document(width, height, seed=seed)
+        path = os.path.join(tmp, f"doc_{megapixels:g}_{seed}.jpg")
+        image.save(path, quality=90)
+        del image
+        t, p, a = run_sample(path, truth)
+        for name in t:
+            timings.setdefault(name, []).append(t[name])
+            peaks.setdefault(name, []).append(p[name])
+        for name in a:
+            accuracy[name].append(a[name])
+
+    stages = {}
+    for name, values in timings.items():
+        median = statistics.median(values)
+        stages[name] = {
+            "median_ms": median * 1000,
+            "min_ms": min(values) * 1000,
+            "pages_per_s": 1.0 / median if median > 0 else None,
+            "peak_rss_growth_mib": max(peaks[name]) / (1024 * 1024),
+        }
+    detection = {}
+    for name, entries in accuracy.items():
+        detection[name] = {
+            "mean_iou": statistics.mean(e["iou"] for e in entries),
+            "min_iou": min(e["iou"] for e in entries),
+            "corner_error_mean_px": statistics.mean(e["corner_error_mean_px"] for e in entries),
+            "corner_error_max_px": max(e["corner_error_max_px"] for e in entries),
+        }
+    return {"megapixels": megapixels, "size": [width, height], "samples": samples,
+            "stages": stages, "detection": detection}
+
+
+def compare(report, baseline, max_slowdown, max_iou_drop):
+    """Lista as regressões do relatório atual em relação ao de referência."""
+    problems = []
+    previous = {r["megapixels"]: r for r in baseline["results"]}
+    for result in report["results"]:
+        base = previous.get(result["megapixels"])
+        if base is None:
+            continue
+        for stage, data in result["stages"].items():
+            old = base["stages"].get(stage)
+            if old and data["median_ms"] > old["median_ms"] * (1 + max_slowdown):
+                problems.append(f"{result['megapixels']:g} MP {stage}: {old['median_ms']:.1f} -> {data['median_ms']:.1f} ms")
+        for name, data in result["detection"].items():
+            old = base["detection"].get(name)
+            if old and data["mean_iou"] < old["mean_iou"] - max_iou_drop:
+                problems.append(f"{result['megapixels']:g} MP detect_{name}: IoU {old['mean_iou']:.3f} -> {data['mean_iou']:.3f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=" ".join(__doc__.split("\n\n")[0].split()))
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[2, 12, 24])
+    parser.add_argument("--samples", type=int, default=3, help="Documentos sintéticos por resolução.")
+    parser.add_argument("--output", help="Grava o relatório JSON neste arquivo (padrão: saída padrão).")
+    parser.add_argument("--baseline", help="Relatório de referência; sai com erro se houver regressão.")
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="Piora tolerada na mediana (padrão: 25%%).")
+    parser.add_argument("--max-iou-drop", type=float, default=0.02, help="Queda tolerada no IoU médio.")
+    args = parser.parse_args()
+
+    report = {
+        "environment": {
+            "python": platform.python_version(), "opencv": cv2.__version__, "numpy": np.__version__,
+            "pillow": Image.__version__, "cpus": os.cpu_count(), "machine": platform.machine(),
+        },
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in args.megapixels:
+            result = benchmark_resolution(mp, args.samples, tmp)
+            report["results"].append(result)
+            for stage, data in result["stages"].items():
+                print(f"{mp:>5g} MP  {stage:<16} {data['median_ms']:9.1f} ms  {data['peak_rss_growth_mib']:8.1f} MiB", file=sys.stderr)
+            for name, data in result["detection"].items():
+                print(f"{mp:>5g} MP  IoU {name:<12} {data['mean_iou']:.3f} (erro médio {data['corner_error_mean_px']:.1f} px)",
+                      file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.max_slowdown, args.max_iou_drop)
+        for problem in problems:
+            print(f"REGRESSÃO: {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Velocidade e qualidade de cada nível e backend de reamostragem (resampling.py).
+
+Para um documento sintético, mede o tempo de redução para a tela (prévia), de redução
+à metade, de ampliação 2x e da correção de perspectiva, com imagens PIL e arrays, e a
+qualidade de cada resultado em PSNR (dB) em relação ao nível archive do mesmo backend
+de referência (Pillow LANCZOS no redimensionamento, OpenCV Lanczos na perspectiva).
+
+    python benchmarks/bench_resample.py --megapixels 12 --repeat 5 --output resample.json
+    python benchmarks/bench_resample.py --baseline resample.json   # falha se houver regressão
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import synthetic
+from image_processing import ImageProcessor
+from resampling import BACKENDS, QUALITIES, Resampler
+
+MAX_PSNR = 100.0  # dB
+
+
+def psnr(a, b):
+    """PSNR em dB, limitado a MAX_PSNR: imagens idênticas dariam infinito, que o JSON
+    padrão não representa."""
+    mse = np.mean((np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)) ** 2)
+    return MAX_PSNR if mse == 0 else min(MAX_PSNR, float(10 * np.log10(255.0 ** 2 / mse)))
+
+
+def timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+
+def build_operations(image, quad):
+    """Operações medidas: nome -> (função(resampler, entrada), referência)."""
+    w, h = image.size
+    small = image.resize((w // 4, h // 4), Image.Resampling.LANCZOS)
+    M, out_size = ImageProcessor.perspective_matrix(quad)
+    archive = Resampler("archive", "pillow")
+    return {
+        "resize_preview": (lambda r, src: r.resize(src, (1000, 1000 * h // w)),
+                           archive.resize(image, (1000, 1000 * h // w))),
+        "resize_half": (lambda r, src: r.resize(src, (w // 2, h // 2)), archive.resize(image, (w // 2, h // 2))),
+        "upscale_2x": (lambda r, src: r.resize(small if isinstance(src, Image.Image) else np.asarray(small),
+                                               (small.width * 2, small.height * 2)),
+                       archive.resize(small, (small.width * 2, small.height * 2))),
+        "warp": (lambda r, src: r.warp(src, M, out_size), Resampler("archive", "cv2").warp(np.asarray(image), M, out_size)),
+    }
+
+
+def compare(report, baseline, max_slowdown, max_psnr_drop):
+    """Lista as regressões de tempo e de qualidade em relação ao relatório de referência."""
+    problems = []
+    for key, data in report["results"].items():
+        old = baseline["results"].get(key)
+        if not old:
+            continue
+        if data["median_ms"] > old["median_ms"] * (1 + max_slowdown):
+            problems.append(f"{key}: {old['median_ms']:.1f} -> {data['median_ms']:.1f} ms")
+        if data["psnr_db"] < old["psnr_db"] - max_psnr_drop:
+            problems.append(f"{key}: PSNR {old['psnr_db']:.2f} -> {data['psnr_db']:.2f} dB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--repeat", type=int, default=5, help="Execuções por medição (padrão: 5).")
+    parser.add_argument("--output", help="Grava o relatório JSON neste arquivo (padrão: saída padrão).")
+    parser.add_argument("--baseline", help="Relatório de referência; sai com erro se houver regressão.")
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="Piora tolerada na mediana (padrão: 25%%).")
+    parser.add_argument("--max-psnr-drop", type=float, default=0.5, help="Queda tolerada no PSNR, em dB.")
+    args = parser.parse_args()
+
+    width = int((args.megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image, quad = synthetic.make_document(width, height)
+    array = np.asarray(image)
+    operations = build_operations(image, quad)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(), "opencv": cv2.__version__, "numpy": np.__version__,
+            "pillow": Image.__version__, "cpus": os.cpu_count(), "machine": platform.machine(),
+        },
+        "megapixels": args.megapixels,
+        "size": [width, height],
+        "results": {},
+    }
+    for op, (fn, reference) in operations.items():
+        for quality in QUALITIES:
+            for backend in BACKENDS:
+                resampler = Resampler(quality, backend)
+                for kind, src in (("pil", image), ("array", array)):
+                    if op == "warp" and kind == "pil" and backend == "cv2":
+                        continue  # Mesmo caminho da entrada em array
+                    fn(resampler, src)  # Aquecimento (imports, buffers)
+                    median_ms, result = timed(lambda: fn(resampler, src), args.repeat)
+                    key = f"{op}/{quality}/{backend}/{kind}"
+                    data = report["results"][key] = {"median_ms": median_ms, "psnr_db": psnr(result, reference)}
+                    print(f"{op:<15} {quality:<8} {backend:<7} {kind:<6} {median_ms:9.1f} ms  {data['psnr_db']:6.2f} dB",
+                          file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.max_slowdown, args.max_psnr_drop)
+        for problem in problems:
+            print(f"REGRESSÃO: {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
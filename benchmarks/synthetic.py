@@ -0,0 +1,107 @@
+"""Gerador de fotos sintéticas de documentos com cantos conhecidos.
+
+Cada amostra é um documento (linhas de "texto", título, foto) renderizado com
+perspectiva aleatória sobre um fundo com objetos, gradiente de iluminação e
+ruído. Os cantos verdadeiros (top-left, top-right, bottom-right, bottom-left)
+acompanham a imagem, para medir a precisão da detecção.
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+# Proporção de um documento de identidade (85,6 x 54 mm), usada como padrão
+ID_CARD_ASPECT = 85.6 / 54.0
+
+
+def render_page(width, height, rng):
+    """Desenha o conteúdo de uma página clara: título, linhas de texto e uma 'foto'."""
+    page = np.empty((height, width, 3), np.uint8)
+    page[:] = rng.integers(215, 250, 3)
+    unit = max(1, min(width, height) // 40)
+
+    cv2.rectangle(page, (2 * unit, 2 * unit), (width - 2 * unit, 6 * unit), (60, 60, 140), -1)
+    photo_w = width // 4
+    cv2.rectangle(page, (2 * unit, 8 * unit), (2 * unit + photo_w, 8 * unit + photo_w * 4 // 3), (120, 100, 90), -1)
+    y = 8 * unit
+    while y < height - 3 * unit:
+        x0 = 4 * unit + photo_w
+        length = int(rng.uniform(0.3, 1.0) * (width - x0 - 2 * unit))
+        cv2.line(page, (x0, y), (x0 + length, y), (30, 30, 30), max(1, unit // 2))
+        y += 2 * unit
+    return page
+
+
+def random_quad(width, height, aspect, rng, coverage=(0.35, 0.7)):
+    """Sorteia um quadrilátero em perspectiva dentro da foto, na ordem TL, TR, BR, BL."""
+    area = rng.uniform(*coverage) * width * height
+    qw = min(np.sqrt(area * aspect), 0.9 * width)
+    qh = min(qw / aspect, 0.9 * height)
+    cx = rng.uniform(qw / 2 + 0.05 * width, width - qw / 2 - 0.05 * width)
+    cy = rng.uniform(qh / 2 + 0.05 * height, height - qh / 2 - 0.05 * height)
+    base = np.array([[-qw / 2, -qh / 2], [qw / 2, -qh / 2], [qw / 2, qh / 2], [-qw / 2, qh / 2]])
+
+    # Pequena rotação mais deslocamento independente de cada canto (perspectiva)
+    angle = np.radians(rng.uniform(-12, 12))
+    rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    jitter = rng.uniform(-0.06, 0.06, (4, 2)) * [qw, qh]
+    offsets = base @ rot.T + jitter
+
+    # Encolhe o documento em torno do centro se algum canto sair da foto (margem de 2%)
+    margin_x, margin_y = 0.02 * width, 0.02 * height
+    limits = np.where(offsets < 0, [[cx - margin_x, cy - margin_y]], [[width - margin_x - cx, height - margin_y - cy]])
+    scale = min(1.0, float(np.min(limits / np.maximum(np.abs(offsets), 1e-6))))
+    return (offsets * scale + [cx, cy]).astype("float32")
+
+
+def make_document(width, height, seed=0, aspect=ID_CARD_ASPECT, noise=6.0, clutter=8):
+    """Gera uma foto sintética (PIL, RGB) e os cantos verdadeiros do documento (4x2 float32)."""
+    rng = np.random.default_rng(seed)
+
+    # Fundo escuro com objetos espalhados
+    photo = np.empty((height, width, 3), np.uint8)
+    photo[:] = rng.integers(20, 90, 3)
+    for _ in range(clutter):
+        color = tuple(int(c) for c in rng.integers(0, 160, 3))
+        center = (int(rng.uniform(0, width)), int(rng.uniform(0, height)))
+        radius = int(rng.uniform(0.02, 0.08) * min(width, height))
+        if rng.random() < 0.5:
+            cv2.circle(photo, center, radius, color, -1)
+        else:
+            cv2.rectangle(photo, center, (center[0] + 2 * radius, center[1] + radius), color, -1)
+
+    quad = random_quad(width, height, aspect, rng)
+    page_w = int(np.linalg.norm(quad[1] - quad[0]))
+    page_h = int(np.linalg.norm(quad[3] - quad[0]))
+    page = render_page(page_w, page_h, rng)
+    src = np.array([[0, 0], [page_w - 1, 0], [page_w - 1, page_h - 1], [0, page_h - 1]], dtype="float32")
+    M = cv2.getPerspectiveTransform(src, quad)
+    cv2.warpPerspective(page, M, (width, height), dst=photo, borderMode=cv2.BORDER_TRANSPARENT)
+
+    # Iluminação irregular: gradiente linear multiplicativo em uma direção aleatória
+    direction = rng.uniform(-1, 1, 2).astype("float32")
+    gx = (np.arange(width, dtype="float32") / width - 0.5) * direction[0]
+    gy = (np.arange(height, dtype="float32") / height - 0.5) * direction[1]
+    gradient = 0.75 + 0.25 * (gx[None, :] + gy[:, None] + 0.5)
+    lit = photo.astype("float32")
+    lit *= gradient[..., None]
+    del gradient
+
+    if noise:
+        lit += rng.standard_normal(lit.shape, dtype="float32") * noise
+    photo = np.clip(lit, 0, 255, out=lit).astype(np.uint8)
+    return Image.fromarray(photo), quad
+
+
+def corner_error(detected, truth):
+    """Distância média e máxima (em pixels) entre cantos correspondentes."""
+    dist = np.linalg.norm(np.asarray(detected, dtype="float64") - np.asarray(truth, dtype="float64"), axis=1)
+    return float(dist.mean()), float(dist.max())
+
+
+def quad_iou(a, b):
+    """Interseção sobre união de dois quadriláteros convexos."""
+    a = np.asarray(a, dtype="float32")
+    b = np.asarray(b, dtype="float32")
+    inter, _ = cv2.intersectConvexConvex(a, b)
+    union = cv2.contourArea(a) + cv2.contourArea(b) - inter
+    return float(inter / union) if union > 0 else 0.0
@@ -0,0 +1,367 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+from batch import REVIEW_CONFIDENCE, BatchMerger, load_manifest
+from compositor import LAYOUTS, compose_pages
+from corner_detection import PROFILES
+from debug_sink import DEBUG_DIR_ENV
+from encoder import FORMATS, LOSSY_FORMATS, MULTIPAGE_FORMATS, EncoderSettings, parse_size, save_image, save_pages
+from metrics import METRICS, METRICS_ENV
+from page_matching import MAX_PAIR_COST, PageSignature, extract_pages, group_pages
+from processing_cache import ProcessingCache
+from resampling import BACKENDS, QUALITIES, Resampler
+from watch_service import DEFAULT_PATTERN, DEFAULT_QUEUE_SIZE, IMAGE_EXTENSIONS, STAGES, WatchService
+
+
+def _default_output_dir():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, "resultado")
+
+
+def run_batch(args):
+    """Processa um manifesto de documentos e informa o desempenho em páginas/s."""
+    if args.debug_dir:
+        # Propagado aos processos do pool pela variável de ambiente
+        os.environ[DEBUG_DIR_ENV] = os.path.abspath(args.debug_dir)
+
+    _enable_metrics(args)
+    encoder = _encoder_settings(args)
+    jobs = load_manifest(args.manifest, args.output_dir, args.layout, args.columns, FORMATS[args.format or "jpeg"])
+    if not jobs:
+        print("Manifesto vazio: nenhum documento para processar.")
+        return 0
+    for job in jobs:
+        # Os nomes do manifesto mantêm a extensão, que pode não aceitar --max-bytes
+        try:
+            encoder.check_output(job.output)
+        except ValueError as e:
+            print(f"Erro em {job.output}: {e}", file=sys.stderr)
+            return 2
+
+    cache = None
+    if args.cache_dir:
+        cache = ProcessingCache(args.cache_dir, max_bytes=args.cache_size_mb * 1024 * 1024)
+
+    workers = args.workers
+    if args.profile and workers != 1:
+        # O cProfile só enxerga o processo atual: o lote roda todo nele
+        print("--profile: processando sem o pool de processos para medir todo o trabalho.")
+        workers = 1
+    merger = BatchMerger(workers=workers, cache=cache, encoder=encoder, profile=PROFILES[args.detector_profile],
+                         resampler=Resampler(args.resample, args.resample_backend))
+    print(f"Processando {len(jobs)} documento(s) com {merger.workers} processo(s)...")
+
+    def report(result):
+        if not args.quiet:
+            print(f"  {result['output']} ({result['pages']} página(s), {result['seconds']:.2f}s)")
+        for page in result["review"]:
+            print(f"  Revisar: cantos de {page} detectados com baixa confiança")
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    results, errors = merger.run(jobs, on_result=report)
+    elapsed = time.perf_counter() - start
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f"Perfil gravado em {args.profile} (abra com snakeviz, gprof2dot ou flameprof)")
+    if args.metrics:
+        METRICS.write(args.metrics)
+        if not args.quiet:
+            _print_stage_times()
+
+    pages = sum(r["pages"] for r in results)
+    rate = pages / elapsed if elapsed > 0 else 0.0
+    print(f"{len(results)} documento(s), {pages} página(s) em {elapsed:.2f}s ({rate:.2f} páginas/s)")
+    review = sum(len(r["review"]) for r in results)
+    if review:
+        print(f"{review} página(s) para revisão manual")
+    for error in errors:
+        print(f"Erro em {error['output']}: {error['error']}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def _collect_photos(inputs):
+    """Arquivos de imagem de `inputs` (arquivos ou pastas), pastas em ordem de nome."""
+    photos = []
+    for path in inputs:
+        if os.path.isdir(path):
+            photos += sorted(os.path.join(path, f) for f in os.listdir(path)
+                             if f.lower().endswith(IMAGE_EXTENSIONS) and not f.startswith("."))
+        else:
+            photos.append(path)
+    return photos
+
+
+def run_auto(args):
+    """Encontra os documentos em fotos soltas ou com vários documentos, junta frente e
+    verso de cada um e grava um arquivo por documento.
+    """
+    _enable_metrics(args)
+    photos = _collect_photos(args.inputs)
+    if not photos:
+        print("Nenhuma imagem encontrada.")
+        return 0
+
+    profile = PROFILES[args.detector_profile]
+    resampler = Resampler(args.resample, args.resample_backend)
+    encoder = _encoder_settings(args)
+    start = time.perf_counter()
+    pages, signatures = [], []
+    for photo in photos:
+        try:
+            found = extract_pages(photo, profile=profile, resampler=resampler, width=args.width)
+        except Exception as e:
+            print(f"Erro em {photo}: {e}", file=sys.stderr)
+            continue
+        for n, (_, confidence, page) in enumerate(found):
+            name = os.path.basename(photo) + (f"#{n + 1}" if len(found) > 1 else "")
+            if confidence < REVIEW_CONFIDENCE:
+                print(f"  Revisar: cantos de {name} detectados com baixa confiança")
+            pages.append(page)
+            signatures.append(PageSignature(page, key=name, index=len(signatures)))
+
+    documents, duplicates = group_pages(signatures, max_cost=args.max_pair_cost)
+    for i, original in duplicates:
+        print(f"  Revisar: {signatures[i].key} parece uma foto repetida de {signatures[original].key}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    extension = FORMATS[args.format or "jpeg"]
+    for number, document in enumerate(documents, 1):
+        output = os.path.join(args.output_dir, f"documento_{number:03d}{extension}")
+        document_pages = [pages[i] for i in document]
+        if args.layout == "pages":
+            save_pages([page.to_image() for page in document_pages], output, encoder)
+        else:
+            merged = compose_pages(document_pages, args.layout, args.columns, resampler=resampler)
+            save_image(merged.to_image(), output, encoder)
+        if not args.quiet:
+            print(f"  {output}: {' + '.join(signatures[i].key for i in document)}")
+
+    elapsed = time.perf_counter() - start
+    if args.metrics:
+        METRICS.write(args.metrics)
+    print(f"{len(photos)} foto(s), {len(pages)} página(s), {len(documents)} documento(s) em {elapsed:.2f}s")
+    return 0
+
+
+def _enable_metrics(args):
+    """Liga a coleta de métricas, também nos processos filhos (pela variável de ambiente)."""
+    if args.metrics:
+        os.environ[METRICS_ENV] = "1"
+        METRICS.enable()
+
+
+def _print_stage_times():
+    snapshot = METRICS.snapshot()
+    for name, stat in sorted(snapshot["spans"].items(), key=lambda item: -item[1]["total_s"]):
+        print(f"  {name:<8} {stat['count']:6d}x  {stat['total_s']:8.2f}s  (máx. {stat['max_s'] * 1000:.0f} ms)")
+    print(f"  pico de memória: {snapshot['peak_rss_bytes'] / (1024 * 1024):.0f} MiB")
+
+
+def _encoder_settings(args):
+    return EncoderSettings(format=args.format, quality=args.quality, compress_level=args.compress_level,
+                           optimize=args.optimize, progressive=args.progressive, subsampling=args.subsampling,
+                           threads=args.encoder_threads, max_bytes=args.max_bytes)
+
+
+def _add_resample_arguments(parser):
+    group = parser.add_argument_group("reamostragem")
+    group.add_argument("--resample", choices=QUALITIES, default="batch",
+                       help="Qualidade da correção e do redimensionamento: preview (vizinho mais próximo), "
+                            "batch (área/bilinear, padrão) ou archive (Lanczos, mais lento).")
+    group.add_argument("--resample-backend", choices=BACKENDS, default=None,
+                       help="Biblioteca da reamostragem (padrão: OpenCV para as páginas em array).")
+
+
+def _add_encoder_arguments(parser):
+    group = parser.add_argument_group("codificação da saída")
+    group.add_argument("--format", choices=FORMATS, default=None,
+                       help="Formato das saídas com nome gerado (padrão: jpeg); nomes do manifesto mantêm a extensão.")
+    group.add_argument("--quality", type=int, default=90, help="Qualidade de JPEG, WebP e PDF, 1 a 100 (padrão: 90).")
+    group.add_argument("--compress-level", type=int, default=3, choices=range(10), metavar="0-9",
+                       help="Nível do zlib para PNG (padrão: 3, bem mais rápido que o 6 do Pillow).")
+    group.add_argument("--optimize", action="store_true", help="JPEG com tabelas de Huffman otimizadas.")
+    group.add_argument("--progressive", action="store_true", help="JPEG progressivo.")
+    group.add_argument("--subsampling", choices=("4:4:4", "4:2:2", "4:2:0"), default="4:2:0",
+                       help="Subamostragem de cor do JPEG (padrão: 4:2:0).")
+    group.add_argument("--encoder-threads", type=int, default=1, help="Threads de compressão do PNG (padrão: 1).")
+    group.add_argument("--max-bytes", type=_size_argument, default=None,
+                       help="Tamanho máximo de cada saída JPEG/WebP, ex.: 800k, 2M (ajusta a qualidade).")
+
+
+def _size_argument(text):
+    try:
+        return parse_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _parse_workers(text):
+    """Converte "decode=2,detect=4" em {"decode": 2, "detect": 4}."""
+    workers = {}
+    for item in text.split(","):
+        name, _, count = item.partition("=")
+        name = name.strip()
+        if name not in STAGES or not count.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"Use etapa=número, com etapas entre: {', '.join(STAGES)}.")
+        workers[name] = int(count)
+    return workers
+
+
+def _format_status(stats):
+    queues = " ".join(f"{name}={s['queue']}/{s['capacity']}" for name, s in stats["stages"].items())
+    return (f"[{stats['uptime_s']:.0f}s] {stats['documents_done']} documento(s), {stats['pages_done']} página(s) "
+            f"({stats['pages_per_s']:.2f} páginas/s), {stats['in_flight']} em andamento | filas: {queues}")
+
+
+def run_watch(args):
+    """Vigia uma pasta de entrada e junta os documentos que aparecem nela."""
+    if args.debug_dir:
+        os.environ[DEBUG_DIR_ENV] = os.path.abspath(args.debug_dir)
+
+    cache = None
+    if args.cache_dir:
+        cache = ProcessingCache(args.cache_dir, max_bytes=args.cache_size_mb * 1024 * 1024)
+
+    def report(result):
+        if result["status"] == "error":
+            print(f"Erro em {result['document']}: {result['error']}", file=sys.stderr)
+            return
+        if not args.quiet:
+            print(f"  {result['output']} ({result['pages']} página(s), {result['seconds']:.2f}s)")
+        for page, confidence in zip(result["document_pages"], result["confidences"]):
+            if confidence is not None and confidence < REVIEW_CONFIDENCE:
+                print(f"  Revisar: cantos de {page} detectados com baixa confiança")
+
+    _enable_metrics(args)
+
+    def status(stats):
+        print(_format_status(stats))
+        if args.metrics:
+            METRICS.write(args.metrics)
+        if args.status_file:
+            tmp = args.status_file + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=2)
+            os.replace(tmp, args.status_file)
+
+    service = WatchService(
+        args.inbox, args.output_dir, group=args.group, pattern=args.pattern, layout=args.layout,
+        columns=args.columns, enhance=args.enhance, workers=args.workers, queue_size=args.queue_size,
+        poll_interval=args.poll_interval, settle=args.settle, cache=cache, encoder=_encoder_settings(args),
+        profile=PROFILES[args.detector_profile], resampler=Resampler(args.resample, args.resample_backend),
+        on_document=report)
+    def stop(signum, frame):
+        print("Parando: terminando os documentos em andamento...")
+        service.stop()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    if not args.once:
+        print(f"Vigiando {service.inbox} (Ctrl+C para parar)...")
+    service.run(once=args.once, on_status=status, status_interval=args.status_interval)
+    status(service.stats())
+    return 1 if service.documents_failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Junta imagens de documentos sem interface gráfica.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="Processa um manifesto de documentos em lote.")
+    batch.add_argument("manifest", help="Arquivo .json ou .csv/.txt com as páginas de cada documento.")
+    batch.add_argument("-o", "--output-dir", default=_default_output_dir(), help="Pasta de saída (padrão: resultado/).")
+    batch.add_argument("-j", "--workers", type=int, default=None, help="Número de processos (padrão: núcleos da CPU).")
+    batch.add_argument("--layout", choices=LAYOUTS, default="horizontal", help="Disposição das páginas (padrão: horizontal; pages: uma página por folha, em PDF ou, com --format tiff, TIFF).")
+    batch.add_argument("--columns", type=int, default=None, help="Colunas do layout grid (padrão: raiz quadrada do número de páginas).")
+    batch.add_argument("--cache-dir", default=None, help="Reaproveita cantos e páginas corrigidas guardados nesta pasta.")
+    batch.add_argument("--cache-size-mb", type=int, default=512, help="Tamanho máximo do cache em MB (padrão: 512).")
+    batch.add_argument("--debug-dir", default=None, help="Grava as imagens intermediárias da detecção nesta pasta.")
+    batch.add_argument("--detector-profile", choices=sorted(PROFILES), default="default",
+                       help="Parâmetros da detecção de cantos (padrão: default; gui: os da interface).")
+    batch.add_argument("--metrics", default=None,
+                       help="Grava o tempo por etapa, contadores e pico de memória (.prom: formato Prometheus; outro: JSON lines).")
+    batch.add_argument("--profile", default=None, help="Grava um perfil cProfile (.prof) do lote neste arquivo.")
+    batch.add_argument("-q", "--quiet", action="store_true", help="Não lista cada documento gerado.")
+    _add_resample_arguments(batch)
+    _add_encoder_arguments(batch)
+    batch.set_defaults(func=run_batch)
+
+    watch = subparsers.add_parser("watch", help="Vigia uma pasta e junta os documentos que chegam nela.")
+    watch.add_argument("inbox", help="Pasta de entrada (inclui as subpastas).")
+    watch.add_argument("-o", "--output-dir", default=_default_output_dir(), help="Pasta de saída (padrão: resultado/).")
+    watch.add_argument("--group", choices=("folder", "pattern"), default="folder",
+                       help="Agrupa as páginas por pasta ou pelo nome do arquivo (padrão: folder).")
+    watch.add_argument("--pattern", default=DEFAULT_PATTERN,
+                       help="Expressão regular com os grupos 'doc' e 'page', usada com --group pattern.")
+    watch.add_argument("--layout", choices=LAYOUTS, default="horizontal", help="Disposição das páginas (padrão: horizontal; pages: uma página por folha, em PDF ou, com --format tiff, TIFF).")
+    watch.add_argument("--columns", type=int, default=None, help="Colunas do layout grid.")
+    watch.add_argument("--enhance", action="store_true", help="Melhora a legibilidade das páginas.")
+    watch.add_argument("--workers", type=_parse_workers, default=None,
+                       help="Threads por etapa, ex.: decode=2,detect=4 (etapas: " + ", ".join(STAGES) + ").")
+    watch.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                       help=f"Itens em espera por etapa (padrão: {DEFAULT_QUEUE_SIZE}).")
+    watch.add_argument("--poll-interval", type=float, default=2.0, help="Segundos entre as consultas à pasta (padrão: 2).")
+    watch.add_argument("--settle", type=float, default=2.0,
+                       help="Segundos sem alteração antes de processar um documento (padrão: 2).")
+    watch.add_argument("--once", action="store_true", help="Processa o que já está na pasta e termina.")
+    watch.add_argument("--status-interval", type=float, default=10.0, help="Segundos entre os relatórios de vazão e filas.")
+    watch.add_argument("--status-file", default=None, help="Grava também o relatório em JSON neste arquivo.")
+    watch.add_argument("--cache-dir", default=None, help="Reaproveita os cantos guardados nesta pasta.")
+    watch.add_argument("--cache-size-mb", type=int, default=512, help="Tamanho máximo do cache em MB (padrão: 512).")
+    watch.add_argument("--debug-dir", default=None, help="Grava as imagens intermediárias da detecção nesta pasta.")
+    watch.add_argument("--detector-profile", choices=sorted(PROFILES), default="default",
+                       help="Parâmetros da detecção de cantos (padrão: default; gui: os da interface).")
+    watch.add_argument("--metrics", default=None,
+                       help="Atualiza as métricas a cada relatório (.prom: formato Prometheus; outro: JSON lines).")
+    watch.add_argument("-q", "--quiet", action="store_true", help="Não lista cada documento gerado.")
+    _add_resample_arguments(watch)
+    _add_encoder_arguments(watch)
+    watch.set_defaults(func=run_watch)
+
+    auto = subparsers.add_parser("auto", help="Separa os documentos das fotos e junta frente e verso automaticamente.")
+    auto.add_argument("inputs", nargs="+", help="Fotos ou pastas (na ordem de nome); uma foto pode ter vários documentos.")
+    auto.add_argument("-o", "--output-dir", default=_default_output_dir(), help="Pasta de saída (padrão: resultado/).")
+    auto.add_argument("--layout", choices=LAYOUTS, default="horizontal", help="Disposição das páginas (padrão: horizontal; pages: uma página por folha, em PDF ou, com --format tiff, TIFF).")
+    auto.add_argument("--columns", type=int, default=None, help="Colunas do layout grid.")
+    auto.add_argument("--width", type=int, default=None,
+                      help="Largura em que os documentos são procurados (padrão: a do perfil; aumente para fotos com muitos documentos pequenos).")
+    auto.add_argument("--max-pair-cost", type=float, default=MAX_PAIR_COST,
+                      help=f"Diferença máxima entre frente e verso de um documento (padrão: {MAX_PAIR_COST}).")
+    auto.add_argument("--detector-profile", choices=sorted(PROFILES), default="default",
+                      help="Parâmetros da detecção de cantos (padrão: default; gui: os da interface).")
+    auto.add_argument("--metrics", default=None,
+                      help="Grava o tempo por etapa e contadores (.prom: formato Prometheus; outro: JSON lines).")
+    auto.add_argument("-q", "--quiet", action="store_true", help="Não lista cada documento gerado.")
+    _add_resample_arguments(auto)
+    _add_encoder_arguments(auto)
+    auto.set_defaults(func=run_auto)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "layout", None) == "pages":
+        # Uma página por folha só cabe num formato de várias páginas
+        if args.format is None:
+            args.format = "pdf"
+        elif args.format not in MULTIPAGE_FORMATS:
+            parser.error(f"--layout pages exige --format {' ou '.join(MULTIPAGE_FORMATS)} (recebido: {args.format}).")
+    if getattr(args, "max_bytes", None) is not None and (args.format or "jpeg") not in LOSSY_FORMATS:
+        # Verificado aqui para não processar tudo e só falhar ao gravar
+        parser.error(f"--max-bytes exige --format {' ou '.join(LOSSY_FORMATS)} (recebido: {args.format}).")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
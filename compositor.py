@@ -0,0 +1,286 @@
+import math
+import os
+import tempfile
+
+from corner_detection import DEFAULT_PROFILE, CornerDetector
+from encoder import MULTIPAGE_FORMATS, EncoderSettings, PngStripWriter, save_image, save_jpeg_array, save_pages
+from image_processing import ImageProcessor
+from lazy_import import LazyModule
+from metrics import span, timed
+from page_buffer import PageBuffer
+from resampling import get_resampler
+
+# Importados na primeira operação sobre pixels (ver lazy_import.py)
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+# "pages" não junta as páginas numa imagem: grava cada uma como página de um TIFF ou PDF
+LAYOUTS = ("horizontal", "vertical", "grid", "pages")
+
+# Altura padrão das faixas de linhas entregues ao codificador
+STRIP_HEIGHT = 256
+
+
+def detector_params(profile=DEFAULT_PROFILE):
+    """Parâmetros da detecção multiescala com `profile`, que fazem parte da chave do cache."""
+    return {"detector": "multiscale", **profile.params()}
+
+
+class ArrayStripSink:
+    """Destino genérico para formatos sem escrita incremental (JPEG, TIFF...): as faixas
+    são acumuladas num array em disco (memmap) e a imagem é gravada no final. JPEG é
+    codificado direto do array (encoder.save_jpeg_array); os demais formatos e o modo de
+    tamanho máximo passam por uma imagem PIL, e aí o pico de memória inclui a imagem
+    final durante a codificação.
+    """
+
+    def __init__(self, path, width, height, settings=None):
+        self.path = path
+        self.settings = settings or EncoderSettings()
+        self.width, self.height = width, height
+        self.rows_written = 0
+        self._tmp = tempfile.NamedTemporaryFile(suffix=".raw", delete=False)
+        self._array = np.memmap(self._tmp, dtype=np.uint8, mode="w+", shape=(height, width, 3))
+
+    def write_rows(self, rows):
+        self._array[self.rows_written:self.rows_written + rows.shape[0]] = rows
+        self.rows_written += rows.shape[0]
+
+    def canvas(self):
+        """O array em disco inteiro, para quem escreve as páginas direto no seu lugar
+        (ex.: StreamingCompositor nos layouts horizontal e grid), sem uma segunda tela
+        em disco nem a cópia em faixas. Todas as linhas passam a contar como escritas.
+        """
+        self.rows_written = self.height
+        return self._array
+
+    def close(self):
+        if self._array is None:
+            return
+        try:
+            if self.settings.format_for(self.path) == "jpeg" and self.settings.max_bytes is None:
+                save_jpeg_array(self._array, self.path, self.settings)
+            else:
+                save_image(Image.fromarray(np.asarray(self._array)), self.path, self.settings)
+        finally:
+            self._array = None
+            self._tmp.close()
+            os.unlink(self._tmp.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_strip_sink(path, width, height, settings=None):
+    """Escolhe o destino das faixas pelo formato (EncoderSettings ou extensão do arquivo):
+    PNG é codificado incrementalmente.
+    """
+    settings = settings or EncoderSettings()
+    if settings.format_for(path) == "png" and settings.max_bytes is None:
+        return PngStripWriter(path, width, height, settings.compress_level, settings.threads)
+    return ArrayStripSink(path, width, height, settings)
+
+
+def compute_layout(sizes, layout="horizontal", columns=None):
+    """Calcula o tamanho da imagem final e a posição de cada página.
+
+    `sizes` é a lista (largura, altura) das páginas corrigidas. Retorna
+    ((largura, altura), [(x, y, largura, altura), ...]):
+    - horizontal: lado a lado, todas na altura da primeira página;
+    - vertical: uma abaixo da outra, todas na largura da primeira página;
+    - grid: células do tamanho da primeira página, cada página ajustada e centralizada;
+    - pages: cada página no seu tamanho, em páginas separadas; o tamanho retornado é None.
+    """
+    if not sizes:
+        raise ValueError("Nenhuma página para juntar.")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Layout desconhecido: {layout!r} (use {', '.join(LAYOUTS)}).")
+
+    if layout == "pages":
+        return None, [(0, 0, w, h) for w, h in sizes]
+
+    first_w, first_h = sizes[0]
+    placements = []
+    if layout == "horizontal":
+        x = 0
+        for w, h in sizes:
+            w = int(w * first_h / h) if h != first_h else w
+            placements.append((x, 0, w, first_h))
+            x += w
+        return (x, first_h), placements
+
+    if layout == "vertical":
+        y = 0
+        for w, h in sizes:
+            h = int(h * first_w / w) if w != first_w else h
+            placements.append((0, y, first_w, h))
+            y += h
+        return (first_w, y), placements
+
+    columns = columns or math.ceil(math.sqrt(len(sizes)))
+    rows = math.ceil(len(sizes) / columns)
+    for idx, (w, h) in enumerate(sizes):
+        scale = min(first_w / w, first_h / h)
+        fw, fh = max(1, int(w * scale)), max(1, int(h * scale))
+        x = (idx % columns) * first_w + (first_w - fw) // 2
+        y = (idx // columns) * first_h + (first_h - fh) // 2
+        placements.append((x, y, fw, fh))
+    return (columns * first_w, rows * first_h), placements
+
+
+@timed("merge")
+def compose_pages(pages, layout="horizontal", columns=None, resampler=None):
+    """Versão em memória do StreamingCompositor, para páginas já corrigidas em PageBuffer
+    (ou arrays RGB): cada página é redimensionada direto para o seu lugar na imagem
+    final. No layout horizontal o resultado é o de ImageProcessor.merge_side_by_side.
+    `resampler` é um Resampler ou nível de qualidade (ver resampling.py). Retorna um
+    PageBuffer.
+    """
+    if layout == "pages":
+        raise ValueError("O layout 'pages' não junta as páginas numa imagem (ver encoder.save_pages).")
+    resampler = get_resampler(resampler)
+    size, placements = compute_layout([(p.shape[1], p.shape[0]) for p in pages], layout, columns)
+    merged = PageBuffer(np.zeros((size[1], size[0], 3), dtype=np.uint8))
+    for page, (x, y, w, h) in zip(pages, placements):
+        src = np.asarray(page)
+        region = merged.array[y:y + h, x:x + w]
+        if src.shape[:2] == (h, w):
+            region[...] = src
+        else:
+            resampler.resize(src, (w, h), dst=region)
+    return merged
+
+
+class StreamingCompositor:
+    """Junta N páginas corrigindo a perspectiva de uma de cada vez e entregando a
+    imagem final em faixas ao codificador. O pico de memória fica limitado a uma
+    página mais uma faixa: no layout vertical as páginas são emitidas diretamente;
+    nos demais, cada página é gravada num array em disco (memmap) e as faixas são
+    lidas dele.
+    """
+
+    def __init__(self, layout="horizontal", columns=None, strip_height=STRIP_HEIGHT, cache=None, encoder=None,
+                 profile=DEFAULT_PROFILE, resampler=None):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Layout desconhecido: {layout!r} (use {', '.join(LAYOUTS)}).")
+        self.layout = layout
+        self.columns = columns
+        self.strip_height = strip_height
+        self.cache = cache  # ProcessingCache opcional para cantos e páginas já corrigidas
+        self.encoder = encoder or EncoderSettings()
+        self.profile = profile  # DetectorProfile da detecção dos cantos
+        self.resampler = get_resampler(resampler)  # Qualidade da correção (ver resampling.py)
+
+    def compose(self, pages, output_path, corners=None):
+        """Gera `output_path` a partir da lista de caminhos `pages`.
+        `corners` pode trazer os cantos já conhecidos de cada página (ou None para detectar).
+        Retorna o tamanho (largura, altura) da imagem gerada (None no layout "pages") e a
+        confiança da detecção de cada página (None para as páginas com cantos informados).
+        """
+        if self.layout == "pages" and self.encoder.format_for(output_path) not in MULTIPAGE_FORMATS:
+            raise ValueError("O layout 'pages' precisa de saída TIFF ou PDF.")
+        if corners is None:
+            corners = [None] * len(pages)
+        detections = [
+            self._detect(path) if pts is None else (pts, None)
+            for path, pts in zip(pages, corners)
+        ]
+        corners = [pts for pts, _ in detections]
+        # Geometria de todas as páginas de uma vez: tamanhos e homografias já no
+        # tamanho final do layout, antes de decodificar qualquer página
+        quads = np.asarray(corners, dtype="float32").reshape(-1, 4, 2)
+        sizes = [tuple(s) for s in ImageProcessor.warp_sizes_batch(quads).tolist()]
+        size, placements = compute_layout(sizes, self.layout, self.columns)
+        matrices, _ = ImageProcessor.perspective_matrices_batch(quads, [(w, h) for _, _, w, h in placements])
+        for path, M in zip(pages, matrices):
+            if not np.isfinite(M).all():
+                raise ValueError(f"Cantos degenerados (colineares ou repetidos) em {path}.")
+        geometry = list(zip(corners, matrices, placements))
+        confidences = [confidence for _, confidence in detections]
+
+        # A junção inclui as etapas de cada página (decode, warp) e a gravação (encode),
+        # que também são medidas separadamente, como em compose_pages
+        with span("merge"):
+            if self.layout == "pages":
+                # Cada página corrigida no seu tamanho, como uma página do arquivo
+                rendered = [Image.fromarray(self._render_page(path, pts, M, placement))
+                            for path, (pts, M, placement) in zip(pages, geometry)]
+                save_pages(rendered, output_path, self.encoder)
+                return None, confidences
+
+            with open_strip_sink(output_path, *size, self.encoder) as sink:
+                if self.layout == "vertical":
+                    for path, (pts, M, placement) in zip(pages, geometry):
+                        self._emit(sink, self._render_page(path, pts, M, placement))
+                else:
+                    self._compose_spilled(sink, size, pages, geometry)
+        return size, confidences
+
+    def _detect(self, path):
+        """Retorna (cantos, confiança) da página, pelo cache ou pela detecção multiescala."""
+        params = detector_params(self.profile)
+        if self.cache is not None:
+            detection = self.cache.get_detection(path, params)
+            if detection is not None:
+                return detection
+        corners, confidence = CornerDetector.detect_with_confidence(path, profile=self.profile)
+        if self.cache is not None:
+            try:
+                self.cache.put_corners(path, params, corners, confidence)
+            except OSError:
+                pass  # O cache é só uma otimização
+        return corners, confidence
+
+    def _render_page(self, path, pts, M, placement, dst=None):
+        """Decodifica, corrige e redimensiona uma página para o seu lugar no layout,
+        com a homografia `M` já calculada para o tamanho de `placement`. Com `dst`
+        (array altura x largura x 3, ex.: o recorte da tela em disco), a página é
+        escrita diretamente nele, sem cópia intermediária.
+        """
+        _, _, w, h = placement
+        if self.cache is not None:
+            params = {"corners": np.round(np.asarray(pts, dtype=float), 2), "size": [w, h],
+                      "resample": self.resampler.key}
+            page = self.cache.get_page(path, params)
+            if page is not None:
+                if dst is None:
+                    return np.asarray(page)
+                dst[...] = np.asarray(page)
+                return dst
+
+        # Correção e redimensionamento para o lugar no layout numa única reamostragem
+        with span("decode"):
+            page = PageBuffer.from_path(path)
+        array = ImageProcessor.warp_array(page.array, M, (w, h), dst=dst, resampler=self.resampler)
+        if self.cache is not None:
+            try:
+                self.cache.put_page(path, params, Image.fromarray(array))
+            except OSError:
+                pass  # O cache é só uma otimização: a página já está pronta
+        return array
+
+    def _emit(self, sink, array):
+        for y in range(0, array.shape[0], self.strip_height):
+            sink.write_rows(array[y:y + self.strip_height])
+
+    def _compose_spilled(self, sink, size, pages, geometry):
+        if isinstance(sink, ArrayStripSink):
+            # O destino já guarda a imagem num array em disco: as páginas vão direto nele
+            self._render_into(sink.canvas(), pages, geometry)
+            return
+        width, height = size
+        with tempfile.TemporaryFile() as tmp:
+            canvas = np.memmap(tmp, dtype=np.uint8, mode="w+", shape=(height, width, 3))
+            self._render_into(canvas, pages, geometry)
+            self._emit(sink, canvas)
+            del canvas
+
+    def _render_into(self, canvas, pages, geometry):
+        """Corrige cada página direto no seu recorte de `canvas` (a imagem final)."""
+        for path, (pts, M, placement) in zip(pages, geometry):
+            x, y, w, h = placement
+            # A correção escreve direto no recorte da tela, que já é o destino final
+            self._render_page(path, pts, M, placement, dst=canvas[y:y + h, x:x + w])
@@ -1,54 +1,426 @@
-import cv2
-import numpy as np
-from PIL import Image
-from image_processing import ImageProcessor # Importa ImageProcessor
 import os
+import threading
+
+from image_processing import ImageProcessor # Importa ImageProcessor
+from debug_sink import default_sink
+from lazy_import import LazyModule
+from metrics import span, timed
+
+
+# Importados na primeira operação sobre pixels (ver lazy_import.py)
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+# Largura usada na detecção; os cantos encontrados são reescalados para a imagem original
+DETECTION_WIDTH = 800
+
+# Larguras da pirâmide da detecção multiescala, da mais barata para a mais detalhada
+PYRAMID_WIDTHS = (256, 512, DETECTION_WIDTH)
+
+# Confiança a partir da qual a detecção multiescala para no nível atual
+EARLY_EXIT_CONFIDENCE = 0.8
+
+# Quantos dos maiores contornos são avaliados como candidatos
+TOP_CONTOURS = 5
+
+# Área mínima (fração da foto) e confiança mínima de cada documento achado por
+# find_all_document_corners, numa foto com vários documentos
+MULTI_MIN_AREA = 0.02
+MULTI_MIN_CONFIDENCE = 0.5
+
+# Fechamento das bordas na segunda busca de find_all_document_corners
+MULTI_CLOSE_SIZE = 5
+
+
+class DetectorProfile:
+    """Parâmetros ajustáveis da detecção de cantos, usados por todos os modos do
+    CornerDetector (interface, linha de comando, lote e serviço):
+
+    - widths: larguras da pirâmide da detecção multiescala (o maior nível é a largura
+      usada pelos modos de um só nível);
+    - clahe_clip, blur_size, canny_low, canny_high: realce e detecção de bordas;
+    - close_size: lado do elemento estruturante do fechamento morfológico das bordas,
+      que une bordas interrompidas (0 desliga);
+    - top_contours, min_area, min_aspect, max_aspect: quantos dos maiores contornos são
+      avaliados, a área mínima (fração da imagem) e a faixa de proporção largura/altura
+      aceitas para o documento;
+    - min_confidence: confiança para a parada antecipada da detecção multiescala.
+    """
+
+    def __init__(self, name="default", widths=PYRAMID_WIDTHS, clahe_clip=3.0, blur_size=5,
+                 canny_low=75, canny_high=200, close_size=0, top_contours=TOP_CONTOURS,
+                 min_area=0.2, min_aspect=0.5, max_aspect=2.0, min_confidence=EARLY_EXIT_CONFIDENCE):
+        self.name = name
+        self.widths = tuple(sorted(widths))
+        self.clahe_clip = clahe_clip
+        self.blur_size = blur_size
+        self.canny_low = canny_low
+        self.canny_high = canny_high
+        self.close_size = close_size
+        self.top_contours = top_contours
+        self.min_area = min_area
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.min_confidence = min_confidence
+
+    @property
+    def width(self):
+        """Largura do nível mais detalhado."""
+        return self.widths[-1]
+
+    def params(self):
+        """Os parâmetros como dicionário, para as chaves do ProcessingCache."""
+        return {key: list(value) if isinstance(value, tuple) else value for key, value in vars(self).items()}
+
+    def replace(self, **changes):
+        """Cópia do perfil com alguns parâmetros alterados."""
+        return DetectorProfile(**{**vars(self), **changes})
+
+    def __repr__(self):
+        return f"DetectorProfile({self.name!r})"
+
+
+# Perfil padrão, do lote, da linha de comando e do serviço
+DEFAULT_PROFILE = DetectorProfile()
+
+# Perfis por nome (opção --detector-profile da linha de comando). O perfil "gui" é o da
+# interface: um só nível de 800 px, bordas fechadas e limites mais tolerantes para
+# fotos tiradas à mão, em que o documento ocupa uma parte menor da imagem
+PROFILES = {
+    "default": DEFAULT_PROFILE,
+    "gui": DetectorProfile("gui", widths=(DETECTION_WIDTH,), close_size=5, top_contours=10,
+                           min_area=0.1, min_aspect=0.4, max_aspect=2.5),
+}
+
+
+# Buffers reaproveitados entre chamadas da detecção (um conjunto por thread)
+_buffers = threading.local()
+
+
+def _buffer(name, shape):
+    """Retorna um array uint8 pré-alocado para `name`, recriado apenas se o formato mudar."""
+    pool = getattr(_buffers, "pool", None)
+    if pool is None:
+        pool = _buffers.pool = {}
+    buf = pool.get(name)
+    if buf is None or buf.shape != shape:
+        buf = pool[name] = np.empty(shape, dtype=np.uint8)
+    return buf
+
 
 class CornerDetector:
     """Classe para encapsular a lógica de detecção de cantos de documentos."""
 
     @staticmethod
-    def find_document_corners(image):
+    @timed("detect")
+    def find_document_corners(image, debug_sink=None, profile=DEFAULT_PROFILE):
         """Tenta detectar automaticamente os 4 cantos de um documento em uma imagem.
         Retorna os 4 pontos ordenados (top-left, top-right, bottom-right, bottom-left)
         ou os cantos da imagem inteira se nenhum documento for encontrado.
+        `image` é aceito como em load_detection_frame (caminho, imagem PIL ou array):
+        a imagem é reduzida para a largura do perfil e convertida direto para um canal
+        de luminância, sem cópias em resolução total, e as etapas seguintes usam buffers
+        reaproveitados entre as chamadas.
+        `debug_sink` (ver debug_sink.py) recebe as imagens intermediárias; por padrão
+        nada é gravado. `profile` é o DetectorProfile usado (ver PROFILES).
+        """
+        gray, ratio, size = CornerDetector.load_detection_frame(image, profile.width)
+
+        # CLAHE, desfoque e detecção de bordas, fechando as brechas se o perfil pedir
+        edged = CornerDetector._edge_map(gray, "single", profile)
+
+        # Entrega a imagem intermediária ao destino de depuração, se houver
+        if debug_sink is None:
+            debug_sink = default_sink()
+        if debug_sink is not None:
+            debug_sink.save("edged_image", edged)
+
+        return CornerDetector._corners_from_edges(edged, ratio, size, profile)
+
+    @staticmethod
+    @timed("detect")
+    def detect_with_confidence(source, debug_sink=None, profile=DEFAULT_PROFILE, widths=None, min_confidence=None):
+        """Detecção multiescala com parada antecipada. Retorna (cantos, confiança).
+
+        Começa no nível mais barato da pirâmide (256 px) e só passa para o próximo se o
+        melhor candidato tiver confiança abaixo de `min_confidence`. Usa apenas os
+        contornos externos e seleciona os maiores sem ordenar todos; no último nível,
+        se nada for encontrado, tenta também os contornos internos. Os cantos achados
+        num nível reduzido são refinados no maior nível. A confiança vai de 0 a 1 e é 0
+        quando nenhum documento é encontrado (os cantos são então os da imagem inteira).
+        `widths` e `min_confidence`, se informados, substituem os de `profile`.
         """
-        img_np = np.array(image.convert("RGB"))
-        img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-
-        # Redimensiona para processamento mais rápido, mantendo a proporção
-        ratio = image.width / 800.0 
-        resized = cv2.resize(img_cv, (800, int(image.height / ratio)))
-
-        # Converter para LAB e aplicar CLAHE para realce de contraste
-        lab = cv2.cvtColor(resized, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-        cl = clahe.apply(l)
-        merged = cv2.merge((cl, a, b))
-        contrast_enhanced = cv2.cvtColor(merged, cv2.COLOR_LAB2BGR)
-
-        # Converter para escala de cinza
-        gray = cv2.cvtColor(contrast_enhanced, cv2.COLOR_BGR2GRAY)
-
-        # Aplicar desfoque leve
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-
-        # Detecção de bordas
-        edged = cv2.Canny(blurred, 75, 200)
-
-        # --- Adição para salvar a imagem intermediária (edged) ---
-        debug_dir = "./debug_images"
-        os.makedirs(debug_dir, exist_ok=True)
-        debug_image_path = os.path.join(debug_dir, "edged_image.jpg")
-        cv2.imwrite(debug_image_path, edged)
-        print(f"Imagem de bordas salva em: {debug_image_path}")
-        # --------------------------------------------------
+        widths = profile.widths if widths is None else widths
+        min_confidence = profile.min_confidence if min_confidence is None else min_confidence
+        top, ratio, size = CornerDetector.load_detection_frame(source, max(widths))
+        if debug_sink is None:
+            debug_sink = default_sink()
+
+        best, best_confidence, best_level = None, 0.0, None
+        for level, width in enumerate(sorted(widths)):
+            if width == top.shape[1]:
+                gray = top
+            else:
+                gray = cv2.resize(top, (width, int(top.shape[0] * width / top.shape[1])),
+                                  dst=_buffer(f"level{width}", (int(top.shape[0] * width / top.shape[1]), width)),
+                                  interpolation=cv2.INTER_AREA)
+            edged = CornerDetector._edge_map(gray, f"{width}", profile)
+            if debug_sink is not None:
+                debug_sink.save(f"edged_image_{width}", edged)
+
+            last = level == len(widths) - 1
+            modes = (cv2.RETR_EXTERNAL, cv2.RETR_LIST) if last and best is None else (cv2.RETR_EXTERNAL,)
+            for mode in modes:
+                quad, confidence = CornerDetector._best_quad(edged, mode, profile)
+                if quad is not None and confidence > best_confidence:
+                    # Guarda o candidato na escala do nível mais detalhado
+                    best, best_confidence, best_level = quad * (top.shape[1] / width), confidence, width
+                if best is not None:
+                    break
+            if best_confidence >= min_confidence:
+                break
+
+        if best is None:
+            w, h = size
+            return np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32"), 0.0
+
+        if best_level != top.shape[1]:
+            best = CornerDetector._refine_corners(top, best, top.shape[1] / best_level)
+        return ImageProcessor.order_points(best * ratio), float(best_confidence)
+
+    @staticmethod
+    @timed("detect")
+    def find_all_document_corners(source, debug_sink=None, profile=DEFAULT_PROFILE, width=None,
+                                  min_area=MULTI_MIN_AREA, min_confidence=MULTI_MIN_CONFIDENCE):
+        """Detecta todos os documentos de uma foto numa única passada, em vez de parar no
+        primeiro. Retorna [(cantos, confiança), ...] na ordem de leitura (linhas de cima
+        para baixo, cada linha da esquerda para a direita); a lista é vazia se nenhum
+        documento for encontrado.
+
+        `source` é aceito como em load_detection_frame. Usa os contornos externos com
+        área de pelo menos `min_area` da foto e a faixa de proporção de `profile`;
+        quadriláteros dentro de outro já aceito (ex.: a foto impressa no documento) são
+        descartados. Se o perfil não fecha as bordas, a busca é repetida com as bordas
+        fechadas, que recuperam documentos com a borda interrompida; os achados nas duas
+        buscas se somam. `width` é a largura da detecção (padrão: a do perfil); fotos com
+        documentos pequenos ganham precisão com uma largura maior.
+        """
+        gray, ratio, size = CornerDetector.load_detection_frame(source, width or profile.width)
+        edged = CornerDetector._edge_map(gray, "all", profile)
+        edge_maps = [edged]
+        if not profile.close_size:
+            closed = _buffer("closed_all", edged.shape)
+            closed[...] = edged
+            edge_maps.append(CornerDetector._close_edges(closed, profile.replace(close_size=MULTI_CLOSE_SIZE)))
+        if debug_sink is None:
+            debug_sink = default_sink()
+        if debug_sink is not None:
+            debug_sink.save("edged_image_all", edge_maps[-1])
+
+        min_pixels = edged.shape[0] * edged.shape[1] * min_area
+        candidates = []
+        for edges in edge_maps:
+            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for c in contours:
+                area = cv2.contourArea(c)
+                if area <= min_pixels:
+                    continue
+                approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+                if len(approx) != 4:
+                    continue
+                x, y, w, h = cv2.boundingRect(approx)
+                if not profile.min_aspect < float(w) / h < profile.max_aspect:
+                    continue
+                quad = approx.reshape(4, 2).astype("float32")
+                confidence = CornerDetector._quad_confidence(edges, quad, area)
+                if confidence >= min_confidence:
+                    candidates.append((area, quad, confidence))
 
+        # Do maior para o menor: um quadrilátero cujo centro cai dentro de outro já aceito
+        # é um detalhe do mesmo documento
+        accepted = []
+        for area, quad, confidence in sorted(candidates, key=lambda item: -item[0]):
+            cx, cy = (float(v) for v in quad.mean(axis=0))
+            if any(cv2.pointPolygonTest(other, (cx, cy), False) >= 0 for other, _ in accepted):
+                continue
+            accepted.append((quad, confidence))
+
+        documents = [(ImageProcessor.order_points(quad * ratio), float(confidence)) for quad, confidence in accepted]
+        return CornerDetector._reading_order(documents)
+
+    @staticmethod
+    def _reading_order(documents):
+        """Ordena [(cantos, confiança), ...] em linhas, de cima para baixo, e cada linha da
+        esquerda para a direita. Documentos cujo centro vertical fica dentro da metade
+        da altura do primeiro da linha pertencem à mesma linha.
+        """
+        remaining = sorted(documents, key=lambda d: float(d[0][:, 1].mean()))
+        ordered = []
+        while remaining:
+            first = remaining[0][0]
+            center = float(first[:, 1].mean())
+            half_height = float(np.ptp(first[:, 1])) / 2
+            row = [d for d in remaining if abs(float(d[0][:, 1].mean()) - center) <= half_height]
+            remaining = [d for d in remaining if abs(float(d[0][:, 1].mean()) - center) > half_height]
+            ordered += sorted(row, key=lambda d: float(d[0][:, 0].mean()))
+        return ordered
+
+    @staticmethod
+    def _edge_map(gray, key, profile=DEFAULT_PROFILE):
+        """CLAHE, desfoque e Canny sobre um canal de luminância, em buffers reaproveitados."""
+        clahe = cv2.createCLAHE(clipLimit=profile.clahe_clip, tileGridSize=(8, 8))
+        cl = clahe.apply(gray, dst=_buffer(f"clahe{key}", gray.shape))
+        blurred = cv2.GaussianBlur(cl, (profile.blur_size, profile.blur_size), 0,
+                                   dst=_buffer(f"blurred{key}", gray.shape))
+        edged = cv2.Canny(blurred, profile.canny_low, profile.canny_high, edges=_buffer(f"edged{key}", gray.shape))
+        return CornerDetector._close_edges(edged, profile)
+
+    @staticmethod
+    def _close_edges(edged, profile):
+        """Fechamento morfológico das bordas (close_size do perfil), no próprio buffer."""
+        if not profile.close_size:
+            return edged
+        kernel = np.ones((profile.close_size, profile.close_size), np.uint8)
+        return cv2.morphologyEx(edged, cv2.MORPH_CLOSE, kernel, dst=edged)
+
+    @staticmethod
+    def _best_quad(edged, mode, profile=DEFAULT_PROFILE):
+        """Avalia os maiores contornos (top_contours do perfil) e retorna o quadrilátero
+        de maior confiança, (quad 4x2, confiança), ou (None, 0.0).
+        """
+        contours, _ = cv2.findContours(edged, mode, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None, 0.0
+        areas = np.fromiter((cv2.contourArea(c) for c in contours), dtype=np.float64, count=len(contours))
+
+        # Seleção parcial dos maiores contornos, sem ordenar a lista inteira
+        k = min(profile.top_contours, len(contours))
+        top = np.argpartition(-areas, k - 1)[:k]
+        top = top[np.argsort(-areas[top])]
+
+        min_area = edged.shape[0] * edged.shape[1] * profile.min_area
+        best, best_confidence = None, 0.0
+        for idx in top:
+            if areas[idx] <= min_area:
+                break  # Os demais são ainda menores
+            c = contours[idx]
+            approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+            if len(approx) != 4:
+                continue
+            x, y, w, h = cv2.boundingRect(approx)
+            if not profile.min_aspect < float(w) / h < profile.max_aspect:
+                continue
+            quad = approx.reshape(4, 2).astype("float32")
+            confidence = CornerDetector._quad_confidence(edged, quad, areas[idx])
+            if confidence > best_confidence:
+                best, best_confidence = quad, confidence
+        return best, best_confidence
+
+    @staticmethod
+    def _quad_confidence(edged, quad, contour_area):
+        """Confiança (0 a 1) de que o quadrilátero é a borda de um documento: produto de
+        quanto o contorno preenche o quadrilátero, de quão próximos de 90° estão os
+        ângulos internos e da fração do perímetro que cai sobre bordas detectadas.
+        """
+        quad_area = cv2.contourArea(quad)
+        if quad_area <= 0:
+            return 0.0
+        fill = min(contour_area, quad_area) / max(contour_area, quad_area)
+
+        ordered = ImageProcessor.order_points(quad)
+        prev_vec = ordered - np.roll(ordered, 1, axis=0)
+        next_vec = np.roll(ordered, -1, axis=0) - ordered
+        cos = np.abs(np.einsum("ij,ij->i", -prev_vec, next_vec)) / (
+            np.linalg.norm(prev_vec, axis=1) * np.linalg.norm(next_vec, axis=1) + 1e-9)
+        squareness = 1.0 - float(cos.mean())
+
+        # Amostra pontos ao longo dos lados e verifica bordas numa vizinhança 3x3
+        t = np.linspace(0.0, 1.0, 32, endpoint=False)[:, None]
+        samples = np.concatenate([a + t * (b - a) for a, b in zip(ordered, np.roll(ordered, -1, axis=0))])
+        xs = np.clip(np.rint(samples[:, 0]).astype(int), 1, edged.shape[1] - 2)
+        ys = np.clip(np.rint(samples[:, 1]).astype(int), 1, edged.shape[0] - 2)
+        hits = np.zeros(len(xs), dtype=bool)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                hits |= edged[ys + dy, xs + dx] > 0
+        support = float(hits.mean())
+        return fill * squareness * support
+
+    @staticmethod
+    def _refine_corners(gray, quad, scale):
+        """Refina com precisão subpixel, no quadro mais detalhado, cantos encontrados
+        num nível reduzido `scale` vezes menor.
+        """
+        half = int(max(2, min(np.ceil(scale * 2), 12)))
+        corners = np.ascontiguousarray(quad, dtype="float32").reshape(-1, 1, 2)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.1)
+        refined = cv2.cornerSubPix(gray, corners.copy(), (half, half), (-1, -1), criteria).reshape(4, 2)
+        # Descarta refinamentos que fugiram da janela de busca
+        moved = np.linalg.norm(refined - quad, axis=1)
+        return np.where((moved <= half)[:, None], refined, quad)
+
+    @staticmethod
+    def load_detection_frame(source, width=DETECTION_WIDTH):
+        """Decodifica `source` (caminho ou imagem PIL) direto para luminância na largura `width`.
+        Para JPEG aberto a partir do arquivo, o próprio decodificador reduz a escala (draft),
+        evitando decodificar a resolução total. `source` também pode ser um array RGB ou
+        PageBuffer já decodificado, lido sem cópia (e que não conta como decode nas
+        métricas). Retorna (cinza, razão, tamanho original).
+        """
+        if not isinstance(source, (str, os.PathLike, Image.Image)):
+            return CornerDetector._detection_frame_from_array(np.asarray(source), width)
+        with span("decode"):
+            return CornerDetector._decode_detection_frame(source, width)
+
+    @staticmethod
+    def _decode_detection_frame(source, width):
+        opened = None if isinstance(source, Image.Image) else Image.open(source)
+        img = source if opened is None else opened
+        try:
+            size = img.size
+            ratio = size[0] / float(width)
+            height = int(size[1] / ratio)
+
+            # draft só tem efeito antes da decodificação e altera o objeto, por isso
+            # é aplicado apenas às imagens abertas aqui, nunca à do chamador
+            if opened is not None and opened.format == "JPEG":
+                opened.draft("L", (width, height))
+
+            # Redução inteira (média por blocos) antes da conversão para um canal
+            factor = img.width // width
+            if factor >= 2 and img.mode in ("L", "RGB", "RGBA", "CMYK"):
+                img = img.reduce(factor)
+            img = img.convert("L")
+
+            gray = _buffer("gray", (height, width))
+            cv2.resize(np.asarray(img), (width, height), dst=gray, interpolation=cv2.INTER_AREA)
+            return gray, ratio, size
+        finally:
+            if opened is not None:
+                opened.close()
+
+    @staticmethod
+    def _detection_frame_from_array(rgb, width):
+        """load_detection_frame para um array RGB: reduz as três cores com INTER_AREA e só
+        então converte a imagem pequena para luminância.
+        """
+        size = (rgb.shape[1], rgb.shape[0])
+        ratio = size[0] / float(width)
+        height = int(size[1] / ratio)
+        small = cv2.resize(rgb, (width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY, dst=_buffer("gray", (height, width)))
+        return gray, ratio, size
+
+    @staticmethod
+    def _corners_from_edges(edged, ratio, size, profile=DEFAULT_PROFILE):
+        """Procura o contorno do documento no mapa de bordas e retorna os cantos
+        na escala da imagem original de tamanho `size`.
+        """
         # Encontra contornos na imagem com bordas
-        contours, _ = cv2.findContours(edged.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        # Ordena os contornos por área em ordem decrescente e pega os 5 maiores
-        contours = sorted(contours, key=cv2.contourArea, reverse=True)[:5]
+        contours, _ = cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        # Ordena os contornos por área em ordem decrescente e pega os maiores
+        contours = sorted(contours, key=cv2.contourArea, reverse=True)[:profile.top_contours]
 
         screenCnt = None
         # Itera sobre os contornos encontrados
@@ -59,14 +431,14 @@ class CornerDetector:
             approx = cv2.approxPolyDP(c, 0.02 * peri, True)
 
             # Verifica se o polígono tem 4 vértices (um retângulo)
-            # e se a área é significativa (pelo menos 20% da área da imagem redimensionada)
+            # e se a área é significativa (min_area da área da imagem redimensionada)
             area = cv2.contourArea(c)
-            if len(approx) == 4 and area > (resized.shape[0] * resized.shape[1] * 0.2):
+            if len(approx) == 4 and area > (edged.shape[0] * edged.shape[1] * profile.min_area):
                 # Calcula o aspect ratio do contorno
                 x, y, w, h = cv2.boundingRect(approx)
                 aspect_ratio = float(w)/h
                 # Verifica se o aspect ratio está dentro de uma faixa razoável para documentos
-                if 0.5 < aspect_ratio < 2.0: # Ajustado para ser mais flexível
+                if profile.min_aspect < aspect_ratio < profile.max_aspect:
                     screenCnt = approx
                     break # Encontrou o contorno do documento, pode parar
 
@@ -76,13 +448,5 @@ class CornerDetector:
             return ImageProcessor.order_points(screenCnt.reshape(4, 2) * ratio)
 
         # Se nenhum contorno de documento for encontrado, retorna os cantos da imagem inteira
-        h, w = image.height, image.width
+        w, h = size
         return np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32")
-
-
-
-
-
-
-
-
@@ -0,0 +1,57 @@
+import itertools
+import os
+import uuid
+
+from lazy_import import LazyModule
+
+cv2 = LazyModule("cv2")  # Importado só quando uma imagem é gravada
+
+# Variável de ambiente que ativa a gravação das imagens de depuração em disco.
+# Por ser lida a cada chamada, também vale para os processos do lote.
+DEBUG_DIR_ENV = "JUNTAR_DEBUG_DIR"
+
+
+class DiskDebugSink:
+    """Grava imagens intermediárias em disco, com um nome único por chamada.
+    Processos e threads concorrentes nunca sobrescrevem o arquivo um do outro.
+    """
+
+    def __init__(self, directory="./debug_images"):
+        self.directory = directory
+        self._token = uuid.uuid4().hex[:8]
+        self._counter = itertools.count()
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, name, image):
+        """Grava a imagem (array do OpenCV) e retorna o caminho do arquivo."""
+        path = os.path.join(self.directory, f"{name}_{os.getpid()}_{self._token}_{next(self._counter)}.png")
+        cv2.imwrite(path, image)
+        return path
+
+
+class MemoryDebugSink:
+    """Guarda as imagens intermediárias em memória, sem nenhum acesso a disco."""
+
+    def __init__(self):
+        self.images = []
+
+    def save(self, name, image):
+        """Guarda uma cópia da imagem e retorna seu índice na lista `images`."""
+        self.images.append((name, image.copy()))
+        return len(self.images) - 1
+
+
+_env_sinks = {}
+
+
+def default_sink():
+    """Retorna o destino de depuração padrão: None (desligado), ou um DiskDebugSink
+    na pasta indicada pela variável de ambiente JUNTAR_DEBUG_DIR.
+    """
+    directory = os.environ.get(DEBUG_DIR_ENV)
+    if not directory:
+        return None
+    sink = _env_sinks.get(directory)
+    if sink is None:
+        sink = _env_sinks[directory] = DiskDebugSink(directory)
+    return sink
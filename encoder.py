@@ -0,0 +1,377 @@
+import collections
+import io
+import os
+import re
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_import import LazyModule
+from metrics import timed
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+# Formatos de saída e a extensão usada nos nomes gerados automaticamente
+FORMATS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp", "tiff": ".tif", "pdf": ".pdf"}
+EXTENSIONS = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".webp": "webp", ".tif": "tiff", ".tiff": "tiff", ".pdf": "pdf"}
+
+# Formatos que aceitam várias páginas num só arquivo
+MULTIPAGE_FORMATS = ("tiff", "pdf")
+
+# Subamostragem de cor do JPEG (EncoderSettings.subsampling) -> fator do OpenCV
+_CV2_SAMPLING = {"4:4:4": "IMWRITE_JPEG_SAMPLING_FACTOR_444", "4:2:2": "IMWRITE_JPEG_SAMPLING_FACTOR_422",
+                 "4:2:0": "IMWRITE_JPEG_SAMPLING_FACTOR_420"}
+
+# Formatos com qualidade ajustável, usados no modo de tamanho máximo
+LOSSY_FORMATS = ("jpeg", "webp")
+
+# Lado maior da imagem reduzida usada para procurar a qualidade no modo de tamanho máximo
+PROBE_SIZE = 1024
+
+# Qualidade mínima do modo de tamanho máximo
+MIN_QUALITY = 10
+
+# Uma codificação completa menor que esta fração do limite ainda ganha uma correção
+# para cima, que mira essa mesma fração para não passar do limite (ver _save_within)
+FILL_TARGET = 0.9
+
+
+def _max_bytes_error(fmt):
+    return f"O tamanho máximo só vale para {' e '.join(f.upper() for f in LOSSY_FORMATS)}, não {fmt.upper()}."
+
+
+class EncoderSettings:
+    """Opções de codificação da imagem final.
+
+    - format: um de FORMATS, usado nos nomes gerados automaticamente e nos arquivos
+      cuja extensão não indica o formato; a extensão conhecida sempre prevalece;
+    - quality: 1–100, para JPEG, WebP e as páginas JPEG de PDF/TIFF;
+    - compress_level: 0–9 do zlib, para PNG. O padrão 3 é bem mais rápido que o 6 do
+      Pillow e gera arquivos pouco maiores; o TIFF usa o deflate no nível do Pillow;
+    - optimize, progressive e subsampling ("4:4:4", "4:2:2", "4:2:0"): opções do JPEG;
+    - threads: threads do codificador PNG (ver PngStripWriter);
+    - max_bytes: tamanho máximo do arquivo; a qualidade é escolhida por busca binária
+      numa versão reduzida da imagem (só JPEG e WebP).
+    """
+
+    def __init__(self, format=None, quality=90, compress_level=3, optimize=False, progressive=False,
+                 subsampling="4:2:0", threads=1, max_bytes=None):
+        if format is not None and format not in FORMATS:
+            raise ValueError(f"Formato desconhecido: {format!r} (use {', '.join(FORMATS)}).")
+        if max_bytes is not None and format is not None and format not in LOSSY_FORMATS:
+            raise ValueError(_max_bytes_error(format))
+        self.format = format
+        self.quality = quality
+        self.compress_level = compress_level
+        self.optimize = optimize
+        self.progressive = progressive
+        self.subsampling = subsampling
+        self.threads = max(1, threads or 1)
+        self.max_bytes = max_bytes
+
+    def __repr__(self):
+        return (f"EncoderSettings(format={self.format!r}, quality={self.quality}, "
+                f"compress_level={self.compress_level}, max_bytes={self.max_bytes})")
+
+    def format_for(self, path):
+        """Formato a usar para `path`: o da extensão do arquivo ou, sem extensão
+        conhecida, o configurado (padrão JPEG).
+        """
+        return EXTENSIONS.get(os.path.splitext(path)[1].lower(), self.format or "jpeg")
+
+    def check_output(self, path):
+        """Levanta ValueError se o tamanho máximo não vale para o formato de `path`;
+        chamado antes de processar, para não descobrir o erro só na gravação.
+        """
+        fmt = self.format_for(path)
+        if self.max_bytes is not None and fmt not in LOSSY_FORMATS:
+            raise ValueError(_max_bytes_error(fmt))
+
+    def save_options(self, fmt, quality=None):
+        """Argumentos de Image.save para o formato `fmt`."""
+        quality = self.quality if quality is None else quality
+        if fmt == "jpeg":
+            return {"format": "JPEG", "quality": quality, "optimize": self.optimize,
+                    "progressive": self.progressive, "subsampling": self.subsampling}
+        if fmt == "webp":
+            return {"format": "WEBP", "quality": quality, "method": 4}
+        if fmt == "png":
+            return {"format": "PNG", "compress_level": self.compress_level}
+        if fmt == "tiff":
+            return {"format": "TIFF", "compression": "tiff_deflate"}
+        return {"format": "PDF", "quality": quality, "resolution": 150.0}
+
+
+class PngStripWriter:
+    """Codificador PNG incremental (RGB, 8 bits): recebe a imagem em faixas de linhas
+    e as comprime à medida que chegam, sem precisar da imagem inteira em memória.
+
+    Com `threads` > 1, cada faixa é comprimida numa thread como um trecho independente
+    do fluxo deflate (terminado com Z_SYNC_FLUSH, como faz o pigz); o zlib libera o GIL,
+    então as faixas são comprimidas em paralelo. O arquivo continua sendo um PNG comum,
+    só um pouco maior, porque cada faixa recomeça o dicionário.
+    """
+
+    def __init__(self, path, width, height, compress_level=6, threads=1):
+        self.width, self.height = width, height
+        self.rows_written = 0
+        self.compress_level = compress_level
+        self._file = open(path, "wb")
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        # IHDR: largura, altura, 8 bits, cor RGB (2), compressão 0, filtro 0, sem entrelaçamento
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        if threads > 1:
+            self._compressor = None
+            self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="png")
+            self._pending = collections.deque()
+            self._max_pending = 2 * threads  # Limita as faixas em memória
+            self._adler = zlib.adler32(b"")
+            # Cabeçalho zlib (deflate, janela de 32 KiB); os trechos são deflate puro
+            self._chunk(b"IDAT", b"\x78\x9c")
+        else:
+            self._compressor = zlib.compressobj(compress_level)
+            self._executor = None
+
+    def _chunk(self, kind, data):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+    @timed("encode")
+    def write_rows(self, rows):
+        """Comprime uma faixa de linhas (array HxLx3 uint8)."""
+        rows = np.ascontiguousarray(rows, dtype=np.uint8)
+        if rows.shape[1:] != (self.width, 3):
+            raise ValueError(f"Faixa com formato {rows.shape}, esperado (n, {self.width}, 3).")
+        # Cada linha do PNG começa com o byte do tipo de filtro (0 = nenhum)
+        filtered = np.empty((rows.shape[0], self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 0] = 0
+        filtered[:, 1:] = rows.reshape(rows.shape[0], -1)
+        self.rows_written += rows.shape[0]
+        if self._executor is None:
+            data = self._compressor.compress(filtered.tobytes())
+            if data:
+                self._chunk(b"IDAT", data)
+            return
+
+        raw = filtered.tobytes()
+        self._adler = zlib.adler32(raw, self._adler)
+        self._pending.append(self._executor.submit(self._deflate_part, raw, self.compress_level))
+        while len(self._pending) >= self._max_pending or (self._pending and self._pending[0].done()):
+            self._chunk(b"IDAT", self._pending.popleft().result())
+
+    def write_image(self, array, strip_height=256):
+        """Comprime uma imagem inteira (HxLx3), faixa por faixa."""
+        for y in range(0, array.shape[0], strip_height):
+            self.write_rows(array[y:y + strip_height])
+
+    @staticmethod
+    def _deflate_part(raw, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(raw) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    @timed("encode")
+    def close(self):
+        """Finaliza o fluxo comprimido e o arquivo."""
+        if self._file.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"Foram escritas {self.rows_written} de {self.height} linhas.")
+            if self._executor is None:
+                self._chunk(b"IDAT", self._compressor.flush())
+            else:
+                while self._pending:
+                    self._chunk(b"IDAT", self._pending.popleft().result())
+                # Bloco final vazio do deflate e a soma de verificação do fluxo zlib
+                final = zlib.compressobj(self.compress_level, zlib.DEFLATED, -zlib.MAX_WBITS).flush()
+                self._chunk(b"IDAT", final + struct.pack(">I", self._adler & 0xFFFFFFFF))
+            self._chunk(b"IEND", b"")
+        finally:
+            self._file.close()
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_size(text):
+    """Converte "800k", "2M", "1.5MB" ou "500000" em bytes (usado na linha de comando)."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([kKmMgG]?)[bB]?\s*", text)
+    if not match:
+        raise ValueError(f"Tamanho inválido: {text!r} (ex.: 800k, 2M).")
+    number, unit = match.groups()
+    return int(float(number) * {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[unit.lower()])
+
+
+@timed("encode")
+def _encode(image, options):
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+@timed("encode")
+def _save(image, path, options):
+    image.save(path, **options)
+
+
+class SizeProbe:
+    """Estima o tamanho do arquivo completo em cada qualidade codificando apenas uma
+    versão reduzida da imagem (lado maior PROBE_SIZE) e extrapolando pela razão de
+    pixels. A extrapolação erra conforme o conteúdo (ruído, texto fino) e o erro muda com
+    a qualidade, por isso ela é calibrada com os tamanhos reais das codificações
+    completas: a correção é interpolada entre as qualidades já medidas.
+    """
+
+    def __init__(self, image, fmt, settings):
+        self.fmt = fmt
+        self.settings = settings
+        self.probe = image
+        if max(image.size) > PROBE_SIZE:
+            scale = PROBE_SIZE / max(image.size)
+            self.probe = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))),
+                                      Image.Resampling.BOX)
+        self.pixel_ratio = (image.width * image.height) / float(self.probe.width * self.probe.height)
+        self._corrections = {}  # qualidade -> tamanho real / estimativa
+        self._sizes = {}
+
+    def _raw_estimate(self, quality):
+        if quality not in self._sizes:
+            self._sizes[quality] = len(_encode(self.probe, self.settings.save_options(self.fmt, quality)))
+        return self._sizes[quality] * self.pixel_ratio
+
+    def correction(self, quality):
+        if not self._corrections:
+            return 1.0
+        points = sorted(self._corrections)
+        if quality <= points[0]:
+            return self._corrections[points[0]]
+        if quality >= points[-1]:
+            return self._corrections[points[-1]]
+        upper = next(q for q in points if q >= quality)
+        lower = max(q for q in points if q <= quality)
+        if upper == lower:
+            return self._corrections[upper]
+        t = (quality - lower) / (upper - lower)
+        return self._corrections[lower] * (1 - t) + self._corrections[upper] * t
+
+    def estimate(self, quality):
+        return self._raw_estimate(quality) * self.correction(quality)
+
+    def calibrate(self, quality, actual_bytes):
+        """Registra o tamanho real obtido na qualidade `quality`."""
+        self._corrections[quality] = actual_bytes / self._raw_estimate(quality)
+
+    def best_quality(self, max_bytes, low, high):
+        """Busca binária da maior qualidade em [low, high] cuja estimativa cabe em
+        `max_bytes`; retorna `low` se nenhuma couber.
+        """
+        best = low
+        while low <= high:
+            quality = (low + high) // 2
+            if self.estimate(quality) <= max_bytes:
+                best, low = quality, quality + 1
+            else:
+                high = quality - 1
+        return best
+
+
+def _save_within(image, path, fmt, settings):
+    """Modo de tamanho máximo: a qualidade é procurada por busca binária nas estimativas
+    da SizeProbe e a imagem inteira é codificada uma vez nessa qualidade. Se o arquivo
+    passar do limite (ou ficar abaixo de FILL_TARGET dele), a SizeProbe é calibrada com o
+    tamanho real e há uma única correção. Se nem a correção couber, grava a qualidade
+    mínima. Retorna a qualidade gravada.
+    """
+    probe = SizeProbe(image, fmt, settings)
+    quality = probe.best_quality(settings.max_bytes, MIN_QUALITY, settings.quality)
+    data = _encode(image, settings.save_options(fmt, quality))
+    fits = len(data) <= settings.max_bytes
+
+    if fits and quality < settings.quality and len(data) < settings.max_bytes * FILL_TARGET:
+        probe.calibrate(quality, len(data))
+        higher = probe.best_quality(settings.max_bytes * FILL_TARGET, quality, settings.quality)
+        if higher > quality:
+            candidate = _encode(image, settings.save_options(fmt, higher))
+            if len(candidate) <= settings.max_bytes:
+                quality, data = higher, candidate
+    elif not fits and quality > MIN_QUALITY:
+        probe.calibrate(quality, len(data))
+        quality = probe.best_quality(settings.max_bytes, MIN_QUALITY, quality - 1)
+        data = _encode(image, settings.save_options(fmt, quality))
+        fits = len(data) <= settings.max_bytes
+
+    if not fits and quality > MIN_QUALITY:
+        # A correção também passou do limite: grava a menor saída possível
+        quality = MIN_QUALITY
+        data = _encode(image, settings.save_options(fmt, quality))
+    with open(path, "wb") as f:
+        f.write(data)
+    return quality
+
+
+@timed("encode")
+def save_jpeg_array(array, path, settings=None, strip_height=256):
+    """Grava um array RGB como JPEG sem criar uma imagem PIL, que teria uma cópia inteira
+    da imagem em memória: o array é convertido para BGR no próprio lugar, em faixas, e o
+    codificador do OpenCV lê as linhas direto dele. Serve para imagens finais num array
+    em disco (memmap, ver compositor.ArrayStripSink); o conteúdo de `array` fica em BGR.
+    Com as mesmas opções, o arquivo é igual ao do Pillow (ambos usam o libjpeg-turbo).
+    """
+    settings = settings or EncoderSettings()
+    for y in range(0, array.shape[0], strip_height):
+        strip = array[y:y + strip_height]
+        cv2.cvtColor(strip, cv2.COLOR_RGB2BGR, dst=strip)
+    params = [cv2.IMWRITE_JPEG_QUALITY, settings.quality,
+              cv2.IMWRITE_JPEG_OPTIMIZE, int(settings.optimize),
+              cv2.IMWRITE_JPEG_PROGRESSIVE, int(settings.progressive),
+              cv2.IMWRITE_JPEG_SAMPLING_FACTOR, getattr(cv2, _CV2_SAMPLING[settings.subsampling])]
+    ok, data = cv2.imencode(".jpg", array, params)
+    if not ok:
+        raise ValueError(f"Falha ao codificar {path} em JPEG.")
+    with open(path, "wb") as f:
+        data.tofile(f)
+    return settings.quality
+
+
+def save_image(image, path, settings=None):
+    """Grava uma imagem PIL em `path` com as opções de `settings` (EncoderSettings).
+
+    PNG com mais de uma thread usa o PngStripWriter paralelo. Com `max_bytes`, a
+    qualidade é procurada na imagem reduzida (ver _save_within). Retorna a qualidade
+    usada (ou None para formatos sem qualidade).
+    """
+    settings = settings or EncoderSettings()
+    fmt = settings.format_for(path)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    if settings.max_bytes is None:
+        if fmt == "png" and settings.threads > 1:
+            with PngStripWriter(path, image.width, image.height, settings.compress_level, settings.threads) as writer:
+                writer.write_image(np.asarray(image.convert("RGB")))
+            return None
+        _save(image, path, settings.save_options(fmt))
+        return settings.quality if fmt in LOSSY_FORMATS else None
+
+    settings.check_output(path)
+    return _save_within(image, path, fmt, settings)
+
+
+@timed("encode")
+def save_pages(pages, path, settings=None):
+    """Grava várias imagens PIL como páginas de um único arquivo TIFF ou PDF."""
+    settings = settings or EncoderSettings()
+    fmt = settings.format_for(path)
+    if fmt not in MULTIPAGE_FORMATS:
+        raise ValueError(f"{fmt.upper()} não aceita várias páginas; use {' ou '.join(f.upper() for f in MULTIPAGE_FORMATS)}.")
+    pages = [page if page.mode in ("RGB", "L") else page.convert("RGB") for page in pages]
+    pages[0].save(path, save_all=True, append_images=pages[1:], **settings.save_options(fmt))
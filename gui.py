@@ -1,21 +1,60 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
 from image_processing import ImageProcessor
-from corner_detection import CornerDetector
+from corner_detection import PROFILES, CornerDetector
+from processing_cache import CACHE_PAGES_ENV, ProcessingCache, user_cache_dir
+from async_jobs import JobRunner
+from encoder import EncoderSettings, save_image
+from resampling import get_resampler
+from page_graph import CompositeGraph, PageGraph
+from lazy_import import LazyModule
+from metrics import METRICS, METRICS_FILE_ENV
+import math
 import os
-import cv2
-import numpy as np
+import sys
+import threading
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+# Altura da prévia da junção, atualizada ao vivo enquanto os cantos são arrastados
+LIVE_PREVIEW_HEIGHT = 180
+
+# Lado máximo da cópia reduzida de cada imagem usada na prévia da junção
+LIVE_SOURCE_SIDE = 512
+
+# Quantos bitmaps de exibição (um por tamanho do canvas) cada canvas mantém
+PHOTO_CACHE_SIZE = 2
 
 class ImageCanvas(tk.Canvas):
-    """Widget de Canvas para exibir e manipular imagens, incluindo pontos de controle."""
+    """Widget de Canvas para exibir e manipular imagens, incluindo pontos de controle.
+
+    A exibição usa uma prévia reduzida (proxy) da imagem; os pixels em resolução
+    total só são decodificados na correção de perspectiva (get_corrected_image), que
+    aplica rotação, perspectiva e redimensionamento numa única transformação.
+    """
     def __init__(self, master, **kwargs):
         super().__init__(master, **kwargs)
-        self.img = None
+        self.img = None      # Imagem original em resolução total (decodificada sob demanda)
+        self._img_lock = threading.Lock()  # Serializa a decodificação de self.img entre os jobs
+        self.preview = None  # Prévia reduzida, já rotacionada, usada para exibição e detecção
+        self.rotation = 0    # Rotação acumulada (graus, anti-horário) a aplicar em self.img
         self.tk_img = None
+        self._photo_cache = {}  # PhotoImage por tamanho de exibição, os mais recentes por último
         self.relative_points = None  # Pontos relativos (0 a 1) para a imagem
         self.active_point = None
         self.enhance_on_load = False
+        self.enhanced = False  # Se a imagem atual foi carregada com melhoria de legibilidade
+        self.cache = None  # ProcessingCache opcional, definido pela aplicação
+        self.cache_pages = False  # Se as páginas corrigidas também vão para o cache (além dos cantos)
+        self.detector_profile = PROFILES["gui"]  # DetectorProfile da detecção automática
+        self.display_resampler = get_resampler("gui_preview")  # Redimensionamento da exibição
+        self.jobs = None  # JobRunner para as operações pesadas, definido pela aplicação
+        self._generation = 0  # Muda a cada imagem carregada, para descartar resultados antigos
+        # Página em baixa resolução para a prévia da junção; só refaz as etapas alteradas
+        self.page_graph = PageGraph(height=LIVE_PREVIEW_HEIGHT, resampler="batch")
+        self.on_change = None  # Chamado com o canvas quando a página corrigida muda
 
         # Binds de eventos do mouse
         self.bind("<Button-1>", self._on_click)
@@ -26,22 +65,133 @@ class ImageCanvas(tk.Canvas):
     #salva caminho da imagem selecionada
     def load_image(self, path): 
         try:
-            self.img = Image.open(path)
+            self.img = Image.open(path) # Apenas lê o cabeçalho; a decodificação fica para a correção
             self.image_path = path # Armazena o caminho da imagem
-            if self.enhance_on_load:
-                self.img = ImageProcessor.enhance_image_readability(self.img)
+            self._generation += 1
+            self.rotation = 0
+            self.enhanced = False
+            # Decodifica apenas uma versão do tamanho da tela (modo draft para JPEG)
+            self.preview = Image.open(path)
+            self.preview.draft("RGB", self._preview_size())
+            self.preview.thumbnail(self._preview_size(), Image.Resampling.LANCZOS)
+            self._photo_cache.clear()
             # Inicializa os pontos para cobrir a imagem inteira
             self.relative_points = [(0, 0), (1, 0), (1, 1), (0, 1)]
+            source = self.preview.copy()
+            source.thumbnail((LIVE_SOURCE_SIDE, LIVE_SOURCE_SIDE), Image.Resampling.BILINEAR)
+            self.page_graph.set_source(source.convert("RGB"))
             self.redraw()
+            self._page_changed()
         except Exception as e:
             messagebox.showerror("Erro ao carregar imagem", f"Não foi possível carregar a imagem: {e}")
+            return
+
+        if self.enhance_on_load:
+            # A melhoria usa a resolução total: roda em segundo plano e a prévia é trocada ao final
+            img, generation = self.img, self._generation
+
+            def enhance(job):
+                job.progress(0, "Melhorando legibilidade...")
+                return self._cached_page({"enhance": True},
+                                         lambda: ImageProcessor.enhance_image_readability(self._load_pixels(img)), path)
+
+            def done(enhanced):
+                if generation != self._generation or self.rotation != 0:
+                    return  # Outra imagem foi carregada ou a atual foi rotacionada nesse meio-tempo
+                self.img = enhanced
+                self.enhanced = True
+                self.preview = enhanced.copy()
+                self.preview.thumbnail(self._preview_size(), Image.Resampling.LANCZOS)
+                self._photo_cache.clear()
+                self.redraw()
+                self._page_changed()
+
+            self._run("Melhorar legibilidade", enhance, done,
+                      lambda e: messagebox.showerror("Erro ao carregar imagem", f"Não foi possível melhorar a imagem: {e}"))
+
+    def _load_pixels(self, img):
+        """Decodifica `img` (aberta sob demanda) antes de um job usá-la. Image.load não é
+        thread-safe e a melhoria e a junção podem pedir a mesma imagem ao mesmo tempo:
+        o primeiro job decodifica e os demais esperam e reaproveitam os pixels.
+        """
+        with self._img_lock:
+            img.load()
+        return img
+
+    def _run(self, description, fn, on_done, on_error):
+        """Executa `fn(job)` em segundo plano pelo JobRunner (ou direto, se não houver um)."""
+        if self.jobs is not None:
+            return self.jobs.submit(description, fn, on_done=on_done, on_error=on_error)
+
+        class _InlineJob:
+            def progress(self, fraction, message=None): pass
+            def check(self): pass
+        try:
+            result = fn(_InlineJob())
+        except Exception as e:
+            on_error(e)
+        else:
+            on_done(result)
+
+    def _page_changed(self):
+        """Passa o estado atual (rotação, cantos, melhoria) para o grafo da página e avisa
+        a aplicação. Entradas iguais às anteriores não invalidam nada.
+        """
+        if self.img is None or self.relative_points is None or len(self.relative_points) != 4:
+            return
+        # A prévia usa a imagem original reduzida; a melhoria entra depois da correção
+        if self.page_graph.update(rotation=self.rotation, quad=self.relative_points, enhance=self.enhanced):
+            if self.on_change is not None:
+                self.on_change(self)
+
+    def _processing_params(self):
+        """Parâmetros que, junto com o arquivo, definem o resultado guardado no cache."""
+        return {"rotation": self.rotation, "enhance": self.enhanced}
+
+    def _cached_page(self, params, compute, path=None):
+        """Busca a imagem no cache ou a calcula com `compute` e a guarda."""
+        if self.cache is None or not self.cache_pages:
+            return compute()
+        path = path or self.image_path
+        page = self.cache.get_page(path, params)
+        if page is None:
+            page = compute()
+            try:
+                self.cache.put_page(path, params, page)
+            except OSError:
+                pass  # Disco cheio ou pasta sem permissão: segue sem guardar a página
+        return page
+
+    def _preview_size(self):
+        """Tamanho máximo da prévia: o da tela, suficiente para qualquer tamanho do canvas."""
+        return (self.winfo_screenwidth(), self.winfo_screenheight())
 
     def rotate_image(self, angle):
-        """Rotaciona a imagem pelo ângulo especificado."""
+        """Rotaciona a imagem pelo ângulo especificado.
+        Apenas a prévia é rotacionada; na imagem original a rotação entra na
+        homografia da correção de perspectiva.
+        """
         if self.img:
-            self.img = self.img.rotate(angle, expand=True)
+            self.rotation = (self.rotation + angle) % 360
+            self.preview = self.preview.rotate(angle, expand=True)
+            self._photo_cache.clear()
             self.relative_points = [(0, 0), (1, 0), (1, 1), (0, 1)] # Reinicia pontos após rotação
             self.redraw()
+            self._page_changed()
+
+    def _display_geometry(self):
+        """Retorna o tamanho da imagem exibida e seu deslocamento no canvas."""
+        cw, ch = self.winfo_width(), self.winfo_height()
+        iw, ih = self.preview.size
+        scale = min(cw/iw, ch/ih)
+        new_size = (max(1, int(iw*scale)), max(1, int(ih*scale)))
+        x_offset = (cw - new_size[0]) // 2
+        y_offset = (ch - new_size[1]) // 2
+        return new_size, x_offset, y_offset
+
+    def _display_points(self, new_size, x_offset, y_offset):
+        """Converte os pontos relativos em coordenadas do canvas."""
+        return [(x_offset + rx * new_size[0], y_offset + ry * new_size[1]) for rx, ry in self.relative_points]
 
     def redraw(self):
         """Redesenha a imagem e os pontos de controle no canvas."""
@@ -51,48 +201,60 @@ class ImageCanvas(tk.Canvas):
         cw, ch = self.winfo_width(), self.winfo_height()
         if cw < 1 or ch < 1: return
 
-        iw, ih = self.img.size
-        scale = min(cw/iw, ch/ih)
-        new_size = (int(iw*scale), int(ih*scale))
-        
-        resized = self.img.resize(new_size, Image.Resampling.LANCZOS)
-        self.tk_img = ImageTk.PhotoImage(resized)
+        new_size, x_offset, y_offset = self._display_geometry()
+
+        # Reaproveita o bitmap se o canvas foi exibido neste tamanho há pouco. Só os
+        # PHOTO_CACHE_SIZE mais recentes são mantidos: redimensionar a janela arrastando
+        # passaria por dezenas de tamanhos
+        self.tk_img = self._photo_cache.pop(new_size, None)
+        if self.tk_img is None:
+            resized = self.display_resampler.resize(self.preview, new_size)
+            self.tk_img = ImageTk.PhotoImage(resized)
+        self._photo_cache[new_size] = self.tk_img
+        while len(self._photo_cache) > PHOTO_CACHE_SIZE:
+            del self._photo_cache[next(iter(self._photo_cache))]
 
-        x_offset = (cw - new_size[0]) // 2
-        y_offset = (ch - new_size[1]) // 2
         self.create_image(x_offset, y_offset, anchor=tk.NW, image=self.tk_img)
 
         if self.relative_points:
-            points_display = []
-            for rx, ry in self.relative_points:
-                x = x_offset + rx * new_size[0]
-                y = y_offset + ry * new_size[1]
-                points_display.append((x, y))
-                self.create_oval(x-5, y-5, x+5, y+5, fill="red", outline="white", width=1) # Desenha pontos
+            points_display = self._display_points(new_size, x_offset, y_offset)
+            for idx, (x, y) in enumerate(points_display):
+                self.create_oval(x-5, y-5, x+5, y+5, fill="red", outline="white", width=1, tags=("handle", f"handle{idx}")) # Desenha pontos
             if len(points_display) == 4:
                 self.create_polygon(points_display, outline="red", width=2, fill="", tags="selection_polygon") # Desenha polígono
 
+    def _update_overlay(self):
+        """Move apenas os pontos e o polígono, sem recriar o bitmap da imagem."""
+        points_display = self._display_points(*self._display_geometry())
+        for idx, (x, y) in enumerate(points_display):
+            self.coords(f"handle{idx}", x-5, y-5, x+5, y+5)
+        if len(points_display) == 4:
+            self.coords("selection_polygon", *[c for p in points_display for c in p])
+
     def get_absolute_points(self):
-        """Converte pontos relativos para coordenadas absolutas na imagem original.""" 
+        """Converte pontos relativos para coordenadas absolutas na imagem original (rotacionada).""" 
         if self.img is None or self.relative_points is None: return None
-        iw, ih = self.img.size
+        iw, ih = self._rotated_size()
         return [(rx * iw, ry * ih) for rx, ry in self.relative_points]
 
+    def _rotated_size(self):
+        """Tamanho da imagem original após a rotação acumulada, sem rotacioná-la."""
+        iw, ih = self.img.size
+        if self.rotation % 180 == 90:
+            return ih, iw
+        if self.rotation % 180 == 0:
+            return iw, ih
+        rad = math.radians(self.rotation)
+        cos, sin = abs(math.cos(rad)), abs(math.sin(rad))
+        return math.ceil(iw * cos + ih * sin), math.ceil(iw * sin + ih * cos)
+
     def _on_click(self, event):
         """Manipula o clique do mouse para selecionar um ponto de controle."""
         if self.img is None or self.relative_points is None: return
-        cw, ch = self.winfo_width(), self.winfo_height()
-        iw, ih = self.img.size
-        scale = min(cw/iw, ch/ih)
-        new_size = (int(iw*scale), int(ih*scale))
-        x_offset = (cw - new_size[0]) // 2
-        y_offset = (ch - new_size[1]) // 2
 
         min_dist_sq = float("inf")
         closest_point_idx = -1
-        for idx, (rx, ry) in enumerate(self.relative_points):
-            x = x_offset + rx * new_size[0]
-            y = y_offset + ry * new_size[1]
+        for idx, (x, y) in enumerate(self._display_points(*self._display_geometry())):
             dist_sq = (event.x - x) ** 2 + (event.y - y) ** 2
             if dist_sq < min_dist_sq:
                 min_dist_sq = dist_sq
@@ -104,12 +266,7 @@ class ImageCanvas(tk.Canvas):
     def _on_drag(self, event):
         """Manipula o arrastar do mouse para mover um ponto de controle."""
         if self.active_point is None or self.img is None: return
-        cw, ch = self.winfo_width(), self.winfo_height()
-        iw, ih = self.img.size
-        scale = min(cw/iw, ch/ih)
-        new_size = (int(iw*scale), int(ih*scale))
-        x_offset = (cw - new_size[0]) // 2
-        y_offset = (ch - new_size[1]) // 2
+        new_size, x_offset, y_offset = self._display_geometry()
 
         rx = (event.x - x_offset) / new_size[0]
         ry = (event.y - y_offset) / new_size[1]
@@ -117,22 +274,42 @@ class ImageCanvas(tk.Canvas):
         ry = max(0.0, min(ry, 1.0))
         
         self.relative_points[self.active_point] = (rx, ry)
-        self.redraw()
+        self._update_overlay()
+        self._page_changed()
 
     def _on_release(self, event):
         """Manipula a liberação do mouse."""
         self.active_point = None
 
-    def get_corrected_image(self):
-        """Retorna a imagem com a perspectiva corrigida com base nos pontos de controle."""
-        if self.img is None or self.relative_points is None or len(self.relative_points) != 4:
-            return self.img
+    def get_corrected_image(self, target_height=None):
+        """Retorna a imagem com a perspectiva corrigida com base nos pontos de controle.
+        Se `target_height` for informado, a imagem já sai redimensionada para essa altura.
+        """
+        return self.correction_task()(target_height)
+
+    def correction_task(self):
+        """Captura o estado atual (imagem, rotação, pontos) e retorna uma função
+        `corrigir(target_height=None)` que pode rodar em outra thread, mesmo que o
+        usuário continue editando o canvas.
+        """
+        img, path, rotation = self.img, self.image_path, self.rotation
+        if img is None or self.relative_points is None or len(self.relative_points) != 4:
+            def uncorrected(target_height=None):
+                if img is None:
+                    return None
+                return self._load_pixels(img) if rotation == 0 else self._load_pixels(img).rotate(rotation, expand=True)
+            return uncorrected
         abs_pts = self.get_absolute_points()
-        try:
-            return ImageProcessor.four_point_transform(self.img, abs_pts)
-        except Exception as e:
-            messagebox.showerror("Erro na transformação", f"Erro na transformação de perspectiva: {e}")
-            return self.img
+        base_params = dict(self._processing_params(), points=[[round(c, 5) for c in p] for p in self.relative_points])
+
+        def correct(target_height=None):
+            # Rotação, perspectiva e altura final num único warpPerspective sobre a imagem original.
+            # Com o resultado no cache, a imagem original nem chega a ser decodificada.
+            # É a página da imagem salva: usa o nível de reamostragem da exportação.
+            params = dict(base_params, height=target_height, resampler="gui_export")
+            return self._cached_page(params, lambda: ImageProcessor.warp_composed(
+                self._load_pixels(img), abs_pts, rotation, target_height=target_height, resampler="gui_export"), path)
+        return correct
 
     def _on_configure(self, event):
         """Redesenha o canvas quando seu tamanho é alterado."""
@@ -140,19 +317,40 @@ class ImageCanvas(tk.Canvas):
             self.redraw()
 
     def auto_detect_corners(self):
-        """Tenta detectar e definir automaticamente os cantos do documento."""
+        """Tenta detectar e definir automaticamente os cantos do documento, em segundo plano.
+        A detecção trabalha em 800 px de largura, então usa a prévia em vez da imagem original.
+        """
         if self.img is None:
             messagebox.showwarning("Detecção Automática", "Carregue uma imagem primeiro para usar a detecção automática.")
             return
-        try:
-            detected_corners = CornerDetector.find_document_corners(self.img)
-            iw, ih = self.img.size
-            self.relative_points = [
-                (p[0] / iw, p[1] / ih) for p in detected_corners
-            ]
+        preview, path, cache, profile = self.preview, self.image_path, self.cache, self.detector_profile
+        state = (self._generation, self.rotation, self.enhanced)
+        params = dict(self._processing_params(), detector="classic", **profile.params())
+
+        def detect(job):
+            job.progress(0, "Detectando cantos...")
+            cached = cache.get_corners(path, params) if cache else None
+            if cached is not None:
+                return [tuple(p) for p in cached.tolist()]
+            detected_corners = CornerDetector.find_document_corners(preview, profile=profile)
+            iw, ih = preview.size
+            points = [(p[0] / iw, p[1] / ih) for p in detected_corners]
+            if cache:
+                try:
+                    cache.put_corners(path, params, points)
+                except OSError:
+                    pass  # Cache cheio ou sem permissão: a detecção vale do mesmo jeito
+            return points
+
+        def done(points):
+            if state != (self._generation, self.rotation, self.enhanced):
+                return  # A imagem mudou enquanto a detecção rodava
+            self.relative_points = points
             self.redraw()
-        except Exception as e:
-            messagebox.showerror("Erro na Detecção Automática", f"Não foi possível detectar os cantos automaticamente: {e}")
+            self._page_changed()
+
+        return self._run("Detectar cantos", detect, done,
+                         lambda e: messagebox.showerror("Erro na Detecção Automática", f"Não foi possível detectar os cantos automaticamente: {e}"))
 
 class ImageMergerApp:
     """Classe principal da aplicação Tkinter para juntar e corrigir imagens."""
@@ -160,8 +358,30 @@ class ImageMergerApp:
         self.root = root
         self.root.title("Juntar e Corrigir Imagens")
 
+        # Cache dos cantos detectados na pasta de cache do usuário; as páginas corrigidas
+        # só são guardadas com JUNTAR_CACHE_PAGES=1. Sem pasta gravável, segue sem cache
+        try:
+            self.cache = ProcessingCache(user_cache_dir())
+        except OSError:
+            self.cache = None
+        self.cache_pages = bool(os.environ.get(CACHE_PAGES_ENV))
+        # Formato escolhido pela extensão do arquivo; PNG com compressão rápida
+        self.encoder = EncoderSettings(quality=90, compress_level=3, threads=2)
+
         # Configuração da interface
         self._setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _on_close(self):
+        """Cancela os jobs em andamento, grava as métricas (se ligadas) e fecha a janela."""
+        self.jobs.shutdown()
+        if METRICS.enabled:
+            path = os.environ.get(METRICS_FILE_ENV) or os.path.join(user_cache_dir(), "metricas.jsonl")
+            try:
+                METRICS.write(path)
+            except OSError as e:
+                print(f"Não foi possível gravar as métricas em {path}: {e}", file=sys.stderr)
+        self.root.destroy()
 
     def _setup_ui(self):
         """Configura os elementos da interface do usuário."""
@@ -174,6 +394,23 @@ class ImageMergerApp:
         self.canvas2 = ImageCanvas(self.canvas_frame, bg="lightgray")
         self.canvas2.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=2, pady=2)
 
+        # Operações pesadas rodam em threads; o progresso aparece na barra de status
+        self.jobs = JobRunner(self.root, on_progress=self._on_job_progress, on_idle=self._on_jobs_idle)
+        self.merge_job = None
+        for canvas in (self.canvas1, self.canvas2):
+            canvas.cache = self.cache
+            canvas.cache_pages = self.cache_pages
+            canvas.jobs = self.jobs
+            canvas.on_change = self._schedule_live_preview
+
+        # Prévia da junção em baixa resolução: ao mover um canto, só a página alterada é
+        # corrigida de novo e a outra é reaproveitada do grafo
+        self.live_graph = CompositeGraph([self.canvas1.page_graph, self.canvas2.page_graph], resampler="gui_preview")
+        self._live_preview_pending = False
+        self.live_preview = tk.Label(self.root, text="Prévia da junção", height=1, bg="lightgray")
+        self.live_preview.pack(fill=tk.X, padx=5)
+        self.live_tk_img = None
+
         self.controls = tk.Frame(self.root, bd=2, relief=tk.RAISED)
         self.controls.pack(pady=10, padx=5, fill=tk.X)
 
@@ -191,8 +428,11 @@ class ImageMergerApp:
         tk.Button(self.controls, text="Rot. Direita", command=lambda: self.canvas2.rotate_image(-90)).grid(row=1, column=5, padx=5, pady=2)
         tk.Button(self.controls, text="Detectar Cantos", command=lambda: self.canvas2.auto_detect_corners()).grid(row=2, column=3, columnspan=3, pady=5)
 
+        # Detecção nas duas imagens ao mesmo tempo
+        tk.Button(self.controls, text="Detectar Cantos nas Duas", command=self.detect_all_corners).grid(row=3, column=0, columnspan=6, pady=5)
+
         # Botão de Juntar Imagens
-        tk.Button(self.controls, text="Juntar Imagens", command=self.merge_images, bg="#4CAF50", fg="white", font=("Arial", 10, "bold")).grid(row=3, column=0, columnspan=6, pady=10)
+        tk.Button(self.controls, text="Juntar Imagens", command=self.merge_images, bg="#4CAF50", fg="white", font=("Arial", 10, "bold")).grid(row=5, column=0, columnspan=6, pady=10)
 
         # Checkbox para melhoria de imagem
         self.enhance_var = tk.BooleanVar(value=False)
@@ -202,6 +442,63 @@ class ImageMergerApp:
         for i in range(6):
             self.controls.grid_columnconfigure(i, weight=1)
 
+        # Barra de status: progresso das tarefas em segundo plano e cancelamento
+        self.status = tk.Frame(self.root)
+        self.status.pack(fill=tk.X, padx=5, pady=(0, 5))
+        self.status_label = tk.Label(self.status, text="Pronto", anchor=tk.W)
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = tk.Button(self.status, text="Cancelar", command=self.jobs.cancel_all, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT)
+        self.progress = ttk.Progressbar(self.status, length=200, maximum=1.0)
+        self.progress.pack(side=tk.RIGHT, padx=5)
+
+    def _schedule_live_preview(self, canvas=None):
+        """Agenda a atualização da prévia da junção; vários eventos de arrasto seguidos
+        viram uma única atualização quando o Tk fica ocioso.
+        """
+        if not self._live_preview_pending:
+            self._live_preview_pending = True
+            self.root.after_idle(self._update_live_preview)
+
+    def _update_live_preview(self):
+        """Mostra a junção das duas páginas em baixa resolução."""
+        self._live_preview_pending = False
+        if not self.live_graph.ready:
+            return
+        try:
+            merged = self.live_graph.image()
+        except (ValueError, np.linalg.LinAlgError, cv2.error):
+            # Cantos degenerados durante o arrasto: mantém a prévia anterior. Os demais
+            # erros chegam ao report_callback_exception do Tk, como em qualquer callback.
+            return
+        h, w = merged.shape[:2]
+        max_width = max(1, self.live_preview.winfo_width() - 4)
+        image = Image.fromarray(merged)
+        if w > max_width:
+            image = self.canvas1.display_resampler.resize(image, (max_width, max(1, h * max_width // w)))
+        self.live_tk_img = ImageTk.PhotoImage(image)
+        self.live_preview.config(image=self.live_tk_img, text="", height=LIVE_PREVIEW_HEIGHT)
+
+    def _on_job_progress(self, job, fraction, message):
+        """Atualiza a barra de status com o progresso de um job."""
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress["value"] = fraction
+        self.status_label.config(text=message or job.description)
+
+    def _on_jobs_idle(self):
+        """Volta a barra de status ao estado de repouso quando os jobs terminam."""
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress["value"] = 0
+        self.status_label.config(text="Pronto")
+
+    def detect_all_corners(self):
+        """Detecta os cantos das duas imagens em paralelo."""
+        if self.canvas1.img is None or self.canvas2.img is None:
+            messagebox.showwarning("Detecção Automática", "Carregue as duas imagens para detectar os cantos de ambas.")
+            return
+        self.canvas1.auto_detect_corners()
+        self.canvas2.auto_detect_corners()
+
     def _toggle_image_enhancement(self):
         """Ativa/desativa a melhoria de legibilidade ao carregar imagens."""
         state = self.enhance_var.get()
@@ -228,144 +525,72 @@ class ImageMergerApp:
 
       #Atualização pasta/caminho
     def merge_images(self):
+        """Pergunta onde salvar e junta as imagens em segundo plano; retorna imediatamente."""
         if self.canvas1.img is None or self.canvas2.img is None:
             messagebox.showwarning("Erro", "Selecione e carregue ambas as imagens antes de juntar!")
             return
+        if self.merge_job is not None:
+            messagebox.showwarning("Juntar Imagens", "A junção anterior ainda está em andamento.")
+            return
 
-        try:
-            corrected1 = self.canvas1.get_corrected_image()
-            corrected2 = self.canvas2.get_corrected_image()
-
-            # Redimensiona a segunda imagem para a altura da primeira
-            if corrected1.height != corrected2.height:
-                corrected2 = corrected2.resize((int(corrected2.width * corrected1.height / corrected2.height), corrected1.height), Image.Resampling.LANCZOS)
-
-            # Cria uma nova imagem para a fusão
-            merged_width = corrected1.width + corrected2.width
-            merged_height = corrected1.height
-            merged_image = Image.new("RGB", (merged_width, merged_height))
-
-            # Cola as imagens
-            merged_image.paste(corrected1, (0, 0))
-            merged_image.paste(corrected2, (corrected1.width, 0))
-
-            # Define o diretório base de salvamento como 'resultado' na pasta do script
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            base_output_dir = os.path.join(script_dir, "resultado")
-            os.makedirs(base_output_dir, exist_ok=True)
-
-            # Obtém o diretório da primeira imagem carregada
-            # Assume que self.canvas1.image_path armazena o caminho completo da imagem
-            if hasattr(self.canvas1, 'image_path') and self.canvas1.image_path:
-                # Extrai o nome do diretório pai da imagem (ex: 'Teste' de 'Teste/batata.png')
-                image_source_dir_name = os.path.basename(os.path.dirname(self.canvas1.image_path))
-                output_dir = os.path.join(base_output_dir, image_source_dir_name)
-            else:
-                # Se o caminho da imagem não estiver disponível, salva diretamente em 'resultado'
-                output_dir = base_output_dir
-            
-            os.makedirs(output_dir, exist_ok=True)
-
-            # Pergunta ao usuário apenas o nome e tipo do arquivo, com o diretório inicial correto
-            save_name = filedialog.asksaveasfilename(initialdir=output_dir, defaultextension=".jpg", filetypes=[
-                ("JPEG", "*.jpg"),
-                ("PNG", "*.png"),
-                ("Todos os arquivos", "*.*")
-            ])
-            
-            if save_name:
-                merged_image.save(save_name)
-                messagebox.showinfo("Sucesso", f"Imagem salva em {save_name}")
+        # Define o diretório base de salvamento como 'resultado' na pasta do script
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        base_output_dir = os.path.join(script_dir, "resultado")
+        os.makedirs(base_output_dir, exist_ok=True)
+
+        # Obtém o diretório da primeira imagem carregada
+        # Assume que self.canvas1.image_path armazena o caminho completo da imagem
+        if hasattr(self.canvas1, 'image_path') and self.canvas1.image_path:
+            # Extrai o nome do diretório pai da imagem (ex: 'Teste' de 'Teste/batata.png')
+            image_source_dir_name = os.path.basename(os.path.dirname(self.canvas1.image_path))
+            output_dir = os.path.join(base_output_dir, image_source_dir_name)
+        else:
+            # Se o caminho da imagem não estiver disponível, salva diretamente em 'resultado'
+            output_dir = base_output_dir
+        
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Pergunta ao usuário apenas o nome e tipo do arquivo, com o diretório inicial correto.
+        # O diálogo vem antes do processamento, que então roda inteiro em segundo plano.
+        save_name = filedialog.asksaveasfilename(initialdir=output_dir, defaultextension=".jpg", filetypes=[
+            ("JPEG", "*.jpg"),
+            ("PNG", "*.png"),
+            ("WebP", "*.webp"),
+            ("TIFF", "*.tif"),
+            ("PDF", "*.pdf"),
+            ("Todos os arquivos", "*.*")
+        ])
+        if not save_name:
+            return
 
-        except Exception as e:
+        correct1 = self.canvas1.correction_task()
+        correct2 = self.canvas2.correction_task()
+
+        def merge(job):
+            job.progress(0.05, "Corrigindo a imagem 1...")
+            corrected1 = correct1()
+            job.check()
+            job.progress(0.4, "Corrigindo a imagem 2...")
+            corrected2 = correct2(target_height=corrected1.height)
+            job.check()
+
+            # Junta as imagens lado a lado, com a segunda na altura da primeira
+            job.progress(0.7, "Juntando as imagens...")
+            merged_image = ImageProcessor.merge_side_by_side([corrected1, corrected2], resampler="gui_export")
+            job.check()
+            job.progress(0.85, "Salvando...")
+            save_image(merged_image, save_name, self.encoder)
+            return save_name
+
+        def finished():
+            self.merge_job = None
+
+        def done(path):
+            finished()
+            messagebox.showinfo("Sucesso", f"Imagem salva em {path}")
+
+        def failed(e):
+            finished()
             messagebox.showerror("Erro ao juntar imagens", f"Ocorreu um erro ao juntar as imagens: {e}")
 
-class CornerDetector:
-    """Classe para encapsular a lógica de detecção de cantos de documentos."""
-
-    @staticmethod
-    def find_document_corners(image):
-        """Tenta detectar automaticamente os 4 cantos de um documento em uma imagem.
-        Retorna os 4 pontos ordenados (top-left, top-right, bottom-right, bottom-left)
-        ou os cantos da imagem inteira se nenhum documento for encontrado.
-        """
-        img_np = np.array(image.convert("RGB"))
-        img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-
-        # Redimensiona para processamento mais rápido, mantendo a proporção
-        ratio = image.width / 800.0 
-        resized = cv2.resize(img_cv, (800, int(image.height / ratio)))
-
-        # Converter para LAB e aplicar CLAHE para realce de contraste
-        lab = cv2.cvtColor(resized, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-        cl = clahe.apply(l)
-        merged = cv2.merge((cl, a, b))
-        contrast_enhanced = cv2.cvtColor(merged, cv2.COLOR_LAB2BGR)
-
-        # Converter para escala de cinza
-        gray = cv2.cvtColor(contrast_enhanced, cv2.COLOR_BGR2GRAY)
-
-        # Aplicar desfoque leve
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-
-        # Detecção de bordas
-                # Detecção de bordas
-        # Detecção de bordas
-                # Detecção de bordas
-        edged = cv2.Canny(blurred, 75, 200)
-
-        # --- Adição para fechar brechas nas bordas ---
-        kernel = np.ones((5,5),np.uint8)
-        closed_edges = cv2.morphologyEx(edged, cv2.MORPH_CLOSE, kernel)
-        # --------------------------------------------------
-
-        # --- Adição para salvar a imagem intermediária (closed_edges) ---
-        debug_dir = "./debug_images"
-        os.makedirs(debug_dir, exist_ok=True)
-        debug_image_path_closed = os.path.join(debug_dir, "closed_edges_image.jpg")
-        cv2.imwrite(debug_image_path_closed, closed_edges)
-        print(f"Imagem de bordas fechadas salva em: {debug_image_path_closed}")
-        # --------------------------------------------------
-
-        # Encontra contornos na imagem com bordas fechadas
-        contours, _ = cv2.findContours(closed_edges.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        # Ordena os contornos por área em ordem decrescente e pega os 10 maiores
-        contours = sorted(contours, key=cv2.contourArea, reverse=True)[:10]
-
-        screenCnt = None
-        # Itera sobre os contornos encontrados
-        for c in contours:
-            # Calcula o perímetro do contorno
-            peri = cv2.arcLength(c, True)
-            # Aproxima o contorno por um polígono com menos vértices
-            approx = cv2.approxPolyDP(c, 0.02 * peri, True)
-
-            # Verifica se o polígono tem 4 vértices (um retângulo)
-            # e se a área é significativa (pelo menos 10% da área da imagem redimensionada)
-            area = cv2.contourArea(c)
-            if len(approx) == 4 and area > (resized.shape[0] * resized.shape[1] * 0.1):
-                # Calcula o aspect ratio do contorno
-                x, y, w, h = cv2.boundingRect(approx)
-                aspect_ratio = float(w)/h
-                # Verifica se o aspect ratio está dentro de uma faixa razoável para documentos
-                if 0.4 < aspect_ratio < 2.5: 
-                    screenCnt = approx
-                    break # Encontrou o contorno do documento, pode parar
-
-        if screenCnt is not None:
-            # Se um contorno de documento foi encontrado, ordena seus pontos e redimensiona de volta
-            # para as coordenadas da imagem original
-            return ImageProcessor.order_points(screenCnt.reshape(4, 2) * ratio)
-
-        # Se nenhum contorno de documento for encontrado, retorna os cantos da imagem inteira
-        h, w = image.height, image.width
-        return np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32")
-
-
-root = tk.Tk()
-app = ImageMergerApp(root)
-root.mainloop()
-
-
+        self.merge_job = self.jobs.submit("Juntar imagens", merge, on_done=done, on_error=failed, on_cancel=finished)
@@ -1,6 +1,20 @@
-import cv2
-import numpy as np
-from PIL import Image
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_import import LazyModule
+from metrics import timed
+from resampling import get_resampler
+
+# Importados na primeira operação sobre pixels (ver lazy_import.py)
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+# A partir deste número de pixels a melhoria de legibilidade é feita em faixas
+ENHANCE_BANDED_MIN_PIXELS = 4_000_000
+
+# Linhas extras em cada lado da faixa: o raio do desfoque Gaussiano 7x7
+_BLUR_HALO = 3
 
 class ImageProcessor:
     """Classe para encapsular funções de processamento de imagem."""
@@ -21,13 +35,71 @@ class ImageProcessor:
         return ordered
 
     @staticmethod
-    def four_point_transform(image, pts):
-        """Aplica uma transformação de perspectiva em uma imagem.
-        Recebe uma imagem PIL e 4 pontos (x,y) que definem a região a ser transformada.
+    def order_points_batch(quads):
+        """Versão vetorizada de order_points para muitos quadriláteros de uma vez.
+        Recebe um array (N,4,2) e retorna (N,4,2) float32 na ordem TL, TR, BR, BL.
         """
-        image_np = np.array(image) if isinstance(image, Image.Image) else image
-        rect = ImageProcessor.order_points(pts)
-        (tl, tr, br, bl) = rect
+        quads = np.asarray(quads, dtype="float32").reshape(-1, 4, 2)
+        s = quads.sum(axis=2)
+        diff = quads[:, :, 1] - quads[:, :, 0]
+        idx = np.stack([s.argmin(axis=1), diff.argmin(axis=1), s.argmax(axis=1), diff.argmax(axis=1)], axis=1)
+        return np.take_along_axis(quads, idx[:, :, None], axis=1)
+
+    @staticmethod
+    def warp_sizes_batch(quads):
+        """Versão vetorizada de warp_size: recebe quadriláteros (N,4,2) e retorna as
+        larguras e alturas de saída como um array (N,2) de inteiros.
+        """
+        rect = ImageProcessor.order_points_batch(quads)
+        tl, tr, br, bl = rect[:, 0], rect[:, 1], rect[:, 2], rect[:, 3]
+        widths = np.maximum(np.linalg.norm(br - bl, axis=1), np.linalg.norm(tr - tl, axis=1))
+        heights = np.maximum(np.linalg.norm(tr - br, axis=1), np.linalg.norm(tl - bl, axis=1))
+        return np.stack([widths, heights], axis=1).astype(int)
+
+    @staticmethod
+    def perspective_matrices_batch(quads, out_sizes=None):
+        """Calcula de uma vez as homografias de correção de N quadriláteros (N,4,2).
+        `out_sizes` (N,2) define o tamanho de saída de cada página; por padrão, o de
+        warp_sizes_batch. Retorna (matrizes (N,3,3), tamanhos (N,2)), resolvendo os N
+        sistemas lineares 8x8 numa única chamada em vez de um getPerspectiveTransform por página.
+        A matriz de um quadrilátero degenerado (cantos colineares ou repetidos) vem
+        preenchida com NaN, sem impedir o cálculo das demais.
+        """
+        rect = ImageProcessor.order_points_batch(quads).astype("float64")
+        sizes = ImageProcessor.warp_sizes_batch(rect) if out_sizes is None else np.asarray(out_sizes, dtype=int).reshape(-1, 2)
+        n = len(rect)
+        w, h = sizes[:, 0] - 1, sizes[:, 1] - 1
+        zeros = np.zeros(n)
+        dst = np.stack([np.stack([zeros, zeros], 1), np.stack([w, zeros], 1),
+                        np.stack([w, h], 1), np.stack([zeros, h], 1)], axis=1).astype("float64")
+
+        # Para cada canto: [x, y, 1, 0, 0, 0, -x*u, -y*u] . m = u  e  [0, 0, 0, x, y, 1, -x*v, -y*v] . m = v
+        x, y = rect[:, :, 0], rect[:, :, 1]
+        u, v = dst[:, :, 0], dst[:, :, 1]
+        one, zero = np.ones_like(x), np.zeros_like(x)
+        rows_u = np.stack([x, y, one, zero, zero, zero, -x * u, -y * u], axis=2)
+        rows_v = np.stack([zero, zero, zero, x, y, one, -x * v, -y * v], axis=2)
+        A = np.concatenate([rows_u, rows_v], axis=1)
+        b = np.concatenate([u, v], axis=1)
+        try:
+            m = np.linalg.solve(A, b[:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            # Algum sistema é singular: resolve um a um para isolar os degenerados
+            m = np.full((n, 8), np.nan)
+            for i in range(n):
+                try:
+                    m[i] = np.linalg.solve(A[i], b[i])
+                except np.linalg.LinAlgError:
+                    pass
+        last = np.where(np.isnan(m[:, :1]), np.nan, 1.0)
+        return np.concatenate([m, last], axis=1).reshape(n, 3, 3), sizes
+
+    @staticmethod
+    def warp_size(pts):
+        """Calcula a largura e a altura da imagem resultante da correção de perspectiva,
+        sem precisar da imagem: usa os lados mais longos do quadrilátero.
+        """
+        (tl, tr, br, bl) = ImageProcessor.order_points(pts)
 
         # Calcula a largura e altura da nova imagem transformada
         widthA = np.linalg.norm(br - bl)
@@ -37,6 +109,54 @@ class ImageProcessor:
         heightA = np.linalg.norm(tr - br)
         heightB = np.linalg.norm(tl - bl)
         maxHeight = int(max(heightA, heightB))
+        return maxWidth, maxHeight
+
+    @staticmethod
+    def rotation_matrix(angle, size):
+        """Matriz 3x3 que leva coordenadas de pixel da imagem original para as da imagem
+        rotacionada por `PIL.Image.rotate(angle, expand=True)` (ângulo em graus, anti-horário).
+        Retorna (matriz, tamanho da imagem rotacionada).
+        """
+        w, h = size
+        angle %= 360
+        if angle % 90 == 0:
+            # Caso exato dos botões de rotação
+            quarter = int(angle // 90)
+            new_size = (h, w) if quarter % 2 else (w, h)
+            cos, sin = [(1, 0), (0, 1), (-1, 0), (0, -1)][quarter]
+        else:
+            rad = np.radians(angle)
+            cos, sin = np.cos(rad), np.sin(rad)
+            # Mesmo arredondamento do Pillow para o tamanho expandido
+            xs = [w / 2 + cos * (x - w / 2) + sin * (y - h / 2) for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+            ys = [h / 2 - sin * (x - w / 2) + cos * (y - h / 2) for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+            new_size = (int(np.ceil(max(xs)) - np.floor(min(xs))), int(np.ceil(max(ys)) - np.floor(min(ys))))
+
+        # Rotação em torno do centro; o +0.5/-0.5 converte entre índice e centro do pixel
+        to_center = np.array([[1, 0, 0.5 - w / 2], [0, 1, 0.5 - h / 2], [0, 0, 1]], dtype="float64")
+        rotate = np.array([[cos, sin, 0], [-sin, cos, 0], [0, 0, 1]], dtype="float64")
+        from_center = np.array([[1, 0, new_size[0] / 2 - 0.5], [0, 1, new_size[1] / 2 - 0.5], [0, 0, 1]], dtype="float64")
+        return from_center @ rotate @ to_center, new_size
+
+    @staticmethod
+    def perspective_matrix(pts, angle=0, image_size=None, out_size=None, target_height=None):
+        """Compõe numa única homografia a rotação, a correção de perspectiva e o redimensionamento.
+
+        `pts` são os 4 cantos nas coordenadas da imagem já rotacionada por `angle`
+        (como exibida na interface); `image_size` é o tamanho da imagem original, sem
+        rotação. O tamanho de saída é o do quadrilátero, ou `out_size`, ou a largura
+        proporcional a `target_height`. Retorna (matriz 3x3, (largura, altura)). Levanta
+        ValueError se o quadrilátero não tem largura ou altura (uma linha ou um ponto).
+        """
+        rect = ImageProcessor.order_points(pts)
+        if out_size is None:
+            maxWidth, maxHeight = ImageProcessor.warp_size(rect)
+            if maxWidth < 1 or maxHeight < 1:
+                raise ValueError(f"Cantos degenerados: o quadrilátero tem {maxWidth}x{maxHeight} pixels.")
+            if target_height is not None and target_height != maxHeight:
+                maxWidth, maxHeight = max(1, int(maxWidth * target_height / maxHeight)), target_height
+        else:
+            maxWidth, maxHeight = out_size
 
         # Define os pontos de destino para a transformação (retângulo)
         dst = np.array([
@@ -45,17 +165,55 @@ class ImageProcessor:
             [maxWidth - 1, maxHeight - 1],
             [0, maxHeight - 1]], dtype="float32")
 
-        # Calcula a matriz de transformação de perspectiva e aplica-a
         M = cv2.getPerspectiveTransform(rect, dst)
-        warped = cv2.warpPerspective(image_np, M, (maxWidth, maxHeight))
-        return Image.fromarray(warped)
+        if angle % 360:
+            R, _ = ImageProcessor.rotation_matrix(angle, image_size)
+            M = M @ R
+        return M, (maxWidth, maxHeight)
+
+    @staticmethod
+    @timed("warp")
+    def warp_composed(image, pts, angle=0, out_size=None, target_height=None, resampler=None):
+        """Rotaciona, corrige a perspectiva e redimensiona com um único warpPerspective
+        sobre a imagem original, evitando cópias rotacionadas e reamostragens repetidas.
+        Parâmetros como em perspective_matrix; `resampler` é um Resampler ou nível de
+        qualidade (ver resampling.py, padrão: batch). Retorna uma imagem PIL.
+        """
+        image_np = np.asarray(image) if isinstance(image, Image.Image) else image
+        size = (image_np.shape[1], image_np.shape[0])
+        M, out_size = ImageProcessor.perspective_matrix(pts, angle, size, out_size, target_height)
+        return Image.fromarray(get_resampler(resampler).warp(image_np, M, out_size))
+
+    @staticmethod
+    @timed("warp")
+    def warp_array(src, M, out_size, dst=None, resampler=None):
+        """Aplica uma homografia já calculada (ex.: por perspective_matrices_batch) a um
+        array RGB ou PageBuffer e retorna um array. Com `dst` (ex.: a fatia da imagem final onde a página vai
+        ficar), a página corrigida é escrita direto nele, sem cópia intermediária.
+        """
+        return get_resampler(resampler).warp(np.asarray(src), M, out_size, dst=dst)
+
+    @staticmethod
+    def four_point_transform(image, pts, resampler=None):
+        """Aplica uma transformação de perspectiva em uma imagem.
+        Recebe uma imagem PIL e 4 pontos (x,y) que definem a região a ser transformada.
+        """
+        return ImageProcessor.warp_composed(image, pts, resampler=resampler)
 
     @staticmethod
+    @timed("enhance")
     def enhance_image_readability(image):
         """Melhora a legibilidade da imagem preservando as cores.
         Aplica CLAHE no canal L do espaço de cores LAB para aprimorar o contraste
-        e um desfoque Gaussiano para reduzir ruído.
+        e um desfoque Gaussiano para reduzir ruído. Imagens grandes são processadas
+        em faixas (ver enhance_image_readability_banded).
         """
+        if not isinstance(image, Image.Image):
+            # Array RGB ou PageBuffer: processado em faixas, retorna um array
+            return ImageProcessor._enhance_bands(np.asarray(image))
+        if image.width * image.height >= ENHANCE_BANDED_MIN_PIXELS:
+            return ImageProcessor.enhance_image_readability_banded(image)
+
         img_np = np.array(image.convert("RGB"))
         img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
 
@@ -77,4 +235,79 @@ class ImageProcessor:
         # Converte de volta para imagem PIL
         return Image.fromarray(cv2.cvtColor(blurred, cv2.COLOR_BGR2RGB))
 
+    @staticmethod
+    def enhance_image_readability_banded(image, band_height=512, workers=None):
+        """Mesmo resultado de enhance_image_readability, com memória limitada e em paralelo.
+
+        Só o canal L é mantido inteiro, pois o CLAHE depende da imagem toda. A conversão
+        para LAB, a troca do canal L, a volta para RGB e o desfoque são feitos em faixas
+        de `band_height` linhas (com 3 linhas de sobreposição para o desfoque), escritas
+        direto no array de saída. As faixas são distribuídas entre `workers` threads.
+        """
+        return Image.fromarray(ImageProcessor._enhance_bands(np.asarray(image.convert("RGB")), None, band_height, workers))
+
+    @staticmethod
+    @timed("enhance")
+    def enhance_array(src, dst=None, band_height=512, workers=None):
+        """enhance_image_readability sobre arrays: lê de um array RGB ou PageBuffer e
+        escreve em `dst` (um array do mesmo formato, ou um novo). `dst` não pode ser `src`.
+        """
+        return ImageProcessor._enhance_bands(np.asarray(src), None if dst is None else np.asarray(dst),
+                                             band_height, workers)
+
+    @staticmethod
+    def _enhance_bands(src, dst=None, band_height=512, workers=None):
+        height = src.shape[0]
+        bands = [(y, min(y + band_height, height)) for y in range(0, height, band_height)]
+        workers = workers or os.cpu_count() or 1
+
+        # 1ª passada: canal L da imagem inteira, calculado faixa a faixa
+        lum = np.empty(src.shape[:2], dtype=np.uint8)
+
+        def extract_l(band):
+            y0, y1 = band
+            lum[y0:y1] = cv2.cvtColor(src[y0:y1], cv2.COLOR_RGB2LAB)[..., 0]
+
+        # 2ª passada: troca o L pelo realçado, volta para RGB e desfoca, com sobreposição
+        out = np.empty_like(src) if dst is None else dst
+
+        def finish(band):
+            y0, y1 = band
+            top, bottom = max(0, y0 - _BLUR_HALO), min(height, y1 + _BLUR_HALO)
+            lab = cv2.cvtColor(src[top:bottom], cv2.COLOR_RGB2LAB)
+            lab[..., 0] = lum[top:bottom]
+            rgb = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB, dst=lab)
+            blurred = cv2.GaussianBlur(rgb, (7, 7), 0)
+            out[y0:y1] = blurred[y0 - top:y1 - top]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(extract_l, bands))
+            # Aplica CLAHE no canal L (luminosidade), no próprio buffer
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+            clahe.apply(lum, dst=lum)
+            list(executor.map(finish, bands))
+        return out
+
+    @staticmethod
+    @timed("merge")
+    def merge_side_by_side(images, resampler=None):
+        """Junta as imagens lado a lado, da esquerda para a direita.
+        Todas as imagens são redimensionadas para a altura da primeira, com `resampler`
+        (Resampler ou nível de qualidade, ver resampling.py; padrão: batch).
+        """
+        resampler = get_resampler(resampler)
+        if not images:
+            raise ValueError("Nenhuma imagem para juntar.")
+        target_height = images[0].height
+        resized = []
+        for img in images:
+            if img.height != target_height:
+                img = resampler.resize(img, (int(img.width * target_height / img.height), target_height))
+            resized.append(img)
 
+        merged_image = Image.new("RGB", (sum(img.width for img in resized), target_height))
+        x = 0
+        for img in resized:
+            merged_image.paste(img, (x, 0))
+            x += img.width
+        return merged_image
@@ -0,0 +1,36 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """Módulo importado só no primeiro acesso a um atributo.
+
+    `cv2 = LazyModule("cv2")` no topo de um módulo adia o import do OpenCV (algumas
+    centenas de ms) até a primeira operação sobre pixels, de modo que a linha de
+    comando, o `--help` e os processos que não chegam a processar imagens não pagam
+    esse custo. Cada atributo lido é guardado na própria instância, então os acessos
+    seguintes (cv2.resize, cv2.INTER_AREA...) custam o mesmo que num módulo comum.
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = self.__dict__["_module"] = importlib.import_module(self.__dict__["_name"])
+        return module
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        state = "carregado" if self.__dict__["_module"] is not None else "não carregado"
+        return f"<LazyModule {self.__dict__['_name']!r} ({state})>"
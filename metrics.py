@@ -0,0 +1,257 @@
+import functools
+import json
+import os
+import threading
+import time
+
+# Variável de ambiente que ativa a coleta de métricas. Como DEBUG_DIR_ENV, também
+# vale para os processos do lote, que devolvem as suas métricas ao processo principal.
+METRICS_ENV = "JUNTAR_METRICS"
+
+# Arquivo em que a interface gráfica grava as métricas ao fechar a janela (mesmos
+# formatos de Metrics.write; padrão: metricas.jsonl na pasta de cache do usuário)
+METRICS_FILE_ENV = "JUNTAR_METRICS_FILE"
+
+# Etapas instrumentadas do pipeline
+STAGES = ("decode", "detect", "warp", "enhance", "resize", "merge", "encode")
+
+# Intervalo da amostragem do uso de memória (RSS), em segundos
+SAMPLE_INTERVAL = 0.05
+
+
+def current_rss():
+    """Memória residente do processo em bytes (Linux); fora do Linux, o pico informado
+    pelo sistema.
+    """
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # Não existe no Windows
+    except ImportError:
+        return 0
+    # ru_maxrss é informado em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _NullSpan:
+    """Span usado com as métricas desligadas: não mede nada."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Coleta tempos por etapa, contadores e o pico de memória.
+
+    Desligada, cada span custa uma chamada e um teste de booleano. Ligada, cada span
+    acumula chamadas, tempo total, mínimo e máximo e a memória residente ao final da
+    etapa; uma thread amostra a memória a cada SAMPLE_INTERVAL para registrar o pico
+    do processo. Spans podem ser aninhados (ex.: resize dentro de merge).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stop_sampler = threading.Event()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.spans = {}
+            self.counters = {}
+            self.peak_rss = 0
+
+    def enable(self, sample_memory=True):
+        self.enabled = True
+        if sample_memory and self._sampler is None:
+            self._stop_sampler.clear()
+            self._sampler = threading.Thread(target=self._sample, name="metrics-rss", daemon=True)
+            self._sampler.start()
+
+    def disable(self):
+        self.enabled = False
+        if self._sampler is not None:
+            self._stop_sampler.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def span(self, name):
+        """Mede o bloco `with metrics.span("detect"): ...`."""
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def record(self, name, seconds):
+        rss = current_rss()
+        with self._lock:
+            stat = self.spans.get(name)
+            if stat is None:
+                stat = self.spans[name] = {"count": 0, "total_s": 0.0, "min_s": seconds, "max_s": seconds,
+                                           "max_rss_bytes": 0}
+            stat["count"] += 1
+            stat["total_s"] += seconds
+            stat["min_s"] = min(stat["min_s"], seconds)
+            stat["max_s"] = max(stat["max_s"], seconds)
+            stat["max_rss_bytes"] = max(stat["max_rss_bytes"], rss)
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _sample(self):
+        while not self._stop_sampler.wait(SAMPLE_INTERVAL):
+            rss = current_rss()
+            with self._lock:
+                self.peak_rss = max(self.peak_rss, rss)
+
+    # Exportação
+
+    def snapshot(self):
+        """Cópia das métricas atuais, serializável em JSON."""
+        with self._lock:
+            return {
+                "spans": {name: dict(stat) for name, stat in self.spans.items()},
+                "counters": dict(self.counters),
+                "peak_rss_bytes": self.peak_rss,
+            }
+
+    def drain(self):
+        """Retorna o snapshot e zera as métricas (usado pelos processos do lote)."""
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        """Soma ao registro as métricas de outro processo (ver drain)."""
+        with self._lock:
+            for name, other in snapshot["spans"].items():
+                stat = self.spans.get(name)
+                if stat is None:
+                    self.spans[name] = dict(other)
+                    continue
+                stat["count"] += other["count"]
+                stat["total_s"] += other["total_s"]
+                stat["min_s"] = min(stat["min_s"], other["min_s"])
+                stat["max_s"] = max(stat["max_s"], other["max_s"])
+                stat["max_rss_bytes"] = max(stat["max_rss_bytes"], other["max_rss_bytes"])
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            # Processos diferentes: o pico registrado é o do maior processo
+            self.peak_rss = max(self.peak_rss, snapshot["peak_rss_bytes"])
+
+    def to_prometheus(self, prefix="juntar"):
+        """Formato de texto do Prometheus (ex.: para o textfile collector do node_exporter)."""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Tempo total gasto em cada etapa.",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {stat["total_s"]:.6f}'
+                  for name, stat in sorted(snapshot["spans"].items())]
+        lines += [
+            f"# HELP {prefix}_stage_calls_total Execuções de cada etapa.",
+            f"# TYPE {prefix}_stage_calls_total counter",
+        ]
+        lines += [f'{prefix}_stage_calls_total{{stage="{name}"}} {stat["count"]}'
+                  for name, stat in sorted(snapshot["spans"].items())]
+        lines += [
+            f"# HELP {prefix}_stage_max_seconds Maior duração de uma execução de cada etapa.",
+            f"# TYPE {prefix}_stage_max_seconds gauge",
+        ]
+        lines += [f'{prefix}_stage_max_seconds{{stage="{name}"}} {stat["max_s"]:.6f}'
+                  for name, stat in sorted(snapshot["spans"].items())]
+        if snapshot["counters"]:
+            lines += [f"# TYPE {prefix}_events_total counter"]
+            lines += [f'{prefix}_events_total{{name="{name}"}} {value}'
+                      for name, value in sorted(snapshot["counters"].items())]
+        lines += [
+            f"# HELP {prefix}_peak_rss_bytes Pico de memória residente amostrado.",
+            f"# TYPE {prefix}_peak_rss_bytes gauge",
+            f"{prefix}_peak_rss_bytes {snapshot['peak_rss_bytes']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Exporta pelo formato da extensão: `.prom` substitui o arquivo com o texto do
+        Prometheus; qualquer outra acrescenta uma linha JSON com o snapshot atual, de modo
+        que um serviço contínuo pode gravar um histórico no mesmo arquivo.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if path.endswith(".prom"):
+            # Substituição atômica: o coletor nunca lê um arquivo pela metade
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp, path)
+            return
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": time.time(), "pid": os.getpid(), **self.snapshot()}) + "\n")
+
+
+# Registro global usado pela instrumentação dos módulos
+METRICS = Metrics()
+if os.environ.get(METRICS_ENV):
+    METRICS.enable()
+
+
+def _after_fork():
+    # O processo filho não herda a thread de amostragem nem deve somar as métricas
+    # que o pai já tinha coletado
+    was_enabled = METRICS.enabled
+    METRICS._sampler = None
+    METRICS._lock = threading.Lock()
+    METRICS.reset()
+    if was_enabled:
+        METRICS.enable()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def span(name):
+    """Atalho para METRICS.span."""
+    return METRICS.span(name)
+
+
+def timed(name):
+    """Decorador que mede cada chamada da função como uma execução da etapa `name`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return fn(*args, **kwargs)
+            with _Span(METRICS, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,63 @@
+from lazy_import import LazyModule
+
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+
+class PageBuffer:
+    """Página RGB (altura x largura x 3, uint8) trocada entre as etapas do pipeline.
+
+    Os pixels ficam num array NumPy gravável. As etapas leem e escrevem direto no array
+    (ver ImageProcessor.warp_array e enhance_array), sem passar por imagens PIL; só a
+    decodificação e a gravação final usam o Pillow.
+    """
+
+    def __init__(self, array):
+        self.array = array
+
+    @classmethod
+    def empty(cls, shape):
+        """Aloca uma página não inicializada com `shape` (altura, largura, 3)."""
+        return cls(np.empty(tuple(int(v) for v in shape), dtype=np.uint8))
+
+    @classmethod
+    def from_image(cls, image):
+        """Copia uma imagem PIL (convertida para RGB) para uma nova página. O array é
+        sempre uma cópia gravável: np.asarray devolveria uma visão somente leitura.
+        """
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return cls(np.array(image))
+
+    @classmethod
+    def from_path(cls, path):
+        """Decodifica o arquivo de imagem `path` numa página."""
+        with Image.open(path) as img:
+            return cls.from_image(img)
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def width(self):
+        return self.array.shape[1]
+
+    @property
+    def height(self):
+        return self.array.shape[0]
+
+    @property
+    def size(self):
+        """(largura, altura), como Image.size."""
+        return self.array.shape[1], self.array.shape[0]
+
+    def __array__(self, dtype=None):
+        return self.array if dtype is None else self.array.astype(dtype)
+
+    def to_image(self):
+        """Cria uma imagem PIL com uma cópia dos pixels (para gravar ou exibir)."""
+        return Image.fromarray(self.array)
+
+    def __repr__(self):
+        return f"PageBuffer({self.width}x{self.height})"
@@ -0,0 +1,191 @@
+from compositor import compute_layout
+from image_processing import ImageProcessor
+from lazy_import import LazyModule
+from metrics import METRICS, timed
+from resampling import get_resampler
+
+np = LazyModule("numpy")
+
+
+def _same(old, new):
+    """Se o novo valor de uma entrada é igual ao atual. Arrays e imagens são comparados
+    pela identidade: trocar a imagem de origem sempre invalida o que depende dela.
+    """
+    if old is new:
+        return True
+    if isinstance(new, (bool, int, float, str, tuple)) and type(old) is type(new):
+        return old == new
+    return False
+
+
+class Node:
+    """Uma etapa memoizada do grafo de processamento de uma página.
+
+    Nós de entrada (sem `compute`) guardam um valor trocado com set(); os demais são
+    calculados por `compute(*valores das entradas)` na primeira leitura (get) e
+    reaproveitados até que alguma entrada mude. Mudar uma entrada só invalida os nós
+    que dependem dela, direta ou indiretamente. `version` aumenta a cada novo valor.
+    """
+
+    def __init__(self, name, compute=None, inputs=(), value=None):
+        self.name = name
+        self.compute = compute
+        self.inputs = tuple(inputs)
+        self.dependents = []
+        self.value = value
+        self.version = 0
+        self.dirty = compute is not None
+        for node in self.inputs:
+            node.dependents.append(self)
+
+    def get(self):
+        if self.dirty:
+            self.value = self.compute(*(node.get() for node in self.inputs))
+            self.version += 1
+            self.dirty = False
+            METRICS.count("graph_recomputed")
+        return self.value
+
+    def set(self, value):
+        """Troca o valor de um nó de entrada. Retorna se ele mudou."""
+        if _same(self.value, value):
+            return False
+        self.value = value
+        self.version += 1
+        for node in self.dependents:
+            node.invalidate()
+        return True
+
+    def invalidate(self):
+        # Um nó sujo já tem todos os seus dependentes sujos
+        if self.dirty:
+            return
+        self.dirty = True
+        for node in self.dependents:
+            node.invalidate()
+
+    def __repr__(self):
+        return f"Node({self.name!r}, {'sujo' if self.dirty else 'válido'}, v{self.version})"
+
+
+class PageGraph:
+    """Grafo de uma página: source -> rotation -> quad -> warp -> enhance.
+
+    Entradas: `source` (imagem PIL ou array RGB, sem rotação), `rotation` (graus,
+    anti-horário, como em ImageCanvas), `quad` (os 4 cantos relativos, 0 a 1, na
+    imagem rotacionada), `height` (altura da página corrigida; None: a do quadrilátero)
+    e `enhance` (se a legibilidade é melhorada depois da correção). Rotação, perspectiva
+    e altura entram numa única homografia (nó `matrix`), como em warp_composed.
+
+    Mover um canto recalcula só matrix, warp e enhance desta página; as outras páginas
+    de um CompositeGraph continuam memoizadas. Não é thread-safe: na interface, é usado
+    só na thread do Tk.
+    """
+
+    def __init__(self, source=None, rotation=0, quad=None, height=None, enhance=False, resampler=None):
+        self.resampler = get_resampler(resampler)
+        self.source = Node("source", value=None if source is None else np.asarray(source))
+        self.rotation = Node("rotation", value=rotation)
+        self.quad = Node("quad", value=quad)
+        self.height = Node("height", value=height)
+        self.enhance_flag = Node("enhance_flag", value=enhance)
+        self.matrix = Node("matrix", self._matrix, (self.source, self.rotation, self.quad, self.height))
+        self.warp = Node("warp", self._warp, (self.source, self.matrix))
+        self.output = Node("enhance", self._enhance, (self.warp, self.enhance_flag))
+
+    @property
+    def ready(self):
+        return self.source.value is not None and self.quad.value is not None
+
+    def set_source(self, image):
+        return self.source.set(None if image is None else np.asarray(image))
+
+    def update(self, rotation=None, quad=None, height=None, enhance=None):
+        """Atualiza as entradas informadas. Retorna se alguma mudou."""
+        changed = False
+        if rotation is not None:
+            changed |= self.rotation.set(rotation)
+        if quad is not None:
+            changed |= self.quad.set(tuple((float(x), float(y)) for x, y in quad))
+        if height is not None:
+            changed |= self.height.set(int(height))
+        if enhance is not None:
+            changed |= self.enhance_flag.set(bool(enhance))
+        return changed
+
+    def page(self):
+        """A página corrigida (array RGB), recalculando só as etapas invalidadas."""
+        return self.output.get()
+
+    @staticmethod
+    def _matrix(source, rotation, quad, height):
+        h, w = source.shape[:2]
+        _, (rw, rh) = ImageProcessor.rotation_matrix(rotation, (w, h))
+        pts = [(rx * rw, ry * rh) for rx, ry in quad]
+        return ImageProcessor.perspective_matrix(pts, rotation, (w, h), target_height=height)
+
+    def _warp(self, source, matrix):
+        M, size = matrix
+        return ImageProcessor.warp_array(source, M, size, resampler=self.resampler)
+
+    @staticmethod
+    def _enhance(page, enhance):
+        return ImageProcessor.enhance_array(page) if enhance else page
+
+
+class CompositeGraph:
+    """Junção memoizada de várias PageGraph: as páginas -> placement -> composite.
+
+    `placement` (compute_layout) só depende dos tamanhos das páginas. Na montagem, cada
+    página é redimensionada para o seu lugar só quando ela ou o tamanho do lugar mudou;
+    se as posições não mudaram, apenas as páginas alteradas são copiadas sobre a imagem
+    anterior.
+    """
+
+    def __init__(self, pages, layout="horizontal", columns=None, resampler=None):
+        self.pages = list(pages)
+        self.layout = layout
+        self.columns = columns
+        self.resampler = get_resampler(resampler)
+        outputs = [page.output for page in self.pages]
+        self.placement = Node("placement", self._placement, outputs)
+        self.composite = Node("composite", self._compose, [self.placement] + outputs)
+        self._fitted = {}  # Índice da página -> (versão da página, tamanho, página redimensionada)
+        self._drawn = None  # (placement, versões das páginas) da imagem atual
+
+    @property
+    def ready(self):
+        return all(page.ready for page in self.pages)
+
+    def image(self):
+        """A imagem final (array RGB), refeita só onde alguma página mudou."""
+        return self.composite.get()
+
+    def _placement(self, *pages):
+        return compute_layout([(p.shape[1], p.shape[0]) for p in pages], self.layout, self.columns)
+
+    @timed("merge")
+    def _compose(self, placement, *pages):
+        (width, height), cells = placement
+        versions = [page.output.version for page in self.pages]
+        canvas = self.composite.value
+        if canvas is None or canvas.shape[:2] != (height, width) or self._drawn is None or self._drawn[0] != placement:
+            canvas = np.zeros((height, width, 3), dtype=np.uint8)
+            previous = [None] * len(self.pages)
+        else:
+            previous = self._drawn[1]
+        for i, (page, (x, y, w, h)) in enumerate(zip(pages, cells)):
+            if previous[i] == versions[i]:
+                continue
+            canvas[y:y + h, x:x + w] = self._fit(i, page, versions[i], (w, h))
+        self._drawn = (placement, versions)
+        return canvas
+
+    def _fit(self, i, page, version, size):
+        """A página `i` no tamanho do seu lugar, memoizada pela versão da página."""
+        cached = self._fitted.get(i)
+        if cached is not None and cached[:2] == (version, size):
+            return cached[2]
+        fitted = page if (page.shape[1], page.shape[0]) == size else self.resampler.resize(page, size)
+        self._fitted[i] = (version, size, fitted)
+        return fitted
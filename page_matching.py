@@ -0,0 +1,230 @@
+import math
+import os
+
+from corner_detection import DEFAULT_PROFILE, CornerDetector
+from image_processing import ImageProcessor
+from lazy_import import LazyModule
+from metrics import METRICS, span, timed
+from page_buffer import PageBuffer
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+# Largura da miniatura em que as assinaturas das páginas são calculadas
+SIGNATURE_WIDTH = 384
+
+# Lado da miniatura em cinza (normalizada) comparada pixel a pixel no teste de foto repetida
+# (is_repeat): pequena o bastante para ignorar o ruído e o leve desalinhamento entre
+# duas fotos do mesmo lado
+REPEAT_THUMB_SIZE = 32
+
+# Lado do hash perceptual, em bits (HASH_SIZE x HASH_SIZE)
+HASH_SIZE = 8
+
+# Até quantos bits de diferença duas páginas parecem o mesmo lado de um documento:
+# não são juntadas como frente e verso
+DUPLICATE_DISTANCE = 10
+
+# Teste estrito de foto repetida (hash, histogramas e miniaturas quase iguais): a
+# página é apontada como possível duplicata, para revisão, mas nunca descartada
+REPEAT_DISTANCE = 4
+REPEAT_HISTOGRAM = 0.2
+REPEAT_PIXEL_DIFFERENCE = 0.1
+
+# Diferenças que somam 1 ao custo de juntar duas páginas: proporção (log da razão),
+# cor do papel (distância no espaço Lab) e distância na ordem das fotos
+ASPECT_TOLERANCE = 0.1
+PAPER_TOLERANCE = 12.0
+CAPTURE_GAP_COST = 0.15
+
+# Custo máximo para considerar duas páginas frente e verso do mesmo documento
+MAX_PAIR_COST = 2.0
+
+# Faixa da borda da página (fração do lado) em que a cor do papel é medida
+PAPER_BORDER = 0.06
+
+_face_cascade = None
+
+
+def perceptual_hash(gray, hash_size=HASH_SIZE):
+    """Hash perceptual (pHash) de uma imagem em tons de cinza: os coeficientes de baixa
+    frequência da DCT comparados com a sua mediana. Retorna um inteiro de
+    hash_size * hash_size bits; fotos da mesma página diferem em poucos bits.
+    """
+    small = cv2.resize(gray, (hash_size * 4, hash_size * 4), interpolation=cv2.INTER_AREA)
+    dct = cv2.dct(small.astype(np.float32))[:hash_size, :hash_size]
+    bits = (dct > np.median(dct.flatten()[1:])).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_distance(a, b):
+    """Número de bits diferentes entre dois hashes."""
+    return bin(a ^ b).count("1")
+
+
+def _face_score(gray):
+    """Fração da página ocupada pelo maior rosto encontrado (0 sem rosto ou sem os
+    classificadores do OpenCV). Usado para reconhecer a frente de um documento.
+    """
+    global _face_cascade
+    if _face_cascade is None:
+        data = getattr(cv2, "data", None)
+        path = os.path.join(data.haarcascades, "haarcascade_frontalface_default.xml") if data else ""
+        _face_cascade = cv2.CascadeClassifier(path) if os.path.exists(path) else False
+    if _face_cascade is False:
+        return 0.0
+    faces = _face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(24, 24))
+    if len(faces) == 0:
+        return 0.0
+    return float(max(w * h for _, _, w, h in faces)) / (gray.shape[0] * gray.shape[1])
+
+
+class PageSignature:
+    """Características de uma página corrigida usadas para agrupar frente e verso:
+    proporção, cor do papel (mediana da borda, em Lab), histograma de matiz e
+    saturação, hash perceptual e o maior rosto encontrado. `index` é a posição da
+    página na ordem das fotos.
+    """
+
+    def __init__(self, page, key=None, index=0):
+        src = np.asarray(page)
+        h, w = src.shape[:2]
+        self.key = key
+        self.index = index
+        self.size = (w, h)
+        self.aspect = max(w, h) / max(1, min(w, h))
+
+        thumb_h = max(1, round(h * SIGNATURE_WIDTH / w))
+        thumb = cv2.resize(src, (SIGNATURE_WIDTH, thumb_h), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(thumb, cv2.COLOR_RGB2GRAY)
+        self.phash = perceptual_hash(gray)
+        # Miniatura em tons de cinza normalizada (média 0, desvio 1), para comparar
+        # pixel a pixel fotos com exposições diferentes
+        small = cv2.resize(gray, (REPEAT_THUMB_SIZE, REPEAT_THUMB_SIZE), interpolation=cv2.INTER_AREA)
+        small = small.astype(np.float32)
+        self.thumbnail = (small - small.mean()) / max(float(small.std()), 1.0)
+
+        lab = cv2.cvtColor(thumb, cv2.COLOR_RGB2LAB).astype(np.float32)
+        by, bx = max(1, int(thumb_h * PAPER_BORDER)), max(1, int(SIGNATURE_WIDTH * PAPER_BORDER))
+        border = np.concatenate([lab[:by].reshape(-1, 3), lab[-by:].reshape(-1, 3),
+                                 lab[:, :bx].reshape(-1, 3), lab[:, -bx:].reshape(-1, 3)])
+        # Lab do OpenCV em 8 bits: L em 0-255; a e b deslocados de 128
+        self.paper = np.median(border, axis=0) * [100 / 255, 1, 1]
+
+        hsv = cv2.cvtColor(thumb, cv2.COLOR_RGB2HSV)
+        self.histogram = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256])
+        cv2.normalize(self.histogram, self.histogram, 1.0, 0.0, cv2.NORM_L1)
+        self.face = _face_score(gray)
+
+    def __repr__(self):
+        return f"PageSignature({self.key!r}, {self.size[0]}x{self.size[1]})"
+
+
+def pair_cost(a, b):
+    """Custo de juntar as páginas `a` e `b` (PageSignature) como frente e verso: soma
+    das diferenças de proporção, de cor do papel e de histograma de cor, mais uma
+    penalidade pela distância entre as fotos. Abaixo de MAX_PAIR_COST é um par.
+    """
+    aspect = abs(math.log(a.aspect / b.aspect)) / ASPECT_TOLERANCE
+    paper = float(np.linalg.norm(a.paper - b.paper)) / PAPER_TOLERANCE
+    histogram = cv2.compareHist(a.histogram, b.histogram, cv2.HISTCMP_BHATTACHARYYA)
+    gap = CAPTURE_GAP_COST * max(0, abs(a.index - b.index) - 1)
+    return aspect + paper + histogram + gap
+
+
+def same_side(a, b):
+    """Se `a` e `b` (PageSignature) parecem o mesmo lado de um documento: hashes a até
+    DUPLICATE_DISTANCE bits, mesma proporção e mesma cor de papel. Essas páginas nunca
+    são juntadas como frente e verso; versos de documentos diferentes com o mesmo
+    modelo impresso também passam neste teste.
+    """
+    return (hash_distance(a.phash, b.phash) <= DUPLICATE_DISTANCE
+            and abs(math.log(a.aspect / b.aspect)) <= ASPECT_TOLERANCE
+            and float(np.linalg.norm(a.paper - b.paper)) <= PAPER_TOLERANCE)
+
+
+def is_repeat(a, b):
+    """Se `b` parece outra foto da mesma página `a`: same_side com hashes a até
+    REPEAT_DISTANCE bits, histogramas de cor quase iguais e miniaturas normalizadas que
+    diferem em média menos de REPEAT_PIXEL_DIFFERENCE desvios. Documentos do mesmo
+    modelo ainda podem passar, por isso o resultado é só um aviso.
+    """
+    return (same_side(a, b)
+            and hash_distance(a.phash, b.phash) <= REPEAT_DISTANCE
+            and cv2.compareHist(a.histogram, b.histogram, cv2.HISTCMP_BHATTACHARYYA) <= REPEAT_HISTOGRAM
+            and float(np.abs(a.thumbnail - b.thumbnail).mean()) <= REPEAT_PIXEL_DIFFERENCE)
+
+
+def front_first(a, b):
+    """Ordena um par (PageSignature): a frente é o lado com rosto; sem essa
+    indicação, vale a ordem das fotos.
+    """
+    if a.face != b.face and max(a.face, b.face) > 0:
+        return (a, b) if a.face > b.face else (b, a)
+    return (a, b) if a.index <= b.index else (b, a)
+
+
+@timed("merge")
+def group_pages(signatures, max_cost=MAX_PAIR_COST):
+    """Agrupa as páginas em documentos. Retorna (documentos, duplicatas):
+
+    - documentos: listas de índices de `signatures`, [frente, verso] ou [página] para
+      as que ficaram sem par, na ordem da primeira foto de cada documento. Toda página
+      está em exatamente um documento;
+    - duplicatas: pares (índice, índice da página anterior igual) das possíveis fotos
+      repetidas (is_repeat), para revisão; elas continuam nos documentos.
+
+    Os pares são escolhidos do menor custo (pair_cost) para o maior, sem juntar duas
+    páginas que parecem o mesmo lado (same_side).
+    """
+    duplicates = []
+    for i, sig in enumerate(signatures):
+        original = next((j for j in range(i) if is_repeat(signatures[j], sig)), None)
+        if original is not None:
+            duplicates.append((i, original))
+
+    costs = sorted((pair_cost(signatures[i], signatures[j]), i, j)
+                   for i in range(len(signatures)) for j in range(i + 1, len(signatures))
+                   if not same_side(signatures[i], signatures[j]))
+    paired, documents = set(), []
+    for cost, i, j in costs:
+        if cost > max_cost:
+            break
+        if i in paired or j in paired:
+            continue
+        paired.update((i, j))
+        front, _ = front_first(signatures[i], signatures[j])
+        documents.append([i, j] if front is signatures[i] else [j, i])
+    documents += [[i] for i in range(len(signatures)) if i not in paired]
+    documents.sort(key=min)
+    METRICS.count("pages_paired", 2 * sum(len(d) == 2 for d in documents))
+    return documents, duplicates
+
+
+def extract_pages(source, profile=DEFAULT_PROFILE, resampler=None, width=None):
+    """Decodifica a foto `source` uma única vez e corrige cada documento encontrado
+    nela (CornerDetector.find_all_document_corners), todos a partir do mesmo array.
+    Retorna [(cantos, confiança, PageBuffer), ...] na ordem de leitura; se nenhum
+    documento for encontrado, a foto inteira é a única página, com confiança 0.
+    """
+    if isinstance(source, PageBuffer):
+        photo = source
+    else:
+        with span("decode"):
+            photo = PageBuffer.from_path(source)
+    detections = CornerDetector.find_all_document_corners(photo.array, profile=profile, width=width)
+    pages = []
+    if detections:
+        quads = np.asarray([corners for corners, _ in detections], dtype="float32")
+        matrices, sizes = ImageProcessor.perspective_matrices_batch(quads)
+        for (corners, confidence), M, (w, h) in zip(detections, matrices, sizes.tolist()):
+            if not np.isfinite(M).all():
+                continue  # Quadrilátero degenerado: não é um documento
+            page = PageBuffer.empty((h, w, 3))
+            ImageProcessor.warp_array(photo.array, M, (w, h), dst=page.array, resampler=resampler)
+            pages.append((corners, confidence, page))
+    if not pages:
+        w, h = photo.size
+        corners = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32")
+        pages.append((corners, 0.0, photo))
+    return pages
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+
+from lazy_import import LazyModule
+from metrics import METRICS
+
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+# Versão do formato das entradas; mudar invalida todo o cache existente
+CACHE_VERSION = 2
+
+# Variável de ambiente com a pasta do cache da interface (padrão: user_cache_dir())
+CACHE_DIR_ENV = "JUNTAR_CACHE_DIR"
+
+# Variável de ambiente que faz a interface guardar também as páginas corrigidas. Por
+# padrão ela guarda só os cantos: gravar cada página em PNG custa mais que refazê-la
+CACHE_PAGES_ENV = "JUNTAR_CACHE_PAGES"
+
+
+def user_cache_dir(app="JuntarImagens"):
+    """Pasta de cache do usuário para `app`, conforme o sistema (ou CACHE_DIR_ENV)."""
+    directory = os.environ.get(CACHE_DIR_ENV)
+    if directory:
+        return directory
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, app)
+
+
+class ProcessingCache:
+    """Cache em disco endereçado por conteúdo para cantos detectados e páginas corrigidas.
+
+    A chave combina o hash SHA-256 do arquivo de origem com os parâmetros do
+    processamento (limiares do detector, rotação, melhoria de legibilidade...), então
+    reprocessar o mesmo arquivo com os mesmos parâmetros reaproveita o resultado.
+    Os cantos são guardados em JSON e as páginas em PNG (sem perdas). Quando o
+    tamanho total passa de `max_bytes`, as entradas usadas há mais tempo são removidas.
+    Pode ser compartilhado entre processos (as gravações são atômicas) e entre threads
+    (a memória de hashes e a estimativa do tamanho são protegidas por um lock).
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._digests = {}
+        self._approx_bytes = None  # Estimativa do tamanho total, para não varrer a pasta a cada gravação
+        os.makedirs(directory, exist_ok=True)
+
+    def file_digest(self, path):
+        """Hash SHA-256 do conteúdo do arquivo, memorizado por (caminho, mtime, tamanho)."""
+        st = os.stat(path)
+        memo_key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            digest = self._digests.get(memo_key)
+        if digest is None:
+            # Calculado fora do lock: duas threads com o mesmo arquivo chegam ao mesmo hash
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(block)
+            digest = h.hexdigest()
+            with self._lock:
+                self._digests[memo_key] = digest
+        return digest
+
+    def key(self, path, stage, params):
+        """Chave da entrada: hash do arquivo + etapa + parâmetros (em JSON canônico)."""
+        payload = json.dumps([CACHE_VERSION, self.file_digest(path), stage, params], sort_keys=True, default=_to_json)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key, ext):
+        return os.path.join(self.directory, key[:2], key + ext)
+
+    def _touch(self, entry):
+        """Marca a entrada como usada agora (base da remoção LRU)."""
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+    def _write_atomic(self, entry, write):
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+                # Medido antes de publicar: outra thread pode remover a entrada logo depois
+                size = f.tell()
+            os.replace(tmp, entry)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self._lock:
+            if self._approx_bytes is not None:
+                self._approx_bytes += size
+            full = self._approx_bytes is None or self._approx_bytes > self.max_bytes
+        if full:
+            self.evict()
+
+    def get_detection(self, path, params):
+        """Retorna (cantos 4x2 float32, confiança ou None) guardados, ou None."""
+        entry = self._entry_path(self.key(path, "corners", params), ".json")
+        try:
+            with open(entry, encoding="utf-8") as f:
+                data = json.load(f)
+            corners = np.array(data["corners"], dtype="float32")
+        except (OSError, ValueError, KeyError, TypeError):
+            METRICS.count("cache_miss")
+            return None
+        self._touch(entry)
+        METRICS.count("cache_hit")
+        return corners, data.get("confidence")
+
+    def get_corners(self, path, params):
+        """Retorna os cantos guardados (array 4x2 float32) ou None."""
+        detection = self.get_detection(path, params)
+        return None if detection is None else detection[0]
+
+    def put_corners(self, path, params, corners, confidence=None):
+        entry = self._entry_path(self.key(path, "corners", params), ".json")
+        data = json.dumps({"corners": np.asarray(corners, dtype=float).tolist(), "confidence": confidence}).encode("utf-8")
+        self._write_atomic(entry, lambda f: f.write(data))
+
+    def get_page(self, path, params):
+        """Retorna a página guardada (imagem PIL já carregada) ou None."""
+        entry = self._entry_path(self.key(path, "page", params), ".png")
+        try:
+            with Image.open(entry) as img:
+                img.load()
+        except OSError:
+            METRICS.count("cache_miss")
+            return None
+        self._touch(entry)
+        METRICS.count("cache_hit")
+        return img
+
+    def put_page(self, path, params, image):
+        entry = self._entry_path(self.key(path, "page", params), ".png")
+        self._write_atomic(entry, lambda f: image.save(f, format="PNG", compress_level=3))
+
+    def evict(self):
+        """Remove as entradas menos usadas recentemente até caber em `max_bytes`.
+        Chamado automaticamente quando a estimativa local do tamanho passa do limite;
+        gravações de outros processos só entram na conta na próxima varredura.
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue  # Removida por outro processo durante a varredura
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        self._approx_bytes = total
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, entry_path in entries:
+            try:
+                os.unlink(entry_path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._approx_bytes = total
+
+    def __getstate__(self):
+        # Os processos do lote recebem o cache sem a memória de hashes do processo pai
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_digests"] = {}
+        state["_approx_bytes"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Parâmetro não serializável no cache: {value!r}")
@@ -0,0 +1,139 @@
+from lazy_import import LazyModule
+from metrics import span
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+# Níveis de qualidade da reamostragem, do mais rápido ao mais fiel
+QUALITIES = ("preview", "batch", "archive")
+
+# Bibliotecas que fazem a reamostragem. None escolhe pelo tipo da entrada: imagens PIL
+# ficam no Pillow (ou Pillow-SIMD, se instalado no lugar dele) e arrays no OpenCV,
+# evitando conversões
+BACKENDS = ("cv2", "pillow")
+
+# Nível padrão de cada modo do pipeline
+PIPELINE_QUALITY = {
+    "gui_preview": "preview",  # Exibição no canvas, refeita a cada redimensionamento
+    "gui_export": "archive",   # Imagem final salva pela interface
+    "batch": "batch",          # cli.py batch
+    "watch": "batch",          # cli.py watch
+}
+
+DEFAULT_QUALITY = "batch"
+
+# Filtros do OpenCV por nível: (redução, ampliação, warpPerspective). O Lanczos do
+# OpenCV não filtra antes de reduzir (serrilha em reduções grandes), então o nível
+# archive reduz com INTER_AREA e usa Lanczos só para ampliar e na correção de perspectiva
+_CV2_FILTERS = {
+    "preview": ("INTER_NEAREST", "INTER_NEAREST", "INTER_NEAREST"),
+    "batch": ("INTER_AREA", "INTER_LINEAR", "INTER_LINEAR"),
+    "archive": ("INTER_AREA", "INTER_LANCZOS4", "INTER_LANCZOS4"),
+}
+
+# Filtros do Pillow por nível: (redução, ampliação, transform, reducing_gap). Com
+# reducing_gap, o Pillow primeiro reduz por um fator inteiro com Image.reduce (média
+# por blocos, muito mais barata) e só então aplica o filtro; quanto menor, mais rápido.
+# Image.transform não tem Lanczos: o nível archive corrige a perspectiva com bicúbico
+_PIL_FILTERS = {
+    "preview": ("BOX", "NEAREST", "NEAREST", 1.0),
+    "batch": ("BILINEAR", "BILINEAR", "BILINEAR", 2.0),
+    "archive": ("LANCZOS", "LANCZOS", "BICUBIC", None),
+}
+
+
+class Resampler:
+    """Redimensionamento e correção de perspectiva num nível de qualidade (QUALITIES),
+    com o OpenCV ou o Pillow (BACKENDS; None escolhe pelo tipo da entrada).
+
+    Os métodos aceitam imagens PIL ou arrays RGB (ou PageBuffer) e retornam o mesmo
+    tipo recebido; `dst`, quando informado, recebe o resultado (ex.: o lugar da página
+    na imagem final). Os tempos e a qualidade de cada combinação são medidos por
+    benchmarks/bench_resample.py.
+    """
+
+    def __init__(self, quality=DEFAULT_QUALITY, backend=None):
+        if quality not in QUALITIES:
+            raise ValueError(f"Qualidade desconhecida: {quality!r} (use {', '.join(QUALITIES)}).")
+        if backend is not None and backend not in BACKENDS:
+            raise ValueError(f"Backend desconhecido: {backend!r} (use {', '.join(BACKENDS)}).")
+        self.quality = quality
+        self.backend = backend
+
+    @property
+    def key(self):
+        """Identificação para as chaves do ProcessingCache."""
+        return f"{self.quality}:{self.backend or 'auto'}"
+
+    def _backend_for(self, image):
+        if self.backend is not None:
+            return self.backend
+        return "pillow" if isinstance(image, Image.Image) else "cv2"
+
+    def resize(self, image, size, dst=None):
+        """Redimensiona `image` para `size` (largura, altura)."""
+        size = (int(size[0]), int(size[1]))
+        is_pil = isinstance(image, Image.Image)
+        with span("resize"):
+            if self._backend_for(image) == "pillow":
+                out = self._pil_resize(image if is_pil else Image.fromarray(np.asarray(image)), size)
+                if is_pil and dst is None:
+                    return out
+                out = np.asarray(out)
+            else:
+                src = np.asarray(image)
+                shrink = size[0] < src.shape[1] or size[1] < src.shape[0]
+                down, up, _ = _CV2_FILTERS[self.quality]
+                out = cv2.resize(src, size, interpolation=getattr(cv2, down if shrink else up))
+                if is_pil and dst is None:
+                    return Image.fromarray(out)
+            if dst is None:
+                return out
+            # cv2.resize não escreve num recorte (ROI) de outro array; copia para o destino
+            dst[...] = out
+            return dst
+
+    def _pil_resize(self, image, size):
+        down, up, _, gap = _PIL_FILTERS[self.quality]
+        shrink = size[0] < image.width or size[1] < image.height
+        return image.resize(size, Image.Resampling[down if shrink else up], reducing_gap=gap if shrink else None)
+
+    def warp(self, src, M, size, dst=None):
+        """Aplica a homografia `M` (3x3, da origem para o destino) com saída em `size`.
+        Retorna um array, escrito em `dst` quando informado.
+        """
+        size = (int(size[0]), int(size[1]))
+        if self._backend_for(src) == "pillow":
+            image = src if isinstance(src, Image.Image) else Image.fromarray(np.asarray(src))
+            # Image.transform recebe a transformação inversa (do destino para a origem)
+            inverse = np.linalg.inv(np.asarray(M, dtype=np.float64))
+            coefficients = (inverse / inverse[2, 2]).flatten()[:8]
+            resample = Image.Resampling[_PIL_FILTERS[self.quality][2]]
+            out = np.asarray(image.transform(size, Image.Transform.PERSPECTIVE, coefficients, resample))
+            if dst is None:
+                return out
+            dst[...] = out
+            return dst
+        flags = getattr(cv2, _CV2_FILTERS[self.quality][2])
+        return cv2.warpPerspective(np.asarray(src), M, size, dst=dst, flags=flags)
+
+    def __repr__(self):
+        return f"Resampler({self.quality!r}, {self.backend!r})"
+
+
+_resamplers = {}
+
+
+def get_resampler(quality=None, backend=None):
+    """Resampler compartilhado para `quality` (padrão: DEFAULT_QUALITY) e `backend`.
+    `quality` também pode ser um modo de PIPELINE_QUALITY ou um Resampler, retornado
+    como está.
+    """
+    if isinstance(quality, Resampler):
+        return quality
+    quality = PIPELINE_QUALITY.get(quality, quality) or DEFAULT_QUALITY
+    resampler = _resamplers.get((quality, backend))
+    if resampler is None:
+        resampler = _resamplers[(quality, backend)] = Resampler(quality, backend)
+    return resampler
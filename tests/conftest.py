@@ -0,0 +1,42 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import synthetic  # noqa: E402
+
+
+def card_side(width, height, paper, back, seed=0):
+    """Frente (conteúdo de synthetic.render_page) ou verso (linhas e um quadro) de um
+    cartão com a cor de papel `paper`, como array RGB.
+    """
+    rng = np.random.default_rng(seed)
+    if not back:
+        page = synthetic.render_page(width, height, rng)
+        page[(page > 200).all(axis=2)] = paper
+        return page
+    page = np.empty((height, width, 3), np.uint8)
+    page[:] = paper
+    unit = max(1, min(width, height) // 40)
+    for y in range(4 * unit, height - 4 * unit, 3 * unit):
+        cv2.line(page, (3 * unit, y), (width - 3 * unit, y), (40, 40, 40), max(1, unit // 2))
+    cv2.rectangle(page, (width - 12 * unit, height - 10 * unit), (width - 3 * unit, height - 3 * unit), (30, 30, 30), 2)
+    return page
+
+
+@pytest.fixture
+def cards():
+    """Frente e verso de três cartões com cores de papel e proporções diferentes."""
+    specs = [((238, 230, 200), 1.585), ((200, 225, 240), 1.42), ((235, 205, 215), 1.585)]
+    pages = []
+    for n, (paper, aspect) in enumerate(specs):
+        w = 640
+        h = int(w / aspect)
+        pages.append((card_side(w, h, paper, back=False, seed=n), card_side(w, h, paper, back=True, seed=n)))
+    return pages
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import synthetic
+from compositor import ArrayStripSink, StreamingCompositor, compose_pages, compute_layout, open_strip_sink
+from encoder import EncoderSettings, PngStripWriter
+from image_processing import ImageProcessor
+
+
+@pytest.fixture
+def page_file(tmp_path):
+    image, truth = synthetic.make_document(800, 600, seed=4)
+    path = tmp_path / "pagina.png"
+    image.save(path)
+    return str(path), np.asarray(image), truth
+
+
+def test_compute_layout_horizontal_scales_to_first_height():
+    size, cells = compute_layout([(100, 50), (40, 100), (30, 50)], "horizontal")
+    assert cells == [(0, 0, 100, 50), (100, 0, 20, 50), (120, 0, 30, 50)]
+    assert size == (150, 50)
+
+
+def test_compute_layout_vertical_scales_to_first_width():
+    size, cells = compute_layout([(100, 50), (50, 100)], "vertical")
+    assert cells == [(0, 0, 100, 50), (0, 50, 100, 200)]
+    assert size == (100, 250)
+
+
+def test_compute_layout_grid_centers_pages_in_cells():
+    size, cells = compute_layout([(100, 50), (100, 50), (50, 50)], "grid")
+    assert size == (200, 100)
+    assert cells == [(0, 0, 100, 50), (100, 0, 100, 50), (25, 50, 50, 50)]
+    assert compute_layout([(10, 10)] * 3, "grid", columns=3)[0] == (30, 10)
+
+
+def test_compute_layout_pages_and_errors():
+    assert compute_layout([(10, 20), (30, 40)], "pages") == (None, [(0, 0, 10, 20), (0, 0, 30, 40)])
+    with pytest.raises(ValueError):
+        compute_layout([], "horizontal")
+    with pytest.raises(ValueError):
+        compute_layout([(10, 10)], "diagonal")
+
+
+def test_compose_pages_places_each_page():
+    first = np.full((50, 100, 3), 10, np.uint8)
+    second = np.full((100, 40, 3), 200, np.uint8)
+    merged = compose_pages([first, second], "horizontal").array
+    assert merged.shape == (50, 120, 3)
+    assert (merged[:, :100] == 10).all()
+    assert (merged[:, 100:] == 200).all()
+    with pytest.raises(ValueError):
+        compose_pages([first], "pages")
+
+
+def test_streaming_vertical_and_spilled_layouts_match_direct_warp(tmp_path, page_file):
+    path, array, truth = page_file
+    M, (w, h) = ImageProcessor.perspective_matrix(truth)
+    page = ImageProcessor.warp_array(array, M, (w, h))
+
+    vertical = str(tmp_path / "v.png")
+    horizontal = str(tmp_path / "h.png")
+    assert StreamingCompositor("vertical", strip_height=37).compose([path, path], vertical, [truth, truth])[0] == (w, 2 * h)
+    assert StreamingCompositor("horizontal").compose([path, path], horizontal, [truth, truth])[0] == (2 * w, h)
+    with Image.open(vertical) as img:
+        v = np.asarray(img)
+    with Image.open(horizontal) as img:
+        hz = np.asarray(img)
+    for half in (v[h:], hz[:, :w], hz[:, w:]):
+        np.testing.assert_array_equal(half, v[:h])
+    # As homografias em lote diferem das de perspective_matrix só no arredondamento
+    assert np.abs(v[:h].astype(int) - page).max() <= 1
+
+
+def test_spilled_jpeg_is_encoded_from_the_canvas_like_pillow(tmp_path, page_file):
+    path, _, truth = page_file
+    settings = EncoderSettings(quality=85, subsampling="4:4:4")
+    StreamingCompositor("grid", encoder=settings).compose([path] * 3, str(tmp_path / "g.png"), [truth] * 3)
+    StreamingCompositor("grid", encoder=settings).compose([path] * 3, str(tmp_path / "g.jpg"), [truth] * 3)
+    with Image.open(tmp_path / "g.png") as img:
+        img.save(tmp_path / "pillow.jpg", **settings.save_options("jpeg"))
+    assert (tmp_path / "g.jpg").read_bytes() == (tmp_path / "pillow.jpg").read_bytes()
+
+
+def test_open_strip_sink_selects_by_format(tmp_path):
+    cases = [("a.png", EncoderSettings(), PngStripWriter),
+             ("a.jpg", EncoderSettings(), ArrayStripSink),
+             ("a.tif", EncoderSettings(), ArrayStripSink),
+             ("a", EncoderSettings(format="png"), PngStripWriter),
+             ("a.png", EncoderSettings(format="jpeg"), PngStripWriter)]
+    for name, settings, kind in cases:
+        sink = open_strip_sink(str(tmp_path / name), 8, 4, settings)
+        assert isinstance(sink, kind), name
+        sink.write_rows(np.zeros((4, 8, 3), np.uint8))
+        sink.close()
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+import pytest
+
+import synthetic
+from conftest import card_side
+from corner_detection import PROFILES, CornerDetector
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_find_document_corners_on_synthetic_document(seed):
+    image, truth = synthetic.make_document(1200, 900, seed=seed)
+    corners = CornerDetector.find_document_corners(image)
+    assert synthetic.quad_iou(corners, truth) > 0.98
+    assert synthetic.corner_error(corners, truth)[1] < 4
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_gui_profile_detection_finds_synthetic_document(seed):
+    image, truth = synthetic.make_document(1200, 900, seed=seed)
+    corners = CornerDetector.find_document_corners(image, profile=PROFILES["gui"])
+    assert synthetic.quad_iou(corners, truth) > 0.95
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_multiscale_detection_finds_synthetic_document(seed):
+    image, truth = synthetic.make_document(1200, 900, seed=seed)
+    corners, confidence = CornerDetector.detect_with_confidence(image)
+    assert synthetic.quad_iou(corners, truth) > 0.98
+    assert synthetic.corner_error(corners, truth)[1] < 4
+    assert confidence > 0.5
+
+
+def test_detection_without_document_returns_whole_image():
+    image, _ = synthetic.make_document(800, 600, seed=0)
+    blank = image.point(lambda _: 128)
+    corners, confidence = CornerDetector.detect_with_confidence(blank)
+    assert confidence == 0.0
+    assert corners.tolist() == [[0, 0], [799, 0], [799, 599], [0, 599]]
+
+
+def two_card_frame():
+    """Foto com dois cartões lado a lado; o da direita está um pouco mais alto e tem a
+    borda de cima apagada por um reflexo da cor do papel.
+    """
+    photo = np.full((1000, 1600, 3), 50, np.uint8)
+    quads = [np.float32([[140, 300], [700, 270], [720, 640], [160, 660]]),
+             np.float32([[900, 250], [1460, 280], [1440, 630], [880, 610]])]
+    src = np.float32([[0, 0], [639, 0], [639, 403], [0, 403]])
+    for n, quad in enumerate(quads):
+        side = card_side(640, 404, (238, 230, 200), back=bool(n), seed=n)
+        cv2.warpPerspective(side, cv2.getPerspectiveTransform(src, quad), (1600, 1000), dst=photo,
+                            borderMode=cv2.BORDER_TRANSPARENT)
+    yy, xx = np.mgrid[0:1000, 0:1600]
+    glare = np.exp(-((xx - 1180) ** 2 + (yy - 262) ** 2) / (2 * 9.0 ** 2))[..., None]
+    photo[:] = photo * (1 - glare) + np.float32([238, 230, 200]) * glare
+    return photo, quads
+
+
+def test_find_all_document_corners_in_reading_order():
+    photo, quads = two_card_frame()
+    found = CornerDetector.find_all_document_corners(photo)
+    # O cartão da direita, com a borda interrompida, só aparece na busca com as bordas
+    # fechadas; a ordem é a de leitura, não a da altura dos centros
+    assert len(found) == 2
+    for (corners, confidence), truth in zip(found, quads):
+        assert synthetic.quad_iou(corners, truth) > 0.98
+        assert confidence > 0.5
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import synthetic
+import encoder
+from encoder import EncoderSettings, PngStripWriter, save_image
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_png_strip_writer_round_trip(tmp_path, threads):
+    image, _ = synthetic.make_document(333, 517, seed=3)
+    array = np.asarray(image)
+    path = tmp_path / "saida.png"
+    with PngStripWriter(str(path), array.shape[1], array.shape[0], compress_level=3, threads=threads) as writer:
+        writer.write_image(array, strip_height=40)
+    with Image.open(path) as decoded:
+        np.testing.assert_array_equal(np.asarray(decoded.convert("RGB")), array)
+
+
+def test_png_strip_writer_rejects_missing_rows(tmp_path):
+    writer = PngStripWriter(str(tmp_path / "saida.png"), 10, 20)
+    writer.write_rows(np.zeros((5, 10, 3), np.uint8))
+    with pytest.raises(ValueError):
+        writer.close()
+
+
+@pytest.mark.parametrize("max_bytes", [150_000, 300_000])
+def test_max_bytes_fits_with_at_most_two_full_encodes(tmp_path, monkeypatch, max_bytes):
+    image, _ = synthetic.make_document(1600, 1200, seed=1)
+    full_encodes = []
+    original = encoder._encode
+
+    def counting(img, options):
+        data = original(img, options)
+        if img.size == image.size:
+            full_encodes.append(len(data))
+        return data
+
+    monkeypatch.setattr(encoder, "_encode", counting)
+    path = tmp_path / "saida.jpg"
+    quality = save_image(image, str(path), EncoderSettings(max_bytes=max_bytes))
+    assert path.stat().st_size <= max_bytes
+    assert len(full_encodes) <= 2
+    # A qualidade escolhida fica perto da maior que cabe no limite
+    above = original(image, EncoderSettings().save_options("jpeg", quality + 3))
+    assert len(above) > max_bytes
+
+
+def test_max_bytes_rejects_lossless_formats(tmp_path):
+    with pytest.raises(ValueError):
+        EncoderSettings(format="png", max_bytes=100_000)
+    settings = EncoderSettings(max_bytes=100_000)
+    with pytest.raises(ValueError):
+        settings.check_output(str(tmp_path / "saida.png"))
+    settings.check_output(str(tmp_path / "saida.webp"))
@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+import synthetic
+from image_processing import ImageProcessor
+
+
+def test_four_point_transform_flattens_to_quad_size():
+    image, truth = synthetic.make_document(1200, 900, seed=0)
+    page = ImageProcessor.four_point_transform(image, truth)
+    assert page.size == ImageProcessor.warp_size(truth)
+    # As bordas da página corrigida são papel, não o fundo da foto
+    border = np.asarray(page)[3:8, page.width // 4:3 * page.width // 4]
+    assert border.mean() > 180
+
+
+def test_enhance_keeps_size_and_mode():
+    image, _ = synthetic.make_document(640, 480, seed=1)
+    enhanced = ImageProcessor.enhance_image_readability(image)
+    assert enhanced.size == image.size
+    assert enhanced.mode == "RGB"
+
+
+def test_merge_side_by_side_scales_to_first_height():
+    first, _ = synthetic.make_document(400, 300, seed=2)
+    second, _ = synthetic.make_document(200, 100, seed=3)
+    merged = ImageProcessor.merge_side_by_side([first, second])
+    assert merged.size == (400 + 600, 300)
+
+
+def test_banded_enhancement_matches_single_pass():
+    image, _ = synthetic.make_document(900, 700, seed=1)
+    single = np.asarray(ImageProcessor.enhance_image_readability(image))
+    banded = np.asarray(ImageProcessor.enhance_image_readability_banded(image, band_height=64, workers=3))
+    np.testing.assert_array_equal(single, banded)
+
+
+def test_enhance_array_writes_into_destination():
+    image, _ = synthetic.make_document(400, 300, seed=2)
+    src = np.asarray(image)
+    dst = np.zeros_like(src)
+    out = ImageProcessor.enhance_array(src, dst=dst, band_height=50)
+    assert out is dst
+    np.testing.assert_array_equal(dst, np.asarray(ImageProcessor.enhance_image_readability(image)))
+
+
+def test_batch_homographies_match_get_perspective_transform():
+    rng = np.random.default_rng(0)
+    quads = np.stack([synthetic.random_quad(4000, 3000, 1.5, rng) for _ in range(16)])
+    matrices, sizes = ImageProcessor.perspective_matrices_batch(quads)
+    for quad, M, (w, h) in zip(quads, matrices, sizes):
+        rect = ImageProcessor.order_points(quad)
+        assert (w, h) == ImageProcessor.warp_size(quad)
+        dst = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32")
+        expected = cv2.getPerspectiveTransform(rect, dst)
+        np.testing.assert_allclose(M, expected, rtol=1e-6, atol=1e-8)
+
+
+def test_batch_ordering_matches_order_points():
+    rng = np.random.default_rng(1)
+    quads = np.stack([rng.permutation(synthetic.random_quad(800, 600, 1.4, rng)) for _ in range(8)])
+    ordered = ImageProcessor.order_points_batch(quads)
+    for quad, rect in zip(quads, ordered):
+        np.testing.assert_array_equal(rect, ImageProcessor.order_points(quad))
+
+
+def test_degenerate_quad_only_fails_its_own_homography():
+    rng = np.random.default_rng(2)
+    good = np.stack([synthetic.random_quad(4000, 3000, 1.5, rng) for _ in range(3)])
+    collinear = np.array([[0, 0], [100, 100], [200, 200], [300, 300]], dtype="float32")
+    matrices, _ = ImageProcessor.perspective_matrices_batch(np.concatenate([good[:2], collinear[None], good[2:]]))
+    assert np.isnan(matrices[2]).all()
+    expected, _ = ImageProcessor.perspective_matrices_batch(good)
+    np.testing.assert_allclose(matrices[[0, 1, 3]], expected)
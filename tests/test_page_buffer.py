@@ -0,0 +1,32 @@
+import pickle
+
+import numpy as np
+from PIL import Image
+
+import synthetic
+from page_buffer import PageBuffer
+
+
+def test_from_image_is_a_writable_copy():
+    image, _ = synthetic.make_document(120, 90, seed=0)
+    page = PageBuffer.from_image(image)
+    assert page.array.flags.writeable
+    assert page.size == image.size
+    page.array[...] = 0
+    # A imagem de origem não muda
+    assert np.asarray(image).any()
+
+
+def test_from_path_converts_to_rgb(tmp_path):
+    path = tmp_path / "cinza.png"
+    Image.new("L", (30, 20), 128).save(path)
+    page = PageBuffer.from_path(str(path))
+    assert page.shape == (20, 30, 3)
+    assert page.array.flags.writeable
+
+
+def test_pickles_with_its_pixels():
+    page = PageBuffer.empty((8, 6, 3))
+    page.array[...] = 7
+    restored = pickle.loads(pickle.dumps(page))
+    np.testing.assert_array_equal(restored.array, page.array)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import synthetic
+from page_graph import CompositeGraph, PageGraph
+
+FULL = ((0, 0), (1, 0), (1, 1), (0, 1))
+
+
+@pytest.fixture
+def graph():
+    image, _ = synthetic.make_document(400, 300, seed=0)
+    pages = [PageGraph(image, quad=FULL, height=120) for _ in range(2)]
+    return CompositeGraph(pages)
+
+
+def test_second_read_is_memoized(graph):
+    first = graph.image()
+    versions = [node.version for page in graph.pages for node in (page.matrix, page.warp, page.output)]
+    assert graph.image() is first
+    assert [node.version for page in graph.pages for node in (page.matrix, page.warp, page.output)] == versions
+    assert first.shape == (120, 2 * 160, 3)
+
+
+def test_moving_a_corner_only_recomputes_that_page(graph):
+    graph.image()
+    left, right = graph.pages
+    right_page = right.page()
+    versions = (right.matrix.version, right.warp.version, right.output.version)
+    assert left.update(quad=((0.1, 0.1), (0.9, 0), (1, 1), (0, 0.9)))
+    assert not right.update(quad=FULL)
+    after = graph.image()
+    assert (right.matrix.version, right.warp.version, right.output.version) == versions
+    # A página não alterada é reaproveitada no seu novo lugar
+    x, y, w, h = graph.placement.value[1][1]
+    np.testing.assert_array_equal(after[y:y + h, x:x + w], right_page)
+
+
+@pytest.mark.parametrize("quad", [((0.5, 0.5),) * 4,
+                                  ((0, 0.5), (0.3, 0.5), (0.6, 0.5), (1, 0.5)),
+                                  ((0.5, 0), (0.5, 0.3), (0.5, 0.6), (0.5, 1))])
+def test_degenerate_quad_raises_and_recovers(graph, quad):
+    good = graph.image().copy()
+    left = graph.pages[0]
+    left.update(quad=quad)
+    with pytest.raises(ValueError):
+        graph.image()
+    left.update(quad=FULL)
+    np.testing.assert_array_equal(graph.image(), good)
@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+
+from conftest import card_side
+from page_matching import PageSignature, group_pages
+
+
+def signatures(pages):
+    return [PageSignature(page, key=str(i), index=i) for i, page in enumerate(pages)]
+
+
+def test_group_pages_pairs_front_and_back_in_capture_order(cards):
+    pages = [side for card in cards for side in card]
+    documents, duplicates = group_pages(signatures(pages))
+    assert documents == [[0, 1], [2, 3], [4, 5]]
+    assert duplicates == []
+
+
+def test_group_pages_pairs_shuffled_captures(cards):
+    order = [3, 0, 5, 1, 4, 2]
+    pages = [cards[i // 2][i % 2] for i in order]
+    documents, _ = group_pages(signatures(pages))
+    paired = sorted(sorted(order[i] for i in document) for document in documents)
+    assert paired == [[0, 1], [2, 3], [4, 5]]
+
+
+def id_card(number, paper=(238, 230, 200), width=640, aspect=1.585):
+    """Frente e verso de um documento de um mesmo modelo: o verso só muda no número."""
+    height = int(width / aspect)
+    back = card_side(width, height, paper, back=True).copy()
+    cv2.putText(back, f"{number:09d}", (40, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 3)
+    return card_side(width, height, paper, back=False, seed=number % 97), back
+
+
+def test_group_pages_keeps_every_lookalike_document():
+    pages = [side for number in (123456789, 987654321, 555000111, 314159265, 271828182, 161803398)
+             for side in id_card(number)]
+    # Os versos podem ser apontados como possíveis duplicatas, mas nenhum é descartado
+    documents, _ = group_pages(signatures(pages))
+    assert sorted(i for document in documents for i in document) == list(range(len(pages)))
+    # Versos do mesmo modelo parecem o mesmo lado: nunca formam um documento
+    assert not any(len(document) == 2 and all(i % 2 for i in document) for document in documents)
+
+
+def test_group_pages_reports_repeated_photo_without_dropping_it(cards):
+    (front, back), (other_front, other_back) = cards[:2]
+    retake = np.clip(back.astype(np.int16) + 6, 0, 255).astype(np.uint8)
+    pages = [front, back, retake, other_front, other_back]
+    documents, duplicates = group_pages(signatures(pages))
+    assert sorted(i for document in documents for i in document) == list(range(len(pages)))
+    assert duplicates == [(2, 1)]
@@ -0,0 +1,53 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from processing_cache import ProcessingCache
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "pagina.jpg"
+    Image.new("RGB", (64, 48), (200, 180, 160)).save(path)
+    return str(path)
+
+
+def test_cache_round_trip(tmp_path, source):
+    cache = ProcessingCache(str(tmp_path / "cache"))
+    corners = np.array([[1, 2], [30, 2], [30, 40], [1, 40]], dtype="float32")
+    assert cache.get_detection(source, {"a": 1}) is None
+    cache.put_corners(source, {"a": 1}, corners, 0.9)
+    found, confidence = cache.get_detection(source, {"a": 1})
+    np.testing.assert_array_equal(found, corners)
+    assert confidence == 0.9
+    assert cache.get_corners(source, {"a": 2}) is None  # Outros parâmetros, outra entrada
+
+    page = Image.new("RGB", (20, 10), (1, 2, 3))
+    cache.put_page(source, {"h": 10}, page)
+    assert np.array_equal(np.asarray(cache.get_page(source, {"h": 10})), np.asarray(page))
+
+
+def test_cache_is_shared_between_threads_within_its_limit(tmp_path, source):
+    cache = ProcessingCache(str(tmp_path / "cache"), max_bytes=20_000)
+    page = Image.fromarray(np.random.default_rng(0).integers(0, 255, (40, 40, 3), dtype=np.uint8))
+    errors = []
+
+    def work(n):
+        try:
+            for i in range(10):
+                cache.put_page(source, {"thread": n, "i": i}, page)
+                cache.get_page(source, {"thread": n, "i": i})
+        except Exception as e:  # noqa: BLE001 - repassado para a thread do teste
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    total = sum(entry.stat().st_size for sub in os.scandir(cache.directory) for entry in os.scandir(sub.path))
+    assert total <= cache.max_bytes
@@ -0,0 +1,42 @@
+from watch_service import Ledger
+
+
+def test_ledger_resumes_finished_documents(tmp_path):
+    path = tmp_path / "ledger.jsonl"
+    ledger = Ledger(str(path))
+    ledger.record("contrato", "sig1", "done", output="contrato_juntas.jpg")
+    assert ledger.is_done("contrato", "sig1")
+
+    resumed = Ledger(str(path))
+    assert resumed.is_done("contrato", "sig1")
+    assert not resumed.is_done("contrato", "sig2")  # Páginas alteradas: refaz
+    assert not resumed.is_done("outro", "sig1")
+
+
+def test_ledger_ignores_interrupted_last_line(tmp_path):
+    path = tmp_path / "ledger.jsonl"
+    Ledger(str(path)).record("a", "sig", "done")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"document": "b", "signa')
+    resumed = Ledger(str(path))
+    assert resumed.is_done("a", "sig")
+    assert not resumed.is_done("b", "sig")
+
+
+def test_ledger_retries_failed_documents(tmp_path):
+    path = tmp_path / "ledger.jsonl"
+    ledger = Ledger(str(path), max_attempts=2, retry_delay=60)
+    ledger.record("a", "sig", "error", error="arquivo truncado")
+    now = ledger._entries["a"]["time"]
+    assert not ledger.is_done("a", "sig")
+    assert ledger.should_skip("a", "sig", now + 1)  # Espera o intervalo entre tentativas
+    assert not ledger.should_skip("a", "sig", now + 61)
+    assert not ledger.should_skip("a", "sig2", now + 1)  # Páginas alteradas: tenta já
+
+    ledger.record("a", "sig", "error", error="sem memória")
+    resumed = Ledger(str(path), max_attempts=2, retry_delay=60)
+    assert resumed.should_skip("a", "sig", now + 3600)  # Tentativas esgotadas
+
+    resumed.record("a", "sig2", "done")
+    assert resumed.is_done("a", "sig2")
+    assert resumed.should_skip("a", "sig2")
@@ -0,0 +1,487 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+from compositor import compose_pages, detector_params
+from corner_detection import DEFAULT_PROFILE, CornerDetector
+from encoder import FORMATS, EncoderSettings, save_image, save_pages
+from image_processing import ImageProcessor
+from metrics import METRICS, span
+from page_buffer import PageBuffer
+from resampling import get_resampler
+
+# Extensões aceitas, as mesmas do diálogo de abrir imagem da interface
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+
+# Etapas do pipeline, na ordem; as quatro primeiras trabalham com uma página por vez
+STAGES = ("decode", "detect", "warp", "enhance", "merge", "encode")
+
+DEFAULT_WORKERS = {"decode": 2, "detect": 2, "warp": 2, "enhance": 1, "merge": 1, "encode": 1}
+
+# Itens em espera em cada fila; com as filas cheias a etapa anterior bloqueia (backpressure)
+DEFAULT_QUEUE_SIZE = 4
+
+# Agrupamento por nome: "contrato_1.jpg", "contrato-p2.jpg", "contrato_pag3.png"...
+DEFAULT_PATTERN = r"^(?P<doc>.+?)[ _-]*(?:p|pag|page|pagina)?[ _-]*(?P<page>\d+)$"
+
+# Registro dos documentos concluídos, na pasta de saída
+LEDGER_NAME = ".juntar_ledger.jsonl"
+
+# Um documento que falhou é tentado de novo, com as mesmas páginas, até MAX_ATTEMPTS
+# vezes, com pelo menos RETRY_DELAY segundos entre as tentativas (arquivo ainda sendo
+# copiado, falta de memória...). Páginas alteradas recomeçam a contagem
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30.0
+
+
+def scan_inbox(inbox, group="folder", pattern=DEFAULT_PATTERN, exclude=()):
+    """Percorre `inbox` e agrupa as imagens em documentos.
+
+    - group="folder": cada pasta com imagens é um documento, páginas em ordem de nome;
+    - group="pattern": arquivos da mesma pasta cujo nome (sem extensão) casa com
+      `pattern` e tem o mesmo grupo "doc" formam um documento, ordenado pelo grupo "page".
+      Arquivos que não casam com o padrão são ignorados.
+    Retorna {chave: [caminhos das páginas]}, com a chave relativa a `inbox`.
+    """
+    regex = re.compile(pattern, re.IGNORECASE) if group == "pattern" else None
+    exclude = [os.path.abspath(p) for p in exclude]
+    documents = {}
+    for dirpath, dirnames, filenames in os.walk(inbox):
+        dirnames[:] = sorted(d for d in dirnames
+                             if not d.startswith(".") and os.path.abspath(os.path.join(dirpath, d)) not in exclude)
+        images = sorted(f for f in filenames if f.lower().endswith(IMAGE_EXTENSIONS) and not f.startswith("."))
+        if not images:
+            continue
+        rel_dir = os.path.relpath(dirpath, inbox)
+        if regex is None:
+            documents[rel_dir] = [os.path.join(dirpath, f) for f in images]
+            continue
+        grouped = {}
+        for name in images:
+            match = regex.match(os.path.splitext(name)[0])
+            if match:
+                grouped.setdefault(match.group("doc"), []).append((int(match.group("page")), name))
+        for doc, pages in grouped.items():
+            documents[os.path.normpath(os.path.join(rel_dir, doc))] = [os.path.join(dirpath, n) for _, n in sorted(pages)]
+    return documents
+
+
+def document_signature(pages):
+    """Identifica o conteúdo de um documento pelo nome, tamanho e data de cada página:
+    se algum arquivo mudar ou uma página for acrescentada, o documento é refeito.
+    """
+    digest = hashlib.sha1()
+    for path in pages:
+        st = os.stat(path)
+        digest.update(f"{os.path.basename(path)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+class Ledger:
+    """Registro (JSON lines, só acréscimos) dos documentos já processados, lido ao
+    iniciar para que o serviço retome sem refazer o que já terminou.
+    """
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._entries = {}
+        self._failures = {}  # Documento -> (assinatura, tentativas com erro seguidas)
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Linha incompleta de uma gravação interrompida
+                    self._add(entry)
+        except FileNotFoundError:
+            pass
+
+    def _add(self, entry):
+        key = entry["document"]
+        self._entries[key] = entry
+        if entry["status"] == "done":
+            self._failures.pop(key, None)
+            return
+        signature, attempts = self._failures.get(key, (None, 0))
+        self._failures[key] = (entry["signature"], attempts + 1 if signature == entry["signature"] else 1)
+
+    def is_done(self, key, signature):
+        """True se o documento já foi processado com sucesso nesta versão."""
+        entry = self._entries.get(key)
+        return entry is not None and entry["signature"] == signature and entry["status"] == "done"
+
+    def should_skip(self, key, signature, now=None):
+        """True se o documento não deve entrar no pipeline agora: já foi concluído nesta
+        versão, esgotou as tentativas ou falhou há menos de `retry_delay` segundos.
+        """
+        if self.is_done(key, signature):
+            return True
+        entry = self._entries.get(key)
+        if entry is None or entry["signature"] != signature:
+            return False
+        attempts = self._failures.get(key, (None, 0))[1]
+        if attempts >= self.max_attempts:
+            return True
+        return (time.time() if now is None else now) - entry["time"] < self.retry_delay
+
+    def record(self, key, signature, status, output=None, error=None):
+        entry = {"document": key, "signature": signature, "status": status, "output": output,
+                 "error": error, "time": time.time()}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._add(entry)
+
+
+class WatchDocument:
+    """Um documento em andamento no pipeline."""
+
+    def __init__(self, key, pages, signature, output):
+        self.key = key
+        self.pages = pages
+        self.signature = signature
+        self.output = output
+        self.started = time.perf_counter()
+        self.results = [None] * len(pages)
+        self.confidences = [None] * len(pages)
+        self.error = None
+        self._remaining = len(pages)
+        self._lock = threading.Lock()
+
+    def page_finished(self, index, result):
+        """Guarda o resultado de uma página; retorna True quando era a última."""
+        with self._lock:
+            self.results[index] = result
+            self._remaining -= 1
+            return self._remaining == 0
+
+
+class Stage:
+    """Etapa do pipeline: uma fila limitada e as suas threads de trabalho."""
+
+    def __init__(self, name, handler, workers, queue_size):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            start = time.perf_counter()
+            ok = self.handler(item)
+            with self._lock:
+                self.processed += 1
+                self.errors += not ok
+                self.busy_seconds += time.perf_counter() - start
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "queue": self.queue.qsize(), "capacity": self.queue.maxsize,
+                    "processed": self.processed, "errors": self.errors, "busy_s": round(self.busy_seconds, 3)}
+
+
+class WatchService:
+    """Serviço que vigia uma pasta de entrada e junta os documentos que aparecem nela.
+
+    A pasta é consultada a cada `poll_interval` segundos (polling, portável e sem
+    dependências). Cada documento passa pelas etapas decode → detect → warp → enhance →
+    merge → encode; cada etapa tem a sua fila limitada e o seu número de threads
+    (`workers`, por etapa), de modo que uma etapa lenta segura as anteriores em vez de
+    acumular imagens decodificadas em memória. OpenCV e Pillow liberam o GIL nas
+    operações de pixel, então threads bastam para as etapas rodarem em paralelo.
+
+    Um documento só entra no pipeline quando os seus arquivos não mudam há `settle`
+    segundos; ao terminar, é gravado no Ledger da pasta de saída e não é refeito depois
+    de reiniciar o serviço, a menos que as suas páginas mudem.
+    """
+
+    def __init__(self, inbox, output_dir, group="folder", pattern=DEFAULT_PATTERN, layout="horizontal",
+                 columns=None, enhance=False, workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 poll_interval=2.0, settle=2.0, cache=None, encoder=None, profile=DEFAULT_PROFILE,
+                 resampler="watch", on_document=None):
+        self.inbox = os.path.abspath(inbox)
+        self.output_dir = os.path.abspath(output_dir)
+        self.group = group
+        self.pattern = pattern
+        self.layout = layout
+        self.columns = columns
+        self.enhance = enhance
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.cache = cache  # ProcessingCache opcional para os cantos detectados
+        self.encoder = encoder or EncoderSettings()
+        self.profile = profile  # DetectorProfile da detecção dos cantos
+        self.resampler = get_resampler(resampler)  # Qualidade da correção e da junção
+        self.on_document = on_document  # on_document(resultado), chamado na thread da etapa encode
+        self.ledger = Ledger(os.path.join(self.output_dir, LEDGER_NAME))
+
+        workers = {**DEFAULT_WORKERS, **(workers or {})}
+        handlers = {"decode": self._decode, "detect": self._detect, "warp": self._warp,
+                    "enhance": self._enhance, "merge": self._merge, "encode": self._encode}
+        self.stages = {name: Stage(name, handlers[name], max(1, workers[name]), queue_size) for name in STAGES}
+
+        self.documents_done = 0
+        self.documents_failed = 0
+        self.pages_done = 0
+        self._in_flight = {}
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._started = None
+
+    # Ciclo de vida
+
+    def start(self):
+        self._started = time.perf_counter()
+        for stage in self.stages.values():
+            stage.start()
+
+    def stop(self):
+        """Pede o fim da vigilância; seguro em outra thread ou num tratador de sinal."""
+        self._stop.set()
+
+    def _shutdown(self):
+        """Termina os documentos já em andamento: as etapas param em ordem e cada uma
+        esvazia a sua fila antes de parar. Se o processo for encerrado antes disso, os
+        documentos inacabados não estão no Ledger e são refeitos na próxima execução.
+        """
+        self._stop.set()
+        for name in STAGES:
+            self.stages[name].stop()
+
+    def run(self, once=False, on_status=None, status_interval=10.0):
+        """Vigia a pasta até stop() (ou Ctrl+C). Com `once`, processa o que já está na
+        pasta, sem esperar a estabilização dos arquivos, e retorna ao terminar.
+        `on_status(stats)` é chamado a cada `status_interval` segundos.
+        """
+        self.start()
+        try:
+            if once:
+                self.scan(require_stable=False)
+                self.wait_idle()
+                return
+            next_status = time.monotonic() + status_interval
+            while not self._stop.is_set():
+                self.scan()
+                if on_status and time.monotonic() >= next_status:
+                    on_status(self.stats())
+                    next_status = time.monotonic() + status_interval
+                self._stop.wait(self.poll_interval)
+        finally:
+            self._shutdown()
+
+    def wait_idle(self, timeout=None):
+        """Espera até não haver documentos em andamento."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._in_flight, timeout)
+
+    def stats(self):
+        """Vazão, documentos em andamento e profundidade das filas de cada etapa."""
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        with self._lock:
+            stats = {
+                "uptime_s": round(elapsed, 3),
+                "documents_done": self.documents_done,
+                "documents_failed": self.documents_failed,
+                "pages_done": self.pages_done,
+                "in_flight": len(self._in_flight),
+            }
+        stats["pages_per_s"] = round(stats["pages_done"] / elapsed, 3) if elapsed > 0 else 0.0
+        stats["stages"] = {name: stage.stats() for name, stage in self.stages.items()}
+        return stats
+
+    # Descoberta dos documentos
+
+    def scan(self, require_stable=True):
+        """Consulta a pasta e coloca no pipeline os documentos novos ou alterados.
+        Retorna quantos documentos entraram.
+        """
+        found = scan_inbox(self.inbox, self.group, self.pattern, exclude=[self.output_dir])
+        now = time.time()
+        submitted = 0
+        for key, pages in found.items():
+            if self._stop.is_set():
+                break
+            try:
+                signature = document_signature(pages)
+                newest = max(os.stat(p).st_mtime for p in pages)
+            except FileNotFoundError:
+                continue  # Arquivo removido durante a varredura
+            if require_stable:
+                # Espera a cópia terminar: mesma assinatura da varredura anterior e nenhuma
+                # alteração recente
+                previous = self._last_seen.get(key)
+                self._last_seen[key] = signature
+                if previous != signature or now - newest < self.settle:
+                    continue
+            with self._lock:
+                if key in self._in_flight or self.ledger.should_skip(key, signature, now):
+                    continue
+                document = WatchDocument(key, pages, signature, self._output_path(key, pages))
+                self._in_flight[key] = document
+            for index, path in enumerate(pages):
+                # Bloqueia enquanto a fila de decodificação estiver cheia
+                self.stages["decode"].queue.put((document, index, path))
+            submitted += 1
+        return submitted
+
+    def _output_path(self, key, pages):
+        """<saída>/<pasta relativa>/<nome>_juntas.<ext>; no agrupamento por pasta, o nome é
+        o da primeira página, como na interface. A extensão é a do formato de saída.
+        """
+        suffix = "_juntas" + FORMATS[self.encoder.format or "jpeg"]
+        if self.group == "folder":
+            name = os.path.splitext(os.path.basename(pages[0]))[0]
+            return os.path.join(self.output_dir, key, name + suffix)
+        return os.path.join(self.output_dir, key + suffix)
+
+    # Etapas. Cada uma retorna False se o item falhou.
+
+    def _page_step(self, item, next_stage, fn):
+        document, index, data = item
+        if document.error is None:
+            try:
+                data = fn(document, index, data)
+            except Exception as e:
+                document.error = f"{os.path.basename(document.pages[index])}: {e}"
+        if next_stage is None:
+            if document.page_finished(index, data if document.error is None else None):
+                if document.error is None:
+                    self.stages["merge"].queue.put(document)
+                else:
+                    self._finish(document)
+        else:
+            self.stages[next_stage].queue.put((document, index, data))
+        return document.error is None
+
+    def _decode(self, item):
+        def decode(document, index, path):
+            with span("decode"):
+                return PageBuffer.from_path(path)
+        return self._page_step(item, "detect", decode)
+
+    def _detect(self, item):
+        def detect(document, index, page):
+            path = document.pages[index]
+            params = detector_params(self.profile)
+            detection = self.cache.get_detection(path, params) if self.cache is not None else None
+            if detection is None:
+                detection = CornerDetector.detect_with_confidence(page.array, profile=self.profile)
+                if self.cache is not None:
+                    try:
+                        self.cache.put_corners(path, params, *detection)
+                    except OSError:
+                        pass  # O cache é só uma otimização
+            corners, document.confidences[index] = detection
+            return page, corners
+        return self._page_step(item, "warp", detect)
+
+    def _warp(self, item):
+        def warp(document, index, data):
+            page, corners = data
+            M, (w, h) = ImageProcessor.perspective_matrix(corners, 0, page.size)
+            warped = PageBuffer.empty((h, w, 3))
+            ImageProcessor.warp_array(page.array, M, (w, h), dst=warped.array, resampler=self.resampler)
+            return warped
+        return self._page_step(item, "enhance", warp)
+
+    def _enhance(self, item):
+        def enhance(document, index, page):
+            if not self.enhance:
+                return page
+            enhanced = PageBuffer.empty(page.shape)
+            ImageProcessor.enhance_array(page.array, dst=enhanced.array)
+            return enhanced
+        return self._page_step(item, None, enhance)
+
+    def _merge(self, document):
+        try:
+            if self.layout == "pages":
+                merged = document.results  # Cada página vai para o arquivo como está
+            else:
+                merged = compose_pages(document.results, self.layout, self.columns, self.resampler)
+        except Exception as e:
+            document.error = str(e)
+            self._finish(document)
+            return False
+        document.results = None  # Libera as páginas enquanto o documento espera a gravação
+        self.stages["encode"].queue.put((document, merged))
+        return True
+
+    def _encode(self, item):
+        document, merged = item
+        try:
+            os.makedirs(os.path.dirname(document.output), exist_ok=True)
+            # Grava num temporário e renomeia, para nunca deixar uma saída pela metade
+            root, ext = os.path.splitext(document.output)
+            tmp = f"{root}.tmp{os.getpid()}{ext}"
+            # Só aqui as páginas viram imagens PIL, para o codificador
+            if isinstance(merged, list):
+                save_pages([page.to_image() for page in merged], tmp, self.encoder)
+            else:
+                save_image(merged.to_image(), tmp, self.encoder)
+            os.replace(tmp, document.output)
+        except Exception as e:
+            document.error = str(e)
+        self._finish(document)
+        return document.error is None
+
+    def _finish(self, document):
+        status = "done" if document.error is None else "error"
+        self.ledger.record(document.key, document.signature, status,
+                           document.output if document.error is None else None, document.error)
+        result = {
+            "document": document.key,
+            "status": status,
+            "output": document.output,
+            "pages": len(document.pages),
+            "document_pages": document.pages,
+            "seconds": time.perf_counter() - document.started,
+            "confidences": document.confidences,
+            "error": document.error,
+        }
+        METRICS.count("documents_done" if document.error is None else "documents_failed")
+        with self._idle:
+            del self._in_flight[document.key]
+            if document.error is None:
+                self.documents_done += 1
+                self.pages_done += len(document.pages)
+            else:
+                self.documents_failed += 1
+            self._idle.notify_all()
+        if self.on_document:
+            self.on_document(result)